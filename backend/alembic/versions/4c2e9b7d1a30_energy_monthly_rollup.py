@@ -0,0 +1,48 @@
+"""Energy monthly rollup
+
+Revision ID: 4c2e9b7d1a30
+Revises: 908939d6f8a7
+Create Date: 2025-05-06 10:41:12.214870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c2e9b7d1a30'
+down_revision: Union[str, None] = '908939d6f8a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'energy_monthly_rollup',
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('kwh', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('track_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint('type_id', 'source_id', 'month'),
+    )
+    # Backfill from the existing tracks
+    op.execute(
+        """
+        INSERT INTO energy_monthly_rollup (type_id, source_id, month, kwh, track_count)
+        SELECT type_id, source_id, month, SUM(kwh), COUNT(id)
+        FROM energy_tracks
+        GROUP BY type_id, source_id, month
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('energy_monthly_rollup')
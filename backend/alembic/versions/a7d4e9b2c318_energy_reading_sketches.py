@@ -0,0 +1,48 @@
+"""Energy reading sketches
+
+Revision ID: a7d4e9b2c318
+Revises: f1a8c3d6e920
+Create Date: 2025-06-09 10:41:05.207114
+
+Adds ``energy_reading_sketches``, the quantile sketches behind
+/energy/percentiles. Sketches are built in Python, so the table starts empty:
+run ``python scripts/sketches.py backfill`` after upgrading, before the API
+takes writes again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e9b2c318'
+down_revision: Union[str, None] = 'f1a8c3d6e920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'energy_reading_sketches',
+        sa.Column('site_id', sa.Integer(), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('sketch', sa.LargeBinary(), nullable=False),
+        sa.Column('peak_kwh', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('peak_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['site_id'], ['sites.id'], ),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint('site_id', 'type_id', 'source_id', 'year', 'month'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('energy_reading_sketches')
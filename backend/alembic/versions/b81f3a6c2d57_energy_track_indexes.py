@@ -0,0 +1,47 @@
+"""Energy track covering index and unique lookup name indexes
+
+Revision ID: b81f3a6c2d57
+Revises: 4c2e9b7d1a30
+Create Date: 2025-05-09 16:03:47.581204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81f3a6c2d57'
+down_revision: Union[str, None] = '4c2e9b7d1a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_energy_tracks_type_source_month',
+        'energy_tracks',
+        ['type_id', 'source_id', 'month'],
+        unique=False,
+        postgresql_include=['kwh'],
+    )
+
+    # Replace the implicit unique constraints on the lookup names with named
+    # unique indexes, which is what the models declare.
+    op.create_index(op.f('ix_energy_sources_name'), 'energy_sources', ['name'], unique=True)
+    op.create_index(op.f('ix_energy_types_name'), 'energy_types', ['name'], unique=True)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE energy_sources DROP CONSTRAINT IF EXISTS energy_sources_name_key')
+        op.execute('ALTER TABLE energy_types DROP CONSTRAINT IF EXISTS energy_types_name_key')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_unique_constraint('energy_types_name_key', 'energy_types', ['name'])
+        op.create_unique_constraint('energy_sources_name_key', 'energy_sources', ['name'])
+    op.drop_index(op.f('ix_energy_types_name'), table_name='energy_types')
+    op.drop_index(op.f('ix_energy_sources_name'), table_name='energy_sources')
+    op.drop_index('ix_energy_tracks_type_source_month', table_name='energy_tracks')
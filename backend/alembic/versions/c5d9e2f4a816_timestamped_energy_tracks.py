@@ -0,0 +1,260 @@
+"""Timestamped energy tracks, monthly partitions on Postgres, yearly rollup
+
+Revision ID: c5d9e2f4a816
+Revises: b81f3a6c2d57
+Create Date: 2025-05-14 09:12:30.448102
+
+Replaces ``energy_tracks.month`` with a ``[start_time, end_time)`` interval and
+adds ``meter_id``. Existing month-only rows are backfilled as the whole month
+in the year they were recorded (``created_at``, or the current year when it is
+missing). On Postgres the new table is partitioned by ``RANGE (start_time)``
+with one partition per month plus a default partition, and gets a BRIN index
+on ``start_time``. ``energy_monthly_rollup`` gains a ``year`` key column and
+is rebuilt from the backfilled tracks.
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d9e2f4a816'
+down_revision: Union[str, None] = 'b81f3a6c2d57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10_000
+
+tracks = sa.table(
+    'energy_tracks',
+    sa.column('id', sa.BigInteger()),
+    sa.column('source_id', sa.Integer()),
+    sa.column('type_id', sa.Integer()),
+    sa.column('meter_id', sa.String()),
+    sa.column('start_time', sa.TIMESTAMP()),
+    sa.column('end_time', sa.TIMESTAMP()),
+    sa.column('month', sa.Integer()),
+    sa.column('kwh', sa.Numeric(10, 2)),
+    sa.column('created_at', sa.TIMESTAMP()),
+)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def _create_rollup(with_year: bool) -> None:
+    key = ['type_id', 'source_id'] + (['year'] if with_year else []) + ['month']
+    op.create_table(
+        'energy_monthly_rollup',
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        *([sa.Column('year', sa.Integer(), nullable=False)] if with_year else []),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('kwh', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('track_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint(*key),
+    )
+
+
+def _backfill_rollup(with_year: bool) -> None:
+    rollup = sa.table(
+        'energy_monthly_rollup',
+        *[sa.column(c) for c in ('type_id', 'source_id', 'year', 'month', 'kwh', 'track_count')],
+    )
+    if with_year:
+        period = [
+            sa.cast(sa.extract('year', tracks.c.start_time), sa.Integer),
+            sa.cast(sa.extract('month', tracks.c.start_time), sa.Integer),
+        ]
+        columns = ['type_id', 'source_id', 'year', 'month', 'kwh', 'track_count']
+    else:
+        period = [tracks.c.month]
+        columns = ['type_id', 'source_id', 'month', 'kwh', 'track_count']
+
+    op.execute(rollup.insert().from_select(
+        columns,
+        sa.select(
+            tracks.c.type_id,
+            tracks.c.source_id,
+            *period,
+            sa.func.sum(tracks.c.kwh),
+            sa.func.count(tracks.c.id),
+        ).group_by(tracks.c.type_id, tracks.c.source_id, *period),
+    ))
+
+
+def _create_track_indexes() -> None:
+    op.create_index(op.f('ix_energy_tracks_id'), 'energy_tracks', ['id'], unique=False)
+    op.create_index(
+        'ix_energy_tracks_type_source_start',
+        'energy_tracks',
+        ['type_id', 'source_id', 'start_time'],
+        unique=False,
+        postgresql_include=['kwh'],
+    )
+    op.create_index('ix_energy_tracks_start_time', 'energy_tracks', ['start_time'], postgresql_using='brin')
+
+
+def _upgrade_postgresql() -> None:
+    bind = op.get_bind()
+    op.drop_index('ix_energy_tracks_type_source_month', table_name='energy_tracks')
+    op.drop_index(op.f('ix_energy_tracks_id'), table_name='energy_tracks')
+    op.execute('ALTER TABLE energy_tracks RENAME TO energy_tracks_month_only')
+    op.execute('ALTER TABLE energy_tracks_month_only RENAME CONSTRAINT energy_tracks_pkey TO energy_tracks_month_only_pkey')
+    op.execute('ALTER SEQUENCE energy_tracks_id_seq RENAME TO energy_tracks_month_only_id_seq')
+
+    # The partition key has to be part of the primary key
+    op.execute(
+        """
+        CREATE TABLE energy_tracks (
+            id BIGSERIAL NOT NULL,
+            source_id INTEGER NOT NULL REFERENCES energy_sources (id),
+            type_id INTEGER NOT NULL REFERENCES energy_types (id),
+            meter_id VARCHAR,
+            start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            end_time TIMESTAMP WITHOUT TIME ZONE,
+            kwh NUMERIC(10, 2) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+        """
+    )
+    op.execute('CREATE TABLE energy_tracks_default PARTITION OF energy_tracks DEFAULT')
+
+    start = (
+        "make_timestamp(EXTRACT(YEAR FROM COALESCE(created_at, now()))::int, month, 1, 0, 0, 0)"
+    )
+    for (month,) in bind.execute(sa.text(f"SELECT DISTINCT {start} FROM energy_tracks_month_only")):
+        op.execute(
+            f"CREATE TABLE energy_tracks_{month:%Y_%m} PARTITION OF energy_tracks "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+        )
+
+    op.execute(
+        f"""
+        INSERT INTO energy_tracks (id, source_id, type_id, start_time, end_time, kwh, created_at)
+        SELECT id, source_id, type_id, {start}, {start} + INTERVAL '1 month', kwh, created_at
+        FROM energy_tracks_month_only
+        """
+    )
+    op.execute(
+        "SELECT setval('energy_tracks_id_seq', COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM energy_tracks"
+    )
+    op.drop_table('energy_tracks_month_only')
+
+
+def _upgrade_generic() -> None:
+    bind = op.get_bind()
+    op.drop_index('ix_energy_tracks_type_source_month', table_name='energy_tracks')
+    op.drop_index(op.f('ix_energy_tracks_id'), table_name='energy_tracks')
+    op.rename_table('energy_tracks', 'energy_tracks_month_only')
+    op.create_table(
+        'energy_tracks',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('meter_id', sa.String(), nullable=True),
+        sa.Column('start_time', sa.TIMESTAMP(), nullable=False),
+        sa.Column('end_time', sa.TIMESTAMP(), nullable=True),
+        sa.Column('kwh', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    # Computed in Python so the timestamps are stored in the driver's own format
+    legacy = sa.table('energy_tracks_month_only', *[sa.column(c.name) for c in tracks.c])
+    current_year = datetime.now().year
+    result = bind.execute(sa.select(
+        legacy.c.id, legacy.c.source_id, legacy.c.type_id, legacy.c.month, legacy.c.kwh, legacy.c.created_at,
+    ))
+    while True:
+        batch = result.fetchmany(BATCH_SIZE)
+        if not batch:
+            break
+        rows = []
+        for id_, source_id, type_id, month, kwh, created_at in batch:
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at)
+            start = datetime(created_at.year if created_at else current_year, month, 1)
+            rows.append({
+                'id': id_, 'source_id': source_id, 'type_id': type_id, 'start_time': start,
+                'end_time': _next_month(start), 'kwh': kwh, 'created_at': created_at,
+            })
+        bind.execute(tracks.insert(), rows)
+    op.drop_table('energy_tracks_month_only')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        _upgrade_postgresql()
+    else:
+        _upgrade_generic()
+    _create_track_indexes()
+
+    op.drop_table('energy_monthly_rollup')
+    _create_rollup(with_year=True)
+    _backfill_rollup(with_year=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_energy_tracks_start_time', table_name='energy_tracks')
+    op.drop_index('ix_energy_tracks_type_source_start', table_name='energy_tracks')
+    op.drop_index(op.f('ix_energy_tracks_id'), table_name='energy_tracks')
+    op.rename_table('energy_tracks', 'energy_tracks_timestamped')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER SEQUENCE energy_tracks_id_seq RENAME TO energy_tracks_timestamped_id_seq')
+        op.execute('ALTER TABLE energy_tracks_timestamped RENAME CONSTRAINT energy_tracks_pkey TO energy_tracks_timestamped_pkey')
+
+    op.create_table(
+        'energy_tracks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('kwh', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Years are dropped: every reading collapses into its month of the year
+    timestamped = sa.table('energy_tracks_timestamped', *[sa.column(c.name) for c in tracks.c])
+    op.execute(tracks.insert().from_select(
+        ['id', 'source_id', 'type_id', 'month', 'kwh', 'created_at'],
+        sa.select(
+            timestamped.c.id,
+            timestamped.c.source_id,
+            timestamped.c.type_id,
+            sa.cast(sa.extract('month', timestamped.c.start_time), sa.Integer),
+            timestamped.c.kwh,
+            timestamped.c.created_at,
+        ),
+    ))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "SELECT setval('energy_tracks_id_seq', COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM energy_tracks"
+        )
+    # Drops the Postgres partitions with it
+    op.drop_table('energy_tracks_timestamped')
+    op.create_index(op.f('ix_energy_tracks_id'), 'energy_tracks', ['id'], unique=False)
+    op.create_index(
+        'ix_energy_tracks_type_source_month',
+        'energy_tracks',
+        ['type_id', 'source_id', 'month'],
+        unique=False,
+        postgresql_include=['kwh'],
+    )
+
+    op.drop_table('energy_monthly_rollup')
+    _create_rollup(with_year=False)
+    _backfill_rollup(with_year=False)
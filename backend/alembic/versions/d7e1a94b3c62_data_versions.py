@@ -0,0 +1,36 @@
+"""Data version counters
+
+Revision ID: d7e1a94b3c62
+Revises: c5d9e2f4a816
+Create Date: 2025-05-19 15:27:04.903517
+
+Seeds the ``energy_tracks`` counter, so every write is a single-row UPDATE.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e1a94b3c62'
+down_revision: Union[str, None] = 'c5d9e2f4a816'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    versions = op.create_table(
+        'data_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.bulk_insert(versions, [{'name': 'energy_tracks', 'version': 1}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('data_versions')
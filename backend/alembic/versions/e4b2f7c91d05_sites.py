@@ -0,0 +1,133 @@
+"""Sites owning energy tracks, user grants, site-leading keys
+
+Revision ID: e4b2f7c91d05
+Revises: d7e1a94b3c62
+Create Date: 2025-05-26 11:08:51.730264
+
+Adds ``sites`` and ``user_sites`` and a ``site_id`` on ``energy_tracks``.
+Existing tracks are assigned to a ``default`` site that every existing user
+is granted, so nothing disappears from their dashboards. The covering index
+and the rollup key now lead with ``site_id``; the rollup is rebuilt.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b2f7c91d05'
+down_revision: Union[str, None] = 'd7e1a94b3c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DEFAULT_SITE = 'default'
+
+sites = sa.table('sites', sa.column('id', sa.Integer()), sa.column('name', sa.String()))
+users = sa.table('users', sa.column('id', sa.Integer()))
+user_sites = sa.table('user_sites', sa.column('user_id', sa.Integer()), sa.column('site_id', sa.Integer()))
+tracks = sa.table(
+    'energy_tracks',
+    *[sa.column(c) for c in ('id', 'site_id', 'type_id', 'source_id', 'start_time', 'kwh')],
+)
+
+
+def _create_rollup(with_site: bool) -> None:
+    key = (['site_id'] if with_site else []) + ['type_id', 'source_id', 'year', 'month']
+    op.create_table(
+        'energy_monthly_rollup',
+        *([sa.Column('site_id', sa.Integer(), nullable=False)] if with_site else []),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('kwh', sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column('track_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        *([sa.ForeignKeyConstraint(['site_id'], ['sites.id'], )] if with_site else []),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint(*key),
+    )
+
+    group = ([tracks.c.site_id] if with_site else []) + [tracks.c.type_id, tracks.c.source_id]
+    period = [
+        sa.cast(sa.extract('year', tracks.c.start_time), sa.Integer),
+        sa.cast(sa.extract('month', tracks.c.start_time), sa.Integer),
+    ]
+    rollup = sa.table('energy_monthly_rollup', *[sa.column(c) for c in key + ['kwh', 'track_count']])
+    op.execute(rollup.insert().from_select(
+        key + ['kwh', 'track_count'],
+        sa.select(*group, *period, sa.func.sum(tracks.c.kwh), sa.func.count(tracks.c.id)).group_by(*group, *period),
+    ))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sites',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_sites_id'), 'sites', ['id'], unique=False)
+    op.create_index(op.f('ix_sites_name'), 'sites', ['name'], unique=True)
+    op.create_table(
+        'user_sites',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('site_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['site_id'], ['sites.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'site_id'),
+    )
+    op.create_index(op.f('ix_user_sites_site_id'), 'user_sites', ['site_id'], unique=False)
+
+    bind = op.get_bind()
+    bind.execute(sites.insert().values(name=DEFAULT_SITE))
+    site_id = bind.execute(sa.select(sites.c.id).where(sites.c.name == DEFAULT_SITE)).scalar_one()
+    op.execute(user_sites.insert().from_select(['user_id', 'site_id'], sa.select(users.c.id, sa.literal(site_id))))
+
+    # A constant default fills the existing rows without rewriting them on Postgres
+    with op.batch_alter_table('energy_tracks') as batch:
+        batch.add_column(sa.Column('site_id', sa.Integer(), server_default=str(site_id), nullable=False))
+        batch.create_foreign_key('fk_energy_tracks_site_id', 'sites', ['site_id'], ['id'])
+    with op.batch_alter_table('energy_tracks') as batch:
+        batch.alter_column('site_id', server_default=None)
+
+    op.drop_index('ix_energy_tracks_type_source_start', table_name='energy_tracks')
+    op.create_index(
+        'ix_energy_tracks_site_type_source_start',
+        'energy_tracks',
+        ['site_id', 'type_id', 'source_id', 'start_time'],
+        unique=False,
+        postgresql_include=['kwh'],
+    )
+
+    op.drop_table('energy_monthly_rollup')
+    _create_rollup(with_site=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Every site's tracks are kept and merged into one dataset
+    op.drop_table('energy_monthly_rollup')
+    op.drop_index('ix_energy_tracks_site_type_source_start', table_name='energy_tracks')
+    op.create_index(
+        'ix_energy_tracks_type_source_start',
+        'energy_tracks',
+        ['type_id', 'source_id', 'start_time'],
+        unique=False,
+        postgresql_include=['kwh'],
+    )
+    with op.batch_alter_table('energy_tracks') as batch:
+        batch.drop_constraint('fk_energy_tracks_site_id', type_='foreignkey')
+        batch.drop_column('site_id')
+    _create_rollup(with_site=False)
+
+    op.execute("DELETE FROM data_versions WHERE name LIKE 'energy_tracks@%'")
+    op.drop_index(op.f('ix_user_sites_site_id'), table_name='user_sites')
+    op.drop_table('user_sites')
+    op.drop_index(op.f('ix_sites_name'), table_name='sites')
+    op.drop_index(op.f('ix_sites_id'), table_name='sites')
+    op.drop_table('sites')
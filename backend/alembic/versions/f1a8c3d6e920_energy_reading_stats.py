@@ -0,0 +1,70 @@
+"""Energy reading stats
+
+Revision ID: f1a8c3d6e920
+Revises: e4b2f7c91d05
+Create Date: 2025-06-02 09:14:27.518306
+
+Adds ``energy_reading_stats``, the online statistics behind /energy/anomalies.
+The count, mean and M2 are computed from the existing tracks here. The EWMA
+depends on the order of the readings, so it starts at the mean.
+``python scripts/anomalies.py backfill`` recomputes every column in time
+order.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a8c3d6e920'
+down_revision: Union[str, None] = 'e4b2f7c91d05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'energy_reading_stats',
+        sa.Column('site_id', sa.Integer(), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('mean', sa.Float(), nullable=False),
+        sa.Column('m2', sa.Float(), nullable=False),
+        sa.Column('ewma', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['site_id'], ['sites.id'], ),
+        sa.ForeignKeyConstraint(['source_id'], ['energy_sources.id'], ),
+        sa.ForeignKeyConstraint(['type_id'], ['energy_types.id'], ),
+        sa.PrimaryKeyConstraint('site_id', 'type_id', 'source_id', 'month'),
+    )
+    tracks = sa.table(
+        'energy_tracks', *[sa.column(c) for c in ('id', 'site_id', 'type_id', 'source_id', 'start_time', 'kwh')],
+    )
+    month = sa.cast(sa.extract('month', tracks.c.start_time), sa.Integer)
+    readings = sa.select(
+        tracks.c.site_id, tracks.c.type_id, tracks.c.source_id, month.label('month'),
+        sa.func.count(tracks.c.id).label('n'),
+        sa.cast(sa.func.avg(tracks.c.kwh), sa.Float).label('mean'),
+        sa.cast(sa.func.sum(tracks.c.kwh * tracks.c.kwh), sa.Float).label('sq'),
+    ).group_by(tracks.c.site_id, tracks.c.type_id, tracks.c.source_id, month).subquery()
+    # M2 = Σx² − n·mean², clamped at zero against rounding
+    m2 = readings.c.sq - readings.c.n * readings.c.mean * readings.c.mean
+    stats = sa.table('energy_reading_stats', *[sa.column(c) for c in (
+        'site_id', 'type_id', 'source_id', 'month', 'count', 'mean', 'm2', 'ewma',
+    )])
+    op.execute(stats.insert().from_select(
+        ['site_id', 'type_id', 'source_id', 'month', 'count', 'mean', 'm2', 'ewma'],
+        sa.select(
+            readings.c.site_id, readings.c.type_id, readings.c.source_id, readings.c.month, readings.c.n,
+            readings.c.mean, sa.case((m2 > 0, m2), else_=0.0), readings.c.mean,
+        ),
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('energy_reading_stats')
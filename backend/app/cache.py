@@ -0,0 +1,429 @@
+"""Response cache for the /energy analytics routes.
+
+Entries are keyed on ``(endpoint, scope, energy_type, highlight, window)``,
+where the scope lists the sites a request reads together with their data
+versions; the cube the views are derived from is cached under
+``("cube", scope, None, None, window)``. Its :data:`SESSION_LISTENERS`,
+registered by :func:`app.listeners.register`, bump a row of ``data_versions`` inside
+every writing transaction, and that invalidate the cache when it commits:
+
+- track writes bump ``energy_tracks`` and ``energy_tracks@<site id>`` for
+  each site they touch. Only the cached versions of those sites are dropped:
+  their next requests build new keys, and other sites keep their entries.
+  Bulk updates and deletes, whose sites aren't known, bump
+  ``energy_tracks@all``, which every scope includes, and clear everything,
+- source, type and site writes bump ``energy_dimensions``, grants bump
+  ``user_sites``; both clear everything.
+
+The versions are what the /energy ETags and the dimension registry are keyed
+on, so they are shared by every process that writes through SQLAlchemy, and
+they roll back with the write.
+
+The backend is chosen by ``ENERGY_CACHE_URL``:
+
+- ``memory://`` (default): in-process LRU with a TTL, one per worker.
+- ``redis://host:port/db``: shared by every worker and by the seed/ingest
+  scripts, so a write in one process invalidates all of them. Needs the
+  ``redis`` package.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from itertools import chain
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set
+
+from sqlalchemy import func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import DataVersion, EnergySource, EnergyTrack, EnergyType, Site, UserSite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 60
+DEFAULT_MAXSIZE = 1024
+
+_MISSING = object()
+
+
+def call_off_loop(fn: Callable, *args) -> None:
+    """Call blocking ``fn`` now, or in a worker thread when called on the event loop.
+
+    For session listeners, which can't await: an async session's
+    ``after_commit`` runs on the loop. Errors in the thread are logged.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        fn(*args)
+        return
+
+    def done(future):
+        if future.exception() is not None:
+            logger.error("%s failed", getattr(fn, "__qualname__", fn), exc_info=future.exception())
+
+    loop.run_in_executor(None, fn, *args).add_done_callback(done)
+
+
+class CacheBackend(ABC):
+    """Minimal interface every cache backend implements.
+
+    The ``a``-prefixed methods are for async code. They call the sync ones
+    directly, which is right for in-process backends; backends doing network
+    I/O override them so the event loop isn't blocked.
+    """
+
+    # Whether the backend does I/O, so listeners don't call it on the loop
+    remote = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: Hashable) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        self.set(key, value)
+        return value
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any) -> None:
+        self.set(key, value)
+
+    async def aget_or_set(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Like :meth:`get_or_set` for an async ``compute``."""
+        value = await self.aget(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = await compute()
+        await self.aset(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class InMemoryCache(CacheBackend):
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store ``value``; ``ttl`` overrides the cache-wide lifetime for this entry."""
+        with self._lock:
+            self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """Cache shared between processes through Redis.
+
+    Keys are namespaced with a generation number stored in Redis; ``clear``
+    bumps the generation, which invalidates every worker's entries at once.
+    Eviction is left to Redis (configure ``maxmemory-policy allkeys-lru``), so
+    ``evictions`` is not tracked here. The client is redis-py's blocking one,
+    which scripts use directly; async callers go through worker threads.
+    """
+
+    remote = True
+
+    def __init__(self, client, ttl: float = DEFAULT_TTL_SECONDS, prefix: str = "energy-cache"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisCache":
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _generation(self) -> int:
+        return int(self.client.get(f"{self.prefix}:generation") or 0)
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}:{self._generation()}:{key!r}"
+
+    def get(self, key, default=None):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value), ex=max(1, int(self.ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            generation = self._generation()
+            self.client.delete(*(f"{self.prefix}:{generation}:{key!r}" for key in keys))
+
+    def clear(self):
+        self.client.incr(f"{self.prefix}:generation")
+
+    async def aget(self, key, default=None):
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+
+def create_cache(url: Optional[str] = None) -> CacheBackend:
+    url = url or os.getenv("ENERGY_CACHE_URL", "memory://")
+    ttl = float(os.getenv("ENERGY_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    if url.startswith("memory://"):
+        return InMemoryCache(maxsize=int(os.getenv("ENERGY_CACHE_MAXSIZE", DEFAULT_MAXSIZE)), ttl=ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache.from_url(url, ttl=ttl)
+    raise ValueError(f"Unsupported ENERGY_CACHE_URL: {url}")
+
+
+energy_cache: CacheBackend = create_cache()
+
+
+# ------------------ Data version ------------------ #
+
+TRACKS_VERSION = EnergyTrack.__tablename__
+DIMENSIONS_VERSION = "energy_dimensions"
+ACCESS_VERSION = UserSite.__tablename__
+# Bumped by track writes whose sites aren't known
+ALL_SITES_VERSION = f"{TRACKS_VERSION}@all"
+
+# The data version each model's writes bump; tracks bump their sites' versions
+_VERSIONED = {
+    EnergySource: DIMENSIONS_VERSION,
+    EnergyType: DIMENSIONS_VERSION,
+    Site: DIMENSIONS_VERSION,
+    UserSite: ACCESS_VERSION,
+}
+
+# Cache keys of the versions the /energy routes read: every name but the
+# per-site ones under VERSIONS_KEY, and one site's under version_key(name)
+VERSIONS_KEY = ("versions",)
+
+
+def version_key(name: str) -> tuple:
+    return ("version", name)
+
+
+def site_version_name(site_id: int) -> str:
+    return f"{TRACKS_VERSION}@{int(site_id)}"
+
+
+def _is_site_version(name: str) -> bool:
+    return name.startswith(f"{TRACKS_VERSION}@") and name != ALL_SITES_VERSION
+
+
+class Version(NamedTuple):
+    version: int
+    updated_at: Optional[datetime]
+
+
+def bump_data_version(session: Session, name: str = TRACKS_VERSION) -> None:
+    """Increment ``name``'s counter in the session's current transaction."""
+    # Core statements on the connection, so no ORM events fire from inside the listeners
+    conn = session.connection()
+    bumped = conn.execute(
+        update(DataVersion)
+        .where(DataVersion.name == name)
+        .values(version=DataVersion.version + 1, updated_at=func.now())
+    )
+    if not bumped.rowcount:
+        conn.execute(insert(DataVersion).values(name=name, version=1, updated_at=func.now()))
+
+
+def data_version(session: Session, name: str = TRACKS_VERSION) -> Version:
+    """The committed version of ``name``; ``(0, None)`` before its first write."""
+    row = session.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(DataVersion.name == name)
+    ).first()
+    return Version(*row) if row else Version(0, None)
+
+
+def data_versions(session: Session) -> Dict[str, Version]:
+    """Every committed version but the per-site ones, by name."""
+    rows = session.execute(
+        select(DataVersion.name, DataVersion.version, DataVersion.updated_at).where(or_(
+            ~DataVersion.name.startswith(f"{TRACKS_VERSION}@", autoescape=True),
+            DataVersion.name == ALL_SITES_VERSION,
+        ))
+    )
+    return {name: Version(version, updated_at) for name, version, updated_at in rows}
+
+
+def site_versions(session: Session, site_ids: Iterable[int]) -> Dict[int, Version]:
+    """The committed track version of each site; ``(0, None)`` before its first write."""
+    names = {site_version_name(site_id): int(site_id) for site_id in site_ids}
+    versions = dict.fromkeys(names.values(), Version(0, None))
+    if names:
+        rows = session.execute(
+            select(DataVersion.name, DataVersion.version, DataVersion.updated_at)
+            .where(DataVersion.name.in_(names))
+        )
+        versions.update({names[name]: Version(version, updated_at) for name, version, updated_at in rows})
+    return versions
+
+
+# ------------------ Write-through invalidation ------------------ #
+
+_DIRTY_FLAG = "energy_cache_dirty"
+
+
+def mark_changed(session: Session, name: str) -> None:
+    """Invalidate ``name`` when ``session`` commits and bump its version, once per transaction."""
+    changed = session.info.setdefault(_DIRTY_FLAG, set())
+    if name not in changed:
+        changed.add(name)
+        bump_data_version(session, name)
+
+
+def mark_tracks_changed(session: Session, site_ids: Optional[Iterable[int]] = None) -> None:
+    """:func:`mark_changed` for track writes, e.g. those the listeners can't see (COPY).
+
+    ``site_ids`` are the sites the write touched; without them every site's
+    data counts as changed.
+    """
+    mark_changed(session, TRACKS_VERSION)
+    names = [ALL_SITES_VERSION] if site_ids is None else sorted({site_version_name(s) for s in site_ids})
+    for name in names:
+        mark_changed(session, name)
+
+
+def _track_sites(track: EnergyTrack) -> Set[int]:
+    # The old site too, when a track moves
+    history = inspect(track).attrs.site_id.history
+    return {s for s in chain(history.added, history.unchanged, history.deleted) if s is not None}
+
+
+def _inserted_sites(orm_execute_state) -> Optional[Set[int]]:
+    """The sites a bulk insert's parameter rows write to; None when unknown."""
+    rows = orm_execute_state.parameters
+    rows = rows if isinstance(rows, list) else [rows] if rows else []
+    if orm_execute_state.is_insert and rows and all(row.get("site_id") is not None for row in rows):
+        return {row["site_id"] for row in rows}
+    return None
+
+
+def _mark_dirty_on_flush(session, flush_context):
+    sites = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, EnergyTrack):
+            sites |= _track_sites(obj)
+        elif type(obj) in _VERSIONED:
+            mark_changed(session, _VERSIONED[type(obj)])
+    if sites:
+        mark_tracks_changed(session, sites)
+
+
+def _mark_dirty_on_bulk(orm_execute_state):
+    # Bulk insert/update/delete statements never go through the flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    if mapper.class_ is EnergyTrack:
+        mark_tracks_changed(orm_execute_state.session, _inserted_sites(orm_execute_state))
+    elif mapper.class_ in _VERSIONED:
+        mark_changed(orm_execute_state.session, _VERSIONED[mapper.class_])
+
+
+def _invalidate_on_commit(session):
+    changed = session.info.pop(_DIRTY_FLAG, None)
+    if not changed:
+        return
+    if all(name == TRACKS_VERSION or _is_site_version(name) for name in changed):
+        # Entries of these sites are keyed on their old versions and are simply never read again
+        _invalidate(energy_cache.delete, VERSIONS_KEY, *(version_key(name) for name in changed))
+    else:
+        _invalidate(energy_cache.clear)
+
+
+def _invalidate(fn, *args):
+    if energy_cache.remote:
+        call_off_loop(fn, *args)
+    else:
+        fn(*args)
+
+
+def _reset_on_rollback(session):
+    session.info.pop(_DIRTY_FLAG, None)
+
+
+SESSION_LISTENERS = (
+    ("after_flush", _mark_dirty_on_flush),
+    ("do_orm_execute", _mark_dirty_on_bulk),
+    ("after_commit", _invalidate_on_commit),
+    ("after_rollback", _reset_on_rollback),
+)
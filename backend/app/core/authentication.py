@@ -1,31 +1,87 @@
-# app/core/dependencies.py
+# app/core/authentication.py
+
+import hashlib
+import os
+import time
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import InMemoryCache
 from app.database import get_db
 from app.models import User
-from app.core.jwt import decode_access_token
+from app.schemas import TokenData
+from app.core.jwt import decode_access_token_claims
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    user_id = decode_access_token(token)
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials"
+# Decoded tokens, keyed by SHA-256 of the token and dropped when the token expires
+token_cache = InMemoryCache(maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 10000)), ttl=0)
+
+# Short-lived User rows for the endpoints that need a fresh user object
+user_cache = InMemoryCache(
+    maxsize=int(os.getenv("AUTH_USER_CACHE_SIZE", 1000)),
+    ttl=float(os.getenv("AUTH_USER_CACHE_TTL", 30)),
+)
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def get_current_claims(token: str = Depends(oauth2_scheme)) -> TokenData:
+    """Identity carried by a verified access token, without touching the database.
+
+    Use this for read-only endpoints that only need to know *that* the caller is
+    authenticated (and who they are); the signature and expiry are checked, the
+    ``users`` row is not.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        return claims
+
+    payload = decode_access_token_claims(token)
+    if not payload or not payload.get("sub"):
+        raise _credentials_exception()
+
+    try:
+        claims = TokenData(
+            user_id=int(payload["sub"]),
+            email=payload.get("email"),
+            username=payload.get("username"),
         )
+    except (TypeError, ValueError):
+        raise _credentials_exception()
+
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(key, claims, ttl=expires_in)
+    return claims
+
+
+async def get_current_user(
+    claims: TokenData = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """The ``User`` behind the token, read from the database at most every few seconds."""
+    user = user_cache.get(claims.user_id)
+    if user is not None:
+        return user
 
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = (await db.execute(select(User).where(User.id == claims.user_id))).scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
+    db.expunge(user)
+    user_cache.set(claims.user_id, user)
     return user
@@ -0,0 +1,32 @@
+# app/core/authorization.py
+
+from typing import Tuple
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import cache
+from app.core.authentication import get_current_claims
+from app.database import get_db
+from app.models import UserSite
+from app.schemas import TokenData
+
+
+def granted_site_ids(session: Session, user_id: int) -> Tuple[int, ...]:
+    return tuple(session.scalars(
+        select(UserSite.site_id).where(UserSite.user_id == user_id).order_by(UserSite.site_id)
+    ))
+
+
+async def user_site_ids(db: AsyncSession, user_id: int) -> Tuple[int, ...]:
+    """Ids of the sites ``user_id`` may read, cached until ``user_sites`` or ``sites`` is written."""
+    return await cache.energy_cache.aget_or_set(("sites", user_id), lambda: db.run_sync(granted_site_ids, user_id))
+
+
+async def get_site_ids(
+    claims: TokenData = Depends(get_current_claims),
+    db: AsyncSession = Depends(get_db),
+) -> Tuple[int, ...]:
+    return await user_site_ids(db, claims.user_id)
@@ -1,10 +1,111 @@
 # app/core/hashing.py
-from passlib.context import CryptContext
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from prometheus_client import Histogram
+from starlette.concurrency import run_in_threadpool
+
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    # Built on first use, in whichever process hashes: passlib and bcrypt are
+    # slow to import and most workers only ever verify tokens
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# bcrypt is CPU-bound, so the async helpers below run it in a dedicated
+# process pool. HASH_POOL_WORKERS=0 runs it in the request threadpool instead.
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", os.cpu_count() or 1))
+# Hashes allowed to run or wait at once before callers get HashingPoolBusy
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", max(HASH_POOL_WORKERS, 1) * 8))
+HASH_POOL_RETRY_AFTER = int(os.getenv("HASH_POOL_RETRY_AFTER", 1))
+
+# Exposed on /metrics; includes the wait for a free worker
+HASH_SECONDS = Histogram(
+    "password_hashing_seconds", "bcrypt hash/verify time, including the wait for a worker", ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5, 10),
+)
+
+
+class HashingPoolBusy(Exception):
+    """Raised when the hashing pool's queue is full."""
+
+    def __init__(self, retry_after: int = HASH_POOL_RETRY_AFTER):
+        super().__init__("Password hashing pool is saturated")
+        self.retry_after = retry_after
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+        return _executor
+
+
+def _warm() -> None:
+    pwd_context()
+
+
+def start_pool() -> None:
+    """Start the worker processes and load bcrypt in them now, not on the first login."""
+    if HASH_POOL_WORKERS <= 0:
+        _warm()
+        return
+    executor = _get_executor()
+    for future in [executor.submit(_warm) for _ in range(HASH_POOL_WORKERS)]:
+        future.result()
+
+
+def shutdown_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def pending() -> int:
+    return _pending
+
+
+async def _run(fn, *args):
+    global _pending
+    with _pending_lock:
+        if _pending >= HASH_POOL_MAX_PENDING:
+            raise HashingPoolBusy()
+        _pending += 1
+    try:
+        with HASH_SECONDS.labels(fn.__name__).time():
+            if HASH_POOL_WORKERS <= 0:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
@@ -1,34 +1,34 @@
-from jose import jwt, JWTError
 from datetime import datetime, timedelta
-import os
-
-# Load mandatory secrets from environment
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
-
-if not SECRET_KEY:
-    raise ValueError("SECRET_KEY environment variable is required")
-if not ALGORITHM:
-    raise ValueError("ALGORITHM environment variable is required")
-if not ACCESS_TOKEN_EXPIRE_MINUTES:
-    raise ValueError("ACCESS_TOKEN_EXPIRE_MINUTES environment variable is required")
-
-# Parse the expiry value into int
-try:
-    EXPIRY_MINUTES = int(ACCESS_TOKEN_EXPIRE_MINUTES)
-except ValueError:
-    raise ValueError("ACCESS_TOKEN_EXPIRE_MINUTES must be an integer")
+from functools import lru_cache
+
+from app.settings import get_settings
+
+
+@lru_cache(maxsize=None)
+def _jose():
+    # Imported on first use: python-jose pulls in its crypto backends
+    from jose import JWTError, jwt
+
+    return jwt, JWTError
+
 
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
+    settings = get_settings()
+    jwt, _ = _jose()
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=EXPIRY_MINUTES))
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
-def decode_access_token(token: str):
+def decode_access_token_claims(token: str):
+    """Verified payload of ``token``, or None if it is invalid or expired."""
+    settings = get_settings()
+    jwt, JWTError = _jose()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("sub")
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
     except JWTError:
         return None
+
+def decode_access_token(token: str):
+    payload = decode_access_token_claims(token)
+    return payload.get("sub") if payload else None
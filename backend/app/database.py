@@ -1,20 +1,212 @@
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from app.settings import get_settings
+
+# Async drivers used by the app for each sync driver found in DB_URL
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Swap the sync driver in ``url`` for its async counterpart."""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+# Key in a pool record's ``info`` holding how long its last checkout waited
+CHECKOUT_WAIT = "checkout_wait"
+
+
+class _TimedCheckout:
+    """Pool mixin recording each checkout's wait for app.metrics."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        record = super()._do_get()
+        record.info[CHECKOUT_WAIT] = time.perf_counter() - start
+        return record
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(url: str, prefix: str = "DB_") -> dict:
+    """Connection pool settings from the environment (ignored for SQLite).
+
+    ``prefix="DB_READ_"`` reads the sizes of the read pools, e.g.
+    ``DB_READ_POOL_SIZE``, falling back to the ``DB_`` ones.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {}
+
+    def setting(name, default):
+        return os.getenv(prefix + name) or os.getenv("DB_" + name) or default
+
+    return {
+        "poolclass": TimedAsyncQueuePool if parsed.get_dialect().is_async else TimedQueuePool,
+        "pool_size": int(setting("POOL_SIZE", 5)),
+        "max_overflow": int(setting("MAX_OVERFLOW", 10)),
+        "pool_timeout": float(setting("POOL_TIMEOUT", 30)),
+        "pool_recycle": int(setting("POOL_RECYCLE", 1800)),
+        "pool_pre_ping": str(setting("POOL_PRE_PING", "true")).lower() in ("1", "true", "yes"),
+    }
 
-load_dotenv()
 
-DATABASE_URL = os.getenv("DB_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+def _sync_url() -> str:
+    return get_settings().db_url
+
+
+def _async_url() -> str:
+    settings = get_settings()
+    return settings.async_db_url or to_async_url(settings.db_url)
+
+
+def _read_engine(url: str):
+    return create_async_engine(url, **pool_options(url, "DB_READ_"))
+
+
+def _read_router():
+    from app.replicas import ReadRouter
+
+    replicas = [
+        (f"replica{i}", _read_engine(to_async_url(url))) for i, url in enumerate(get_settings().replica_urls)
+    ]
+    return ReadRouter(replicas, _get("read_engine"))
+
+
+# Engines and session factories are created on first use, so importing the
+# app neither reads the settings nor loads a database driver. They are still
+# importable by name: ``from app.database import SessionLocal``.
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    # Sync engine for scripts, migrations and tooling
+    "engine": lambda: create_engine(_sync_url(), **pool_options(_sync_url())),
+    "SessionLocal": lambda: sessionmaker(bind=_get("engine"), autocommit=False, autoflush=False),
+    # Async engine for the API's writes and auth
+    "async_engine": lambda: create_async_engine(_async_url(), **pool_options(_async_url())),
+    "AsyncSessionLocal": lambda: async_sessionmaker(bind=_get("async_engine"), autoflush=False, expire_on_commit=False),
+    # The /energy views' reads: a pool of their own on the primary, and the replicas (see app.replicas)
+    "read_engine": lambda: _read_engine(_async_url()),
+    "read_router": _read_router,
+}
+_created: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def _get(name: str):
+    value = _created.get(name)
+    if value is None:
+        with _lock:
+            value = _created.get(name)
+            if value is None:
+                value = _created[name] = _FACTORIES[name]()
+    return value
+
+
+def __getattr__(name: str):
+    if name in _FACTORIES:
+        return _get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def created_engines() -> Dict[str, Engine]:
+    """The engines created so far, by role; async ones as their sync facade."""
+    engines = {}
+    if "engine" in _created:
+        engines["sync"] = _created["engine"]
+    if "async_engine" in _created:
+        engines["async"] = _created["async_engine"].sync_engine
+    if "read_engine" in _created:
+        engines["read"] = _created["read_engine"].sync_engine
+    if "read_router" in _created:
+        for replica in _created["read_router"].replicas:
+            engines[replica.name] = replica.engine.sync_engine
+    return engines
+
+
+def created_router():
+    """The read router, if a read has created it."""
+    return _created.get("read_router")
+
+
+def reset() -> None:
+    """Forget the engines, e.g. after new settings; the next use recreates them."""
+    with _lock:
+        engine = _created.get("engine")
+        _created.clear()
+    if engine is not None:
+        engine.dispose()
+
+
+async def dispose() -> None:
+    """Close every pooled connection and forget the engines; the next use recreates them."""
+    with _lock:
+        created = dict(_created)
+        _created.clear()
+    if "read_router" in created:
+        for replica in created["read_router"].replicas:
+            await replica.engine.dispose()
+    for name in ("async_engine", "read_engine"):
+        if name in created:
+            await created[name].dispose()
+    if "engine" in created:
+        created["engine"].dispose()
+
+
+async def get_db():
+    async with _get("AsyncSessionLocal")() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+
+def get_sessionmaker() -> async_sessionmaker:
+    """The session factory, for streaming responses that outlive ``get_db``.
+
+    FastAPI closes ``get_db`` sessions before a ``StreamingResponse`` body runs,
+    so a streamed body opens its own session from this factory.
+    """
+    return _get("AsyncSessionLocal")
+
+
+async def get_read_replica():
+    """Where this request's reads go: a replica, or the primary's read pool (see app.replicas)."""
+    return await _get("read_router").choose()
+
+
+async def get_read_db(replica=Depends(get_read_replica)):
+    """A session for read-only queries, on the request's replica."""
+    async with replica.sessionmaker() as db:
+        try:
+            yield db
+        except DBAPIError as exc:
+            if exc.connection_invalidated or isinstance(exc, OperationalError):
+                _get("read_router").mark_down(replica)
+            raise
+
+
+def get_read_sessionmaker(replica=Depends(get_read_replica)) -> async_sessionmaker:
+    """Like :func:`get_sessionmaker`, for streamed reads: the factory of the request's replica."""
+    return replica.sessionmaker
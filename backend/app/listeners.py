@@ -0,0 +1,32 @@
+"""The SQLAlchemy session listeners that keep everything derived from writes in sync.
+
+They are registered explicitly, by :func:`register`, rather than as a side
+effect of importing their modules: the app calls it when it is created, and
+so does every script and the test suite before its first write.
+
+Per flush or transaction, in this order:
+
+- ``before_flush``: app.utils.rollup, app.utils.anomalies and
+  app.utils.sketches update their tables from the tracks being flushed. Each
+  bumps the tracks' data versions before locking its rows, the order ingest
+  takes the same locks in,
+- ``after_flush`` / ``do_orm_execute``: app.cache bumps the data versions of
+  the other writes,
+- ``after_commit`` / ``after_rollback``: app.cache invalidates the /energy
+  cache, and app.stream publishes the rollup cells that changed.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache, stream
+from app.utils import anomalies, rollup, sketches
+
+_MODULES = (rollup, anomalies, sketches, cache, stream)
+
+
+def register() -> None:
+    """Register every module's session listeners, in order; registering again is a no-op."""
+    for module in _MODULES:
+        for name, listener in module.SESSION_LISTENERS:
+            if not event.contains(Session, name, listener):
+                event.listen(Session, name, listener)
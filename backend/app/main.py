@@ -1,47 +1,129 @@
 # backend/main.py
 
-import os
-from dotenv import load_dotenv
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
 
-from app import models, database
-from app.routes import auth, energy
+from app.routes import auth, energy, metrics, stream
+from app import database, listeners, settings as app_settings
+from app.stream import hub
+from app.metrics import MetricsMiddleware, register as register_metrics
+from app.profiling import ProfilingMiddleware
+from app.core import hashing, jwt
 from app.exceptions import (
     validation_exception_handler,
     sqlalchemy_exception_handler,
+    hashing_pool_busy_handler,
+    too_many_buckets_handler,
     generic_exception_handler
 )
+from app.settings import Settings
+from app.utils.columnar import TooManyBuckets
 
-load_dotenv()
+# Tables are managed by Alembic migrations: run `alembic upgrade head` before starting
 
-# Create tables
-models.Base.metadata.create_all(bind=database.engine)
 
-# Initialize app
-app = FastAPI()
+async def prewarm() -> None:
+    """Do what the first requests would otherwise wait for.
 
-# Register exception handlers
-app.add_exception_handler(RequestValidationError, validation_exception_handler)
-app.add_exception_handler(SQLAlchemyError, sqlalchemy_exception_handler)
-app.add_exception_handler(Exception, generic_exception_handler)
+    Opens the connections of the write pool and of the pool reads are routed
+    to, fills the dimension registry and the data versions, and starts the
+    password hashing workers.
+    """
+    replica = await database.read_router.choose()
+    for engine in (database.async_engine, replica.engine):
+        size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+        connections = await asyncio.gather(*(engine.connect() for _ in range(size)))
+        await asyncio.gather(*(connection.close() for connection in connections))
 
-# Include routers
-app.include_router(auth.router)
-app.include_router(energy.router)
+    async with replica.sessionmaker() as db:
+        await energy.warm_cache(db)
+    jwt.create_access_token({"sub": "0"})
+    await asyncio.to_thread(hashing.start_pool)
 
-# CORS setup
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], 
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Health check
-@app.get("/")
-def read_root():
-    return {"message": "Backend is running 🚀"}
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if app.state.settings.prewarm:
+        await prewarm()
+    yield
+    # Let go of the live update broker, the hashing workers and the pools
+    hub.close()
+    await asyncio.to_thread(hashing.shutdown_pool)
+    await database.dispose()
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the API.
+
+    Nothing here touches the database: engines, the dimension registry and
+    the hashing workers are created on first use, or by the lifespan when
+    ``settings.prewarm`` is set. Without ``settings`` they are read from the
+    environment now, so a missing variable fails at startup.
+    """
+    if settings is None:
+        settings = app_settings.get_settings()
+    else:
+        app_settings.configure(settings)
+        database.reset()
+    listeners.register()
+    register_metrics()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+
+    # Register exception handlers
+    app.add_exception_handler(RequestValidationError, validation_exception_handler)
+    app.add_exception_handler(SQLAlchemyError, sqlalchemy_exception_handler)
+    app.add_exception_handler(hashing.HashingPoolBusy, hashing_pool_busy_handler)
+    app.add_exception_handler(TooManyBuckets, too_many_buckets_handler)
+    app.add_exception_handler(Exception, generic_exception_handler)
+
+    # Include routers
+    app.include_router(auth.router)
+    app.include_router(energy.router)
+    app.include_router(stream.router)
+    app.include_router(metrics.router)
+
+    # CORS setup
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=list(settings.cors_origins),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Inside the metrics, so profiled requests are still counted
+    app.add_middleware(ProfilingMiddleware)
+    # Outermost, so latency covers the whole stack
+    app.add_middleware(MetricsMiddleware)
+
+    # Health check
+    @app.get("/")
+    def read_root():
+        return {"message": "Backend is running 🚀"}
+
+    return app
+
+
+_app: Optional[FastAPI] = None
+
+
+def __getattr__(name: str):
+    """``app``, built from the environment on first access rather than on import.
+
+    ``uvicorn app.main:app`` reads it at startup, so a missing setting still
+    fails there; ``uvicorn --factory app.main:create_app`` builds one per worker.
+    """
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
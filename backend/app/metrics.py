@@ -0,0 +1,305 @@
+"""Prometheus metrics and per-request SQL instrumentation.
+
+:func:`register`, which ``create_app`` calls, installs for every engine and
+pool:
+
+- ``before/after_cursor_execute`` listeners that time each statement and
+  add it to the current request's :class:`RequestStats`. A statement slower
+  than ``SLOW_QUERY_MS`` (default 200) is logged on the ``app.sql`` logger
+  with its parameters and, for ``SELECT``s on SQLite/Postgres, its plan. The
+  plan is read on the statement's own connection, inside a savepoint on
+  Postgres, and a failing ``EXPLAIN`` only costs the plan,
+- a ``checkout`` listener reporting how long the pool made the checkout wait
+  (timed by the pool classes in app.database).
+
+:class:`MetricsMiddleware` keeps per-route latency histograms, in-flight
+gauges and per-request query counts/durations, and adds a ``Server-Timing``
+header with the request's database time. A request running more than
+``REQUEST_QUERY_WARN`` (default 20) statements is logged as well, which is
+how N+1 query patterns show up.
+
+``GET /metrics`` (app.routes.metrics) renders everything in the default
+registry (bcrypt timings are recorded by app.core.hashing), plus the cache
+hit ratios, pool occupancy and read replica state read at scrape time. With
+several workers, set ``PROMETHEUS_MULTIPROC_DIR`` so that prometheus_client
+aggregates them.
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+from starlette.routing import Match
+
+from app import cache, database, profiling
+from app.core import authentication
+
+logger = logging.getLogger("app.sql")
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_MS", 200)) / 1000
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+REQUEST_QUERY_WARN = int(os.getenv("REQUEST_QUERY_WARN", 20))
+
+# Statements that get their plan logged, per dialect
+_EXPLAIN = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+}
+# Route label outside of any request, e.g. in the scripts
+NO_ROUTE = "-"
+
+REQUESTS = Counter(
+    "http_requests", "HTTP requests by route and status", ["method", "route", "status"],
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response was fully sent", ["method", "route"],
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being served", ["method", "route"], multiprocess_mode="livesum",
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements executed per request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL per request", ["route"],
+)
+QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time to execute one SQL statement", ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SLOW_QUERIES = Counter(
+    "db_slow_queries", "Statements slower than SLOW_QUERY_MS", ["route"],
+)
+CHECKOUT_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time a pool checkout waited for a connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+
+@dataclass
+class RequestStats:
+    route: str
+    queries: int = 0
+    db_seconds: float = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """The statistics of the request being served, if any."""
+    return _current.get()
+
+
+# ------------------ SQL ------------------ #
+
+_STARTED = "metrics_query_started"
+
+
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info[_STARTED].pop()
+    stats = _current.get()
+    route = stats.route if stats else NO_ROUTE
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    QUERY_SECONDS.labels(route).observe(elapsed)
+    profiling.record("db", elapsed)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.labels(route).inc()
+        plan = _explain(conn, statement, parameters) if SLOW_QUERY_EXPLAIN and not executemany else None
+        logger.warning(
+            "Slow query (%.1f ms, route %s): %s\nParameters: %r%s",
+            elapsed * 1000, route, statement, parameters,
+            "\nPlan:\n  " + "\n  ".join(plan) if plan else "",
+        )
+
+
+def _discard_failed_query(context):
+    starts = context.connection.info.get(_STARTED) if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _explain(conn, statement: str, parameters) -> Optional[list]:
+    prefix = _EXPLAIN.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    # A failed statement aborts a Postgres transaction; rolling back to the
+    # savepoint leaves the caller's as it was
+    savepoint = conn.dialect.name == "postgresql"
+    # A raw DBAPI cursor, so the EXPLAIN itself isn't timed or explained
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT metrics_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = [str(row[-1]) for row in cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT metrics_explain")
+            raise
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT metrics_explain")
+        return plan
+    except Exception as exc:
+        # The query itself succeeded; only its plan is lost
+        logger.warning("Plan unavailable: %s", exc)
+        return None
+    finally:
+        cursor.close()
+
+
+def _observe_checkout(dbapi_connection, connection_record, connection_proxy):
+    wait = connection_record.info.pop(database.CHECKOUT_WAIT, None)
+    if wait is not None:
+        CHECKOUT_WAIT_SECONDS.observe(wait)
+
+
+_LISTENERS = (
+    (Engine, "before_cursor_execute", _start_query),
+    (Engine, "after_cursor_execute", _end_query),
+    (Engine, "handle_error", _discard_failed_query),
+    (Pool, "checkout", _observe_checkout),
+)
+
+
+def register() -> None:
+    """Instrument every engine and pool; registering again is a no-op."""
+    for target, name, listener in _LISTENERS:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+
+
+# ------------------ Requests ------------------ #
+
+def route_of(scope) -> str:
+    """The path template of the route ``scope`` matches, so labels don't explode with ids."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL use per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method, route = scope["method"], route_of(scope)
+        stats = RequestStats(route)
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        in_progress = IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            in_progress.dec()
+            _current.reset(token)
+            REQUESTS.labels(method, route, str(status)).inc()
+            REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - start)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+            if stats.queries > REQUEST_QUERY_WARN:
+                logger.warning("%s %s ran %d SQL statements (%.1f ms)", method, route, stats.queries, stats.db_seconds * 1000)
+
+
+# ------------------ Scrape-time collectors ------------------ #
+
+# Callables, since tests and reconfiguration may swap the instances
+CACHES = {
+    "energy": lambda: cache.energy_cache,
+    "auth_token": lambda: authentication.token_cache,
+    "auth_user": lambda: authentication.user_cache,
+}
+
+class StateCollector:
+    """Cache hit ratios, pool occupancy and replica state, read when /metrics is scraped."""
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that found nothing", labels=["cache"])
+        evictions = CounterMetricFamily("cache_evictions", "Entries dropped for space", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Hits over lookups since start", labels=["cache"])
+        for name, get in CACHES.items():
+            stats = get().stats()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            evictions.add_metric([name], stats["evictions"])
+            ratio.add_metric([name], stats["hit_ratio"])
+        yield from (hits, misses, evictions, ratio)
+
+        connections = GaugeMetricFamily(
+            "db_pool_connections", "Pooled connections by state", labels=["engine", "state"],
+        )
+        # Only engines in use: a scrape shouldn't create one
+        for name, engine in database.created_engines().items():
+            pool = engine.pool
+            if isinstance(pool, QueuePool):
+                connections.add_metric([name, "checked_out"], pool.checkedout())
+                connections.add_metric([name, "idle"], pool.checkedin())
+                connections.add_metric([name, "overflow"], max(pool.overflow(), 0))
+        yield connections
+
+        usable = GaugeMetricFamily("db_replica_usable", "1 if reads may go to the replica", labels=["replica"])
+        lag = GaugeMetricFamily("db_replica_lag_seconds", "Replica lag at its last check", labels=["replica"])
+        router = database.created_router()
+        for replica in router.status() if router is not None else ():
+            usable.add_metric([replica["name"]], 1 if replica["usable"] else 0)
+            if replica["lag"] is not None and replica["lag"] != float("inf"):
+                lag.add_metric([replica["name"]], replica["lag"])
+        yield from (usable, lag)
+
+
+_state = StateCollector()
+REGISTRY.register(_state)
+
+
+def render() -> bytes:
+    """The exposition text for every metric."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Per-process state: the scraped worker's caches and pools
+        registry.register(_state)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
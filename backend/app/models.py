@@ -1,6 +1,8 @@
 from sqlalchemy import (
-    Column, Integer, String, Numeric, ForeignKey, TIMESTAMP, func
+    Column, Integer, BigInteger, Float, String, Numeric, ForeignKey, LargeBinary, TIMESTAMP, Index, func
 )
+from sqlalchemy.orm import column_property
+
 from app.database import Base
 
 class User(Base):
@@ -16,11 +18,35 @@ class User(Base):
         return f"<User(id={self.id}, email={self.email})>"
 
 
+class Site(Base):
+    """A site (tenant) that owns energy tracks; users see the sites granted in ``user_sites``."""
+    __tablename__ = "sites"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    def __repr__(self):
+        return f"<Site(id={self.id}, name={self.name})>"
+
+
+class UserSite(Base):
+    """Grants a user read access to one site's tracks."""
+    __tablename__ = "user_sites"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Second in the key, so the grants of a site are found through the index below
+    site_id = Column(Integer, ForeignKey("sites.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f"<UserSite(user={self.user_id}, site={self.site_id})>"
+
+
 class EnergySource(Base):
     __tablename__ = "energy_sources"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, nullable=False)
+    name = Column(String, unique=True, index=True, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     def __repr__(self):
@@ -31,7 +57,7 @@ class EnergyType(Base):
     __tablename__ = "energy_types"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, nullable=False)  # e.g., "generation", "consumption"
+    name = Column(String, unique=True, index=True, nullable=False)  # e.g., "generation", "consumption"
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     def __repr__(self):
@@ -39,14 +65,113 @@ class EnergyType(Base):
 
 
 class EnergyTrack(Base):
+    """One meter reading over ``[start_time, end_time)`` (UTC).
+
+    On Postgres the table is range-partitioned by month on ``start_time`` (see
+    the ``c5d9e2f4a816`` migration and ``app.utils.partitions``); the
+    partition key is then part of the primary key, ``(id, start_time)``.
+    """
     __tablename__ = "energy_tracks"
 
-    id = Column(Integer, primary_key=True, index=True)
-    source_id = Column(Integer, ForeignKey("energy_sources.id"), nullable=False)
-    type_id = Column(Integer, ForeignKey("energy_types.id"), nullable=False)
-    month = Column(Integer, nullable=False)  # 1 = January, 12 = December
-    kwh = Column(Numeric(10, 2), nullable=False)
+    # SQLite only autoincrements a plain INTEGER primary key
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, index=True)
+    # The columns that place a reading in the rollup load their old value when
+    # set, even on an expired track (e.g. right after a commit), so a flush can
+    # tell which cell the track leaves (app.utils.rollup)
+    site_id = column_property(Column(Integer, ForeignKey("sites.id"), nullable=False), active_history=True)
+    source_id = column_property(Column(Integer, ForeignKey("energy_sources.id"), nullable=False), active_history=True)
+    type_id = column_property(Column(Integer, ForeignKey("energy_types.id"), nullable=False), active_history=True)
+    meter_id = Column(String, nullable=True)
+    start_time = column_property(Column(TIMESTAMP, nullable=False), active_history=True)
+    end_time = Column(TIMESTAMP, nullable=True)  # NULL for point-in-time readings
+    kwh = column_property(Column(Numeric(10, 2), nullable=False), active_history=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        # Every /energy query filters by site, type and time and groups by
+        # source; leading with the site keeps one tenant's reads within its
+        # own part of the index, and INCLUDE (kwh) lets Postgres answer them
+        # with an index-only scan.
+        Index(
+            "ix_energy_tracks_site_type_source_start",
+            "site_id", "type_id", "source_id", "start_time",
+            postgresql_include=["kwh"],
+        ),
+        # Readings arrive roughly in time order, so a BRIN index prunes
+        # ranges for a fraction of a B-tree's size.
+        Index("ix_energy_tracks_start_time", "start_time", postgresql_using="brin"),
+    )
+
+    def __repr__(self):
+        return f"<EnergyTrack(id={self.id}, site={self.site_id}, source={self.source_id}, type={self.type_id}, start={self.start_time}, kwh={self.kwh})>"
+
+
+class EnergyMonthlyRollup(Base):
+    """Pre-aggregated kWh per (site, type, source, year, month), kept in sync by app.utils.rollup."""
+    __tablename__ = "energy_monthly_rollup"
+
+    site_id = Column(Integer, ForeignKey("sites.id"), primary_key=True)
+    type_id = Column(Integer, ForeignKey("energy_types.id"), primary_key=True)
+    source_id = Column(Integer, ForeignKey("energy_sources.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)  # 1 = January, 12 = December
+    kwh = Column(Numeric(18, 2), nullable=False, default=0)
+    track_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EnergyMonthlyRollup(site={self.site_id}, type={self.type_id}, source={self.source_id}, year={self.year}, month={self.month}, kwh={self.kwh})>"
+
+
+class EnergyReadingStats(Base):
+    """Online statistics of the readings of one (site, type, source, calendar month), kept by app.utils.anomalies."""
+    __tablename__ = "energy_reading_stats"
+
+    site_id = Column(Integer, ForeignKey("sites.id"), primary_key=True)
+    type_id = Column(Integer, ForeignKey("energy_types.id"), primary_key=True)
+    source_id = Column(Integer, ForeignKey("energy_sources.id"), primary_key=True)
+    month = Column(Integer, primary_key=True)  # 1 = January, 12 = December, whatever the year
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0)
+    m2 = Column(Float, nullable=False, default=0)  # sum of squared deviations from the mean (Welford)
+    ewma = Column(Float, nullable=False, default=0)  # exponentially weighted mean, in write order
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EnergyReadingStats(site={self.site_id}, type={self.type_id}, source={self.source_id}, month={self.month}, count={self.count}, mean={self.mean})>"
+
+
+class EnergyReadingSketch(Base):
+    """A quantile sketch and the peak of the readings of one rollup cell, kept by app.utils.sketches."""
+    __tablename__ = "energy_reading_sketches"
+
+    site_id = Column(Integer, ForeignKey("sites.id"), primary_key=True)
+    type_id = Column(Integer, ForeignKey("energy_types.id"), primary_key=True)
+    source_id = Column(Integer, ForeignKey("energy_sources.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)  # 1 = January
+    count = Column(Integer, nullable=False, default=0)
+    sketch = Column(LargeBinary, nullable=False)  # QuantileSketch.to_bytes()
+    peak_kwh = Column(Numeric(10, 2), nullable=False)
+    peak_at = Column(TIMESTAMP, nullable=True)  # start_time of the peak reading; NULL once it is deleted
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EnergyReadingSketch(site={self.site_id}, type={self.type_id}, source={self.source_id}, year={self.year}, month={self.month}, count={self.count})>"
+
+
+class DataVersion(Base):
+    """A counter per table, bumped in every transaction that writes it (see app.cache).
+
+    Track writes also bump one ``energy_tracks@<site id>`` counter per site
+    they touch; the /energy routes derive their ETags from the counters of
+    the sites a request reads.
+    """
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)  # table name, or energy_tracks@<site id>
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, server_default=func.now())
+
     def __repr__(self):
-        return f"<EnergyTrack(id={self.id}, source={self.source_id}, type={self.type_id}, month={self.month}, kwh={self.kwh})>"
+        return f"<DataVersion(name={self.name}, version={self.version})>"
@@ -0,0 +1,250 @@
+"""Opt-in profiling of single requests.
+
+:class:`ProfilingMiddleware` runs pyinstrument's sampling profiler around a
+request when either:
+
+- the request carries ``X-Profile: <PROFILE_TOKEN>``. The profile is then
+  returned *instead of* the response body, as speedscope JSON, or as
+  collapsed stacks for flamegraph.pl with ``X-Profile-Format: collapsed``.
+  The handler's status is in ``X-Profile-Status``.
+- it is one of the ``PROFILE_SAMPLE_RATE`` fraction of requests picked at
+  random. The client gets its normal response, the breakdown is logged on
+  the ``app.profile`` logger and, with ``PROFILE_DIR`` set, the speedscope
+  profile is saved there.
+
+Both kinds also get a per-phase time breakdown: SQL (``db``), building the
+cube (``cube``), deriving the view rows (``rows``), encoding (``encode``) and
+everything else (``other``: routing, validation, dependencies). Each phase
+counts only its own time, not the time of phases nested in it. Code marks
+its phases with ``with phase("name"):``. A profiled response reports the
+phases in its ``Server-Timing`` header.
+
+With neither ``PROFILE_TOKEN`` nor ``PROFILE_SAMPLE_RATE`` set, the
+middleware passes requests straight through, pyinstrument is never
+imported, and ``phase`` only does one context variable lookup. At most one
+request per process is profiled at a time. Another profiling request gets
+a ``409``; a request picked by sampling just isn't profiled.
+
+Event streams (``/energy/stream``) stay open for as long as the client
+listens, so profiling stops when their headers are sent: the stream is
+passed through as it is, and no profile is reported.
+"""
+import hmac
+import logging
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("app.profile")
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 1)) / 1000
+
+PROFILE_HEADER = b"x-profile"
+FORMAT_HEADER = b"x-profile-format"
+EVENT_STREAM = b"text/event-stream"
+SPEEDSCOPE = "speedscope"
+COLLAPSED = "collapsed"
+
+
+class Phases:
+    """Exclusive time per phase of one request."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        # Time spent in nested phases, per open phase
+        self._nested: List[float] = []
+
+    def record(self, name: str, seconds: float) -> None:
+        """Count ``seconds`` measured elsewhere (e.g. a statement) as ``name``."""
+        self.seconds[name] += seconds
+        self.counts[name] += 1
+        if self._nested:
+            self._nested[-1] += seconds
+
+    def breakdown(self, total: float) -> Dict[str, float]:
+        """Milliseconds per phase, plus ``other`` up to ``total`` seconds."""
+        ms = {name: seconds * 1000 for name, seconds in self.seconds.items()}
+        ms["other"] = max(total - sum(self.seconds.values()), 0.0) * 1000
+        ms["total"] = total * 1000
+        return ms
+
+
+_phases: ContextVar[Optional[Phases]] = ContextVar("profile_phases", default=None)
+
+
+class phase:
+    """Time a block as one phase of the request being profiled, if any."""
+
+    __slots__ = ("name", "_phases", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._phases = _phases.get()
+        if self._phases is not None:
+            self._phases._nested.append(0.0)
+            self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        phases = self._phases
+        if phases is not None:
+            elapsed = time.perf_counter() - self._start
+            nested = phases._nested.pop()
+            phases.seconds[self.name] += elapsed - nested
+            phases.counts[self.name] += 1
+            if phases._nested:
+                phases._nested[-1] += elapsed
+
+
+def record(name: str, seconds: float) -> None:
+    """``Phases.record`` on the request being profiled, if any."""
+    phases = _phases.get()
+    if phases is not None:
+        phases.record(name, seconds)
+
+
+# ------------------ Output ------------------ #
+
+def collapsed(frame) -> str:
+    """Collapsed stacks (``a;b;c <microseconds>``) of a pyinstrument frame tree."""
+    lines = []
+
+    def walk(frame, stack):
+        # Synthetic frames ([self], [await], ...) have no code location
+        label = frame.function if frame.is_synthetic else f"{frame.function} ({frame.file_path_short}:{frame.line_no})"
+        frames = stack + [label]
+        own = frame.time - sum(child.time for child in frame.children)
+        if own > 0:
+            lines.append(f"{';'.join(frames)} {round(own * 1e6)}")
+        for child in frame.children:
+            walk(child, frames)
+
+    if frame is not None:
+        walk(frame, [])
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(breakdown: Dict[str, float]) -> bytes:
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in breakdown.items()).encode()
+
+
+# ------------------ Middleware ------------------ #
+
+def _requested(scope) -> bool:
+    headers = dict(scope["headers"])
+    token = headers.get(PROFILE_HEADER)
+    return token is not None and hmac.compare_digest(token, PROFILE_TOKEN.encode())
+
+
+def _streaming(message) -> bool:
+    return dict(message["headers"]).get(b"content-type", b"").startswith(EVENT_STREAM)
+
+
+def _format(scope) -> str:
+    value = dict(scope["headers"]).get(FORMAT_HEADER, b"").decode().strip().lower()
+    return COLLAPSED if value == COLLAPSED else SPEEDSCOPE
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests on demand or by sampling."""
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (PROFILE_TOKEN or PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        requested = bool(PROFILE_TOKEN) and _requested(scope)
+        if not requested and random.random() >= PROFILE_SAMPLE_RATE:
+            return await self.app(scope, receive, send)
+        if self._busy:
+            if not requested:
+                return await self.app(scope, receive, send)
+            return await _respond(send, 409, b"Another request is being profiled", "text/plain")
+
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        status = 500
+        streaming = running = False
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+
+        def stop():
+            # Once only: after a stream frees the slot, another request may hold it
+            nonlocal running
+            if running:
+                running = False
+                profiler.stop()
+                self._busy = False
+
+        async def send_or_capture(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if _streaming(message):
+                    # Free the slot now rather than when the client hangs up
+                    streaming = True
+                    stop()
+            # A requested profile replaces the response
+            if streaming or not requested:
+                await send(message)
+
+        self._busy = running = True
+        phases = Phases()
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_or_capture)
+        finally:
+            stop()
+            total = time.perf_counter() - start
+            _phases.reset(token)
+        if streaming:
+            return
+
+        breakdown = phases.breakdown(total)
+        if requested:
+            fmt = _format(scope)
+            if fmt == COLLAPSED:
+                body, media_type = collapsed(profiler.last_session.root_frame()), "text/plain"
+            else:
+                body, media_type = profiler.output(SpeedscopeRenderer()), "application/json"
+            return await _respond(send, 200, body.encode(), media_type, [
+                (b"server-timing", server_timing(breakdown)),
+                (b"x-profile-status", str(status).encode()),
+            ])
+
+        path = None
+        if PROFILE_DIR:
+            name = scope["path"].strip("/").replace("/", "-") or "root"
+            path = os.path.join(
+                PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.speedscope.json",
+            )
+            with open(path, "w") as f:
+                f.write(profiler.output(SpeedscopeRenderer()))
+        logger.info(
+            "Profiled %s %s (%d): %s%s", scope["method"], scope["path"], status,
+            ", ".join(f"{name} {ms:.1f} ms" for name, ms in breakdown.items()),
+            f", saved to {path}" if path else "",
+        )
+
+
+async def _respond(send, status: int, body: bytes, media_type: str, headers: Optional[list] = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", media_type.encode()), (b"content-length", str(len(body)).encode()), *(headers or [])],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,155 @@
+"""Routing of read-only queries to read replicas.
+
+The /energy views only read, so their sessions come from :class:`ReadRouter`
+(through ``app.database.get_read_db``). Writes, logins, registration and
+site grants keep using the primary's own pool.
+
+The router hands out replicas in round-robin order and skips the ones that
+are down or stale. Replicas are checked on use, at most every
+``DB_REPLICA_CHECK_INTERVAL`` seconds (default 5), with one query against
+``data_versions``. The check fails after ``DB_REPLICA_CHECK_TIMEOUT`` seconds
+(default 1), and a query that loses its connection marks its replica down
+until the next check.
+
+A replica is stale when the newest write in its ``data_versions`` is more
+than ``DB_REPLICA_MAX_LAG`` seconds (default 30) older than the primary's.
+Those counters are bumped in every transaction that writes the tables the
+views read, so they measure lag in the terms the cache and the ETags use, on
+any backend. Set ``DB_REPLICA_MAX_LAG=off`` to serve from any live replica.
+When no replica qualifies, reads go to the primary, through a pool of their
+own.
+
+A view can lag behind the primary by up to the allowed lag. The versions it
+reads are cached like any others, for up to ``ENERGY_CACHE_TTL``.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+
+
+def _seconds(value: str) -> Optional[float]:
+    return None if value.strip().lower() in ("off", "none") else float(value)
+
+
+REPLICA_MAX_LAG = _seconds(os.getenv("DB_REPLICA_MAX_LAG") or "30")
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL") or 5)
+REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT") or 1)
+
+
+def _sessionmaker(engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker = field(init=False, repr=False)
+    healthy: bool = True
+    # Seconds behind the primary at the last check
+    lag: Optional[float] = None
+    checked_at: float = -math.inf
+
+    def __post_init__(self):
+        self.sessionmaker = _sessionmaker(self.engine)
+
+
+async def latest_write(engine: AsyncEngine) -> Optional[datetime]:
+    """When the newest transaction visible on ``engine`` wrote the versioned tables."""
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.max(DataVersion.updated_at)))
+
+
+def replication_lag(primary: Optional[datetime], replica: Optional[datetime]) -> float:
+    """Seconds the replica's newest write trails the primary's."""
+    if primary is None:
+        return 0.0
+    if replica is None:
+        return math.inf
+    return max((primary - replica).total_seconds(), 0.0)
+
+
+class ReadRouter:
+    """Picks the session factory of each read: the next fresh, live replica, or the primary."""
+
+    def __init__(
+        self,
+        replicas: Sequence[Tuple[str, AsyncEngine]],
+        primary: AsyncEngine,
+        max_lag: Optional[float] = REPLICA_MAX_LAG,
+        check_interval: float = REPLICA_CHECK_INTERVAL,
+        check_timeout: float = REPLICA_CHECK_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.replicas: List[Replica] = [Replica(name, engine) for name, engine in replicas]
+        self.primary = Replica(PRIMARY, primary)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._clock = clock
+        self._turn = itertools.count()
+
+    def usable(self, replica: Replica) -> bool:
+        if not replica.healthy:
+            return False
+        return self.max_lag is None or replica.lag is None or replica.lag <= self.max_lag
+
+    async def choose(self) -> Replica:
+        """The next usable replica in round-robin order, checking the ones that are due."""
+        if self.replicas:
+            start = next(self._turn)
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(start + i) % len(self.replicas)]
+                if self._clock() - replica.checked_at >= self.check_interval:
+                    await self.check(replica)
+                if self.usable(replica):
+                    return replica
+        return self.primary
+
+    async def check(self, replica: Replica) -> None:
+        """Probe ``replica`` and record whether it is up and how far it lags."""
+        # Concurrent requests keep the last result instead of probing again
+        replica.checked_at = self._clock()
+        try:
+            replica_latest = await asyncio.wait_for(latest_write(replica.engine), self.check_timeout)
+            lag = None
+            if self.max_lag is not None:
+                primary_latest = await asyncio.wait_for(latest_write(self.primary.engine), self.check_timeout)
+                lag = replication_lag(primary_latest, replica_latest)
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as exc:
+            if replica.healthy:
+                logger.warning("Read replica %s is down: %s", replica.name, exc)
+            replica.healthy = False
+            return
+        if not replica.healthy:
+            logger.info("Read replica %s is back", replica.name)
+        replica.healthy, replica.lag = True, lag
+
+    def mark_down(self, replica: Replica) -> None:
+        """Skip ``replica`` until its next check, e.g. after it dropped a connection."""
+        if replica is not self.primary:
+            replica.healthy = False
+            replica.checked_at = self._clock()
+
+    def status(self) -> List[dict]:
+        """Each replica's state as of its last check, for metrics."""
+        return [
+            {"name": r.name, "healthy": r.healthy, "usable": self.usable(r), "lag": r.lag}
+            for r in self.replicas
+        ]
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Form
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import database, models, schemas
 from app.core import hashing, jwt
 from app.schemas import UserLoginForm
@@ -8,11 +9,11 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=schemas.UserOut, status_code=status.HTTP_201_CREATED)
-def register_user(
+async def register_user(
     username: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
     # Validate using Pydantic schema
     try:
@@ -23,34 +24,39 @@ def register_user(
             detail="Invalid registration data format"
         )
 
-    if db.query(models.User).filter(models.User.email == validated.email).first():
+    async def find_existing(field, value):
+        return (await db.execute(select(models.User).where(field == value))).scalars().first()
+
+    if await find_existing(models.User.email, validated.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    if db.query(models.User).filter(models.User.username == validated.username).first():
+    if await find_existing(models.User.username, validated.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
-    hashed_password = hashing.hash_password(validated.password)
+    hashed_password = await hashing.hash_password_async(validated.password)
     user = models.User(username=validated.username, email=validated.email, hashed_password=hashed_password)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
 @router.post("/login", response_model=schemas.Token)
-def login_user(
+async def login_user(
     form_data: UserLoginForm = Depends(),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
-    user = db.query(models.User).filter(models.User.email == form_data.email.strip().lower()).first()
+    user = (await db.execute(
+        select(models.User).where(models.User.email == form_data.email.strip().lower())
+    )).scalars().first()
 
-    if not user or not hashing.verify_password(form_data.password, user.hashed_password):
+    if not user or not await hashing.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -1,111 +1,425 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Dict
-from collections import defaultdict
-
-from app.database import get_db
-from app.models import EnergyTrack, EnergySource, EnergyType, User
-from app.core.authentication import get_current_user
+import numpy as np
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import List, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from app import cache
+from app.database import get_read_db, get_read_sessionmaker
+from app.core.authentication import get_current_claims
+from app.core.authorization import get_site_ids
+from app.profiling import phase
+from app.utils.anomalies import DEFAULT_THRESHOLD, find_anomalies
+from app.utils.columnar import EnergyCube, load_energy_cube
+from app.utils.dimensions import Dimensions, registry
+from app.utils.downsample import Downsampling, keep
+from app.utils.export import ENCODERS, EXPORT_BATCH_SIZE, ExportFormat, export_query, labelled
+from app.utils.http_cache import make_etag, not_modified, validator_headers
+from app.utils.periods import Granularity, Window, to_utc
+from app.utils.serialization import MSGPACK_RESPONSE, encoded_response, negotiate
+from app.utils.sketches import DEFAULT_QUANTILES, find_percentiles
 from app.schemas import (
     TrendsPoint,
     CompositionPoint,
     SummaryPoint,
     ComposedPoint,
+    DashboardOut,
+    AnomalyPoint,
+    PercentilePoint,
+    TokenData,
 )
 
-router = APIRouter(prefix="/energy", tags=["energy"])
 
-_MONTH_NAMES = [
-    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
-    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
-]
+def get_media_type(request: Request) -> str:
+    """JSON or msgpack, from the request's ``Accept`` header."""
+    return negotiate(request.headers.get("accept"))
+
+
+async def get_versions(
+    # Documented by the routes that take it; raw requests re-read the versions
+    raw: bool = Query(False, include_in_schema=False),
+    db: AsyncSession = Depends(get_read_db),
+) -> Dict[str, cache.Version]:
+    """The data versions, cached with the responses and cleared on the same commits."""
+    return await _cached(cache.VERSIONS_KEY, lambda: db.run_sync(cache.data_versions), bypass=raw)
+
+
+async def get_dimensions(
+    versions: Dict[str, cache.Version] = Depends(get_versions),
+    db: AsyncSession = Depends(get_read_db),
+) -> Dimensions:
+    """The registry's sources and types, reloaded only when their version moved."""
+    version = versions.get(cache.DIMENSIONS_VERSION, cache.Version(0, None)).version
+    return await db.run_sync(registry.get, version)
+
+
+class Scope(NamedTuple):
+    """The sites a request reads, and the track versions its cache entries are keyed on."""
+    site_ids: Tuple[int, ...]
+    # (data version name, version) for every site plus energy_tracks@all
+    versions: Tuple[Tuple[str, int], ...]
+    updated_at: Optional[datetime]
+
+    @property
+    def version(self) -> int:
+        # Each counter only grows, so the sum moves whenever one of them does
+        return sum(version for _, version in self.versions)
+
+
+async def _site_versions(db: AsyncSession, site_ids: Sequence[int], bypass: bool) -> Dict[int, cache.Version]:
+    """Each site's track version, cached per site and dropped when that site is written."""
+    found = {}
+    if not bypass:
+        for site_id in site_ids:
+            version = await cache.energy_cache.aget(cache.version_key(cache.site_version_name(site_id)))
+            if version is not None:
+                found[site_id] = version
+    missing = [site_id for site_id in site_ids if site_id not in found]
+    if missing:
+        fresh = await db.run_sync(cache.site_versions, missing)
+        for site_id, version in fresh.items():
+            await cache.energy_cache.aset(cache.version_key(cache.site_version_name(site_id)), version)
+        found.update(fresh)
+    return found
+
+
+async def get_scope(
+    site: Optional[str] = Query(None, description="Only this site; default: every site you can see"),
+    raw: bool = Query(False, include_in_schema=False),
+    site_ids: Tuple[int, ...] = Depends(get_site_ids),
+    versions: Dict[str, cache.Version] = Depends(get_versions),
+    dims: Dimensions = Depends(get_dimensions),
+    db: AsyncSession = Depends(get_read_db),
+) -> Scope:
+    """The caller's sites, or the one ``site`` they asked for, with their versions.
+
+    Sites the caller may not see are reported as unknown, so they can't be
+    probed for.
+    """
+    if site is not None:
+        if dims.sites.get(site) not in site_ids:
+            raise HTTPException(status_code=404, detail=f"Unknown site: {site}")
+        site_ids = (dims.sites[site],)
+
+    counters = {cache.ALL_SITES_VERSION: versions.get(cache.ALL_SITES_VERSION, cache.Version(0, None))}
+    for site_id, version in (await _site_versions(db, site_ids, raw)).items():
+        counters[cache.site_version_name(site_id)] = version
+    return Scope(
+        site_ids,
+        tuple(sorted((name, version.version) for name, version in counters.items())),
+        max((v.updated_at for v in counters.values() if v.updated_at), default=None),
+    )
+
+
+async def check_not_modified(
+    request: Request,
+    response: Response,
+    current_user: TokenData = Depends(get_current_claims),
+    media_type: str = Depends(get_media_type),
+    versions: Dict[str, cache.Version] = Depends(get_versions),
+    scope: Scope = Depends(get_scope),
+) -> dict:
+    """Answer ``304`` while the client's ETag is current; otherwise add the validator headers.
+
+    Runs before every /energy route, so an unchanged request never reaches
+    the aggregation. ETags follow the versions of the sites in the request's
+    scope, so writes to other sites don't change them. Returns the headers
+    for routes that build their own ``Response``.
+    """
+    dimensions = versions.get(cache.DIMENSIONS_VERSION, cache.Version(0, None))
+    updated_at = max((t for t in (scope.updated_at, dimensions.updated_at) if t), default=None)
+    params = [*request.query_params.multi_items(), ("sites", ",".join(map(str, scope.site_ids)))]
+    etag = make_etag(request.url.path, params, f"{scope.version}.{dimensions.version}", media_type)
+    headers = {**validator_headers(etag, updated_at), "Vary": "Accept"}
+    if not_modified(request.headers, etag, updated_at):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return headers
+
+
+router = APIRouter(prefix="/energy", tags=["energy"], dependencies=[Depends(check_not_modified)])
+
+
+def get_window(
+    start: Optional[datetime] = Query(None, description="Start of the time range (UTC, inclusive); default: first reading"),
+    end: Optional[datetime] = Query(None, description="End of the time range (UTC, exclusive); default: last reading"),
+    granularity: Granularity = Query(Granularity.month, description="Bucket size: hour, day, month or year"),
+) -> Window:
+    try:
+        return Window(to_utc(start), to_utc(end), granularity)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def _cached(key, compute, bypass: bool = False):
+    # Raw-row requests are for verifying the rollup, so never serve them from cache
+    if bypass:
+        return await compute()
+    return await cache.energy_cache.aget_or_set(key, compute)
+
+
+async def _load_cube(db: AsyncSession, scope: Scope, window: Window, raw: bool, dims: Dimensions) -> EnergyCube:
+    """The (type, source, bucket) cube every view is derived from, one query for all types."""
+    with phase("cube"):
+        return await _cached(
+            ("cube", scope.versions, None, None, window),
+            # The query layer is shared with the sync scripts; run_sync executes it
+            # on the async connection without a worker thread.
+            lambda: db.run_sync(load_energy_cube, window, use_rollup=not raw, dims=dims, site_ids=scope.site_ids),
+            bypass=raw,
+        )
+
+
+async def warm_cache(db: AsyncSession) -> None:
+    """Load the registry and the data versions, as the first request would.
+
+    Cubes are per scope, so they are left to the first request of each.
+    """
+    await db.run_sync(registry.get)
+    await cache.energy_cache.aget_or_set(cache.VERSIONS_KEY, lambda: db.run_sync(cache.data_versions))
+
+
+def _kwh(cents: np.ndarray) -> List[float]:
+    return (cents / 100).tolist()
 
-def _pivot_by_month_and_source(raw: List) -> Dict[int, Dict[str, float]]:
-    pivot: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
-    for month, kwh, source, _ in raw:
-        pivot[month][source] += float(kwh)
-    return pivot
 
-@router.get("/trends", response_model=List[TrendsPoint], summary="Monthly trends per source for a given energy type")
-def get_trends(
+def _buckets(series: np.ndarray, max_points: Optional[int], method: Downsampling) -> np.ndarray:
+    """Indices of the buckets to return: all of them, or those ``method`` keeps."""
+    if max_points is None:
+        return np.arange(series.shape[1])
+    return keep(series, max_points, method)
+
+
+def _trends_rows(
+    cube: EnergyCube, energy_type: str, max_points: Optional[int] = None, method: Downsampling = Downsampling.lttb,
+) -> List[Dict]:
+    # One column per registered source, so new sources show up without code changes
+    cents, _ = cube.type_slice(energy_type)
+    labels = cube.labels()
+    kept = _buckets(cents, max_points, method)
+    return [
+        {"month": labels[b], **dict(zip(cube.sources, kwh))}
+        for b, kwh in zip(kept.tolist(), _kwh(cents[:, kept].T))
+    ]
+
+
+def _summary_rows(cube: EnergyCube, energy_type: str) -> List[Dict]:
+    cents, counts = cube.type_slice(energy_type)
+    present = np.flatnonzero(counts.sum(axis=1))
+    totals = _kwh(cents.sum(axis=1)[present])
+    return [{"source": cube.sources[i], "kwh": kwh} for i, kwh in zip(present, totals)]
+
+
+def _composed_rows(
+    cube: EnergyCube, energy_type: str, highlight: str,
+    max_points: Optional[int] = None, method: Downsampling = Downsampling.lttb,
+) -> List[Dict]:
+    cents, _ = cube.type_slice(energy_type)
+    totals = cents.sum(axis=0)
+    highlighted = cents[cube.sources.index(highlight)] if highlight in cube.sources else np.zeros_like(totals)
+    labels = cube.labels()
+    kept = _buckets(np.vstack([totals, highlighted]), max_points, method)
+    return [
+        {"month": labels[b], "total": total, "highlight": value}
+        for b, total, value in zip(kept.tolist(), _kwh(totals[kept]), _kwh(highlighted[kept]))
+    ]
+
+
+@router.get("/trends", response_model=List[TrendsPoint], responses=MSGPACK_RESPONSE, summary="Monthly trends per source for a given energy type")
+async def get_trends(
+    energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
+    raw: bool = Query(False, description="Aggregate raw tracks instead of the monthly rollup (uncached)"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample to at most this many rows; default: one row per bucket"),
+    downsampling: Downsampling = Query(Downsampling.lttb, description="lttb (keeps the shape of each line) or minmax (keeps every peak and trough)"),
+    window: Window = Depends(get_window),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
+):
+    async def compute():
+        return _trends_rows(await _load_cube(db, scope, window, raw, dims), energy_type, max_points, downsampling)
+
+    # Downsampled rows are cheap to derive from the cached cube, so only full resolution is cached
+    with phase("rows"):
+        rows = await _cached(("trends", scope.versions, energy_type, None, window), compute, bypass=raw or max_points is not None)
+    return encoded_response(rows, media_type, validators)
+
+@router.get("/composition", response_model=List[CompositionPoint], responses=MSGPACK_RESPONSE, summary="Stacked‐bar data: monthly composition by source")
+async def get_composition(
+    energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
+    raw: bool = Query(False, description="Aggregate raw tracks instead of the monthly rollup (uncached)"),
+    window: Window = Depends(get_window),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
+):
+    return await get_trends(
+        energy_type=energy_type, raw=raw, max_points=None, downsampling=Downsampling.lttb,
+        window=window, scope=scope, db=db, dims=dims, media_type=media_type, validators=validators, current_user=current_user,
+    )
+
+@router.get("/summary", response_model=List[SummaryPoint], responses=MSGPACK_RESPONSE, summary="Total kWh per source over all months for a type")
+async def get_summary(
     energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    raw: bool = Query(False, description="Aggregate raw tracks instead of the monthly rollup (uncached)"),
+    window: Window = Depends(get_window),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    raw = db.query(
-        EnergyTrack.month,
-        EnergyTrack.kwh,
-        EnergySource.name.label("source"),
-        EnergyType.name.label("type"),
-    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
-     .join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
-     .filter(EnergyType.name == energy_type) \
-     .all()
-
-    pivot = _pivot_by_month_and_source(raw)
-    out: List[Dict] = []
-    for m in range(1, 13):
-        row = {"month": _MONTH_NAMES[m - 1]}
-        sources = pivot.get(m, {})
-        for src in ["solar", "tidal", "grid", "hydro", "geothermal"]:
-            row[src] = sources.get(src, 0.0)
-        out.append(row)
-    return out
-
-@router.get("/composition", response_model=List[CompositionPoint], summary="Stacked‐bar data: monthly composition by source")
-def get_composition(
+    async def compute():
+        return _summary_rows(await _load_cube(db, scope, window, raw, dims), energy_type)
+
+    with phase("rows"):
+        rows = await _cached(("summary", scope.versions, energy_type, None, window), compute, bypass=raw)
+    return encoded_response(rows, media_type, validators)
+
+@router.get("/composed", response_model=List[ComposedPoint], responses=MSGPACK_RESPONSE, summary="Combined bar+line: total + highlighted source per month")
+async def get_composed(
     energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    highlight: str = Query(..., description="Source to single out, e.g. solar"),
+    raw: bool = Query(False, description="Aggregate raw tracks instead of the monthly rollup (uncached)"),
+    max_points: Optional[int] = Query(None, ge=3, description="Downsample to at most this many rows; default: one row per bucket"),
+    downsampling: Downsampling = Query(Downsampling.lttb, description="lttb (keeps the shape of each line) or minmax (keeps every peak and trough)"),
+    window: Window = Depends(get_window),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    return get_trends(energy_type, db)
+    async def compute():
+        return _composed_rows(await _load_cube(db, scope, window, raw, dims), energy_type, highlight, max_points, downsampling)
 
-@router.get("/summary", response_model=List[SummaryPoint], summary="Total kWh per source over all months for a type")
-def get_summary(
+    with phase("rows"):
+        rows = await _cached(("composed", scope.versions, energy_type, highlight, window), compute, bypass=raw or max_points is not None)
+    return encoded_response(rows, media_type, validators)
+
+@router.get("/dashboard", response_model=DashboardOut, responses=MSGPACK_RESPONSE, summary="Trends, composition, summary and composed data in one response")
+async def get_dashboard(
     energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    highlight: str = Query(..., description="Source to single out, e.g. solar"),
+    raw: bool = Query(False, description="Aggregate raw tracks instead of the monthly rollup (uncached)"),
+    window: Window = Depends(get_window),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
+):
+    async def compute():
+        cube = await _load_cube(db, scope, window, raw, dims)
+        trends = _trends_rows(cube, energy_type)
+        return {
+            "trends": trends,
+            "composition": trends,
+            "summary": _summary_rows(cube, energy_type),
+            "composed": _composed_rows(cube, energy_type, highlight),
+        }
+
+    with phase("rows"):
+        payload = await _cached(("dashboard", scope.versions, energy_type, highlight, window), compute, bypass=raw)
+    return encoded_response(payload, media_type, validators)
+
+@router.get("/anomalies", response_model=List[AnomalyPoint], responses=MSGPACK_RESPONSE, summary="Months and recent readings that stray from their seasonal baseline")
+async def get_anomalies(
+    energy_type: Optional[str] = Query(None, description="Only this type; default: both"),
+    source: Optional[str] = Query(None, description="Only this source"),
+    threshold: float = Query(DEFAULT_THRESHOLD, gt=0, description="Flag deviations of more than this many standard deviations"),
+    start: Optional[datetime] = Query(None, description="Only months that end after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only months that start before this time (UTC)"),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    raw = db.query(
-        EnergyTrack.kwh,
-        EnergySource.name.label("source"),
-        EnergyType.name.label("type"),
-    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
-     .join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
-     .filter(EnergyType.name == energy_type) \
-     .all()
-
-    totals: Dict[str, float] = defaultdict(float)
-    for kwh, src, _ in raw:
-        totals[src] += float(kwh)
-
-    return [{"source": src, "kwh": val} for src, val in totals.items()]
-
-@router.get("/composed", response_model=List[ComposedPoint], summary="Combined bar+line: total + highlighted source per month")
-def get_composed(
+    window = get_window(start, end, Granularity.month)
+
+    async def compute():
+        return await db.run_sync(find_anomalies, dims, scope.site_ids, energy_type, source, window, threshold)
+
+    # The stats are written with the tracks, so the scope's versions cover them
+    with phase("rows"):
+        rows = await _cached(("anomalies", scope.versions, energy_type, source, window, threshold), compute)
+    return encoded_response(rows, media_type, validators)
+
+@router.get("/percentiles", response_model=List[PercentilePoint], responses=MSGPACK_RESPONSE, summary="Percentiles and peak of single readings per source and period")
+async def get_percentiles(
     energy_type: str = Query(..., description="‘consumption’ or ‘generation’"),
-    highlight: str = Query(..., description="One of solar|tidal|grid|hydro|geothermal"),
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    source: Optional[str] = Query(None, description="Only this source"),
+    q: Optional[List[float]] = Query(None, description="Quantiles to return, e.g. 0.999; default: 0.5, 0.95 and 0.99"),
+    start: Optional[datetime] = Query(None, description="Start of the time range (UTC, inclusive, a month boundary); default: first reading"),
+    end: Optional[datetime] = Query(None, description="End of the time range (UTC, exclusive, a month boundary); default: last reading"),
+    granularity: Optional[Granularity] = Query(None, description="month or year: one row per source and bucket; default: one row per source"),
+    scope: Scope = Depends(get_scope),
+    db: AsyncSession = Depends(get_read_db),
+    dims: Dimensions = Depends(get_dimensions),
+    media_type: str = Depends(get_media_type),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
 ):
-    raw = db.query(
-        EnergyTrack.month,
-        EnergyTrack.kwh,
-        EnergySource.name.label("source"),
-        EnergyType.name.label("type"),
-    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
-     .join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
-     .filter(EnergyType.name == energy_type) \
-     .all()
-
-    pivot = _pivot_by_month_and_source(raw)
-    out: List[Dict] = []
-    for m in range(1, 13):
-        month_data = pivot.get(m, {})
-        total = sum(month_data.values())
-        out.append({
-            "month": _MONTH_NAMES[m - 1],
-            "total": total,
-            "highlight": month_data.get(highlight, 0.0),
-        })
-    return out
+    if granularity not in (None, Granularity.month, Granularity.year):
+        raise HTTPException(status_code=400, detail="Percentiles are kept per month; use granularity=month or year")
+    window = get_window(start, end, granularity or Granularity.month)
+    if not window.month_aligned():
+        raise HTTPException(status_code=400, detail="start and end must be month boundaries")
+    if q and not all(0 <= value <= 1 for value in q):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+    quantiles = tuple(sorted(set(q))) if q else DEFAULT_QUANTILES
+
+    async def compute():
+        return await db.run_sync(
+            find_percentiles, dims, scope.site_ids, energy_type, source, window, granularity, quantiles,
+        )
+
+    # The sketches are written with the tracks, so the scope's versions cover them
+    with phase("rows"):
+        rows = await _cached(("percentiles", scope.versions, energy_type, source, window, granularity, quantiles), compute)
+    return encoded_response(rows, media_type, validators)
+
+@router.get("/export", summary="Stream raw tracks as CSV, NDJSON or Arrow IPC")
+async def export_tracks(
+    format: ExportFormat = Query(ExportFormat.csv, description="csv, ndjson or arrow (Arrow IPC stream)"),
+    energy_type: Optional[str] = Query(None, description="Only tracks of this type"),
+    source: Optional[str] = Query(None, description="Only tracks from this source"),
+    start: Optional[datetime] = Query(None, description="Only tracks starting at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only tracks starting before this time (UTC)"),
+    scope: Scope = Depends(get_scope),
+    sessionmaker: async_sessionmaker = Depends(get_read_sessionmaker),
+    dims: Dimensions = Depends(get_dimensions),
+    validators: dict = Depends(check_not_modified),
+    current_user: TokenData = Depends(get_current_claims),
+):
+    window = get_window(start, end, Granularity.month)
+    stmt = export_query(dims, scope.site_ids, energy_type, source, window.start, window.end) \
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    encoder = ENCODERS[format]()
+
+    async def body():
+        # A server-side cursor, so only one batch of rows is held at a time
+        async with sessionmaker() as db:
+            result = await db.stream(stmt)
+            yield encoder.begin()
+            async for rows in result.partitions():
+                yield encoder.encode(labelled(rows, dims))
+            yield encoder.end()
+
+    return StreamingResponse(
+        body(),
+        media_type=encoder.media_type,
+        headers={**validators, "Content-Disposition": f'attachment; filename="energy_tracks.{encoder.extension}"'},
+    )
@@ -0,0 +1,21 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.metrics import render
+
+router = APIRouter(tags=["monitoring"])
+
+# Optional bearer token for scrapers; without it /metrics is open like "/"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return Response(render(), media_type=CONTENT_TYPE_LATEST)
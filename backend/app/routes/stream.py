@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import Optional
+
+from app.core.authentication import get_current_claims
+from app.core.authorization import user_site_ids
+from app.database import get_sessionmaker
+from app.schemas import TokenData
+from app.stream import hub
+
+# Not part of the /energy router: a stream has no ETag and is never a 304
+router = APIRouter(prefix="/energy", tags=["energy"])
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+    summary="Server-Sent Events with the monthly cells that changed",
+)
+async def stream_changes(
+    energy_type: Optional[str] = Query(None, description="Only cells of this type; default: all"),
+    sessionmaker: async_sessionmaker = Depends(get_sessionmaker),
+    current_user: TokenData = Depends(get_current_claims),
+):
+    """``delta`` events carry ``{"version", "cells": [{"site", "type", "source", "month", "kwh"}]}``
+    with the current kWh of every (site, type, source, month) cell written
+    since the previous event, for the sites the caller can see. ``reset``
+    means the client missed changes and should refetch /energy/dashboard.
+    """
+    # A short-lived session: the stream itself holds no connection
+    async with sessionmaker() as db:
+        site_ids = await user_site_ids(db, current_user.user_id)
+    return StreamingResponse(
+        hub.subscribe(sessionmaker, energy_type, site_ids, current_user.user_id),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
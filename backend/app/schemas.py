@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from typing import Dict, Optional, List
 from fastapi import Form
 
 
@@ -46,20 +46,14 @@ class TokenData(BaseModel):
 
 
 class TrendsPoint(BaseModel):
-    month: str
-    solar: float
-    tidal: float
-    grid: float
-    hydro: float
-    geothermal: float
+    """``month`` plus one kWh field per registered source, e.g. ``solar``."""
+    model_config = ConfigDict(extra="allow")
+    __pydantic_extra__: Dict[str, float]
 
-class CompositionPoint(BaseModel):
     month: str
-    solar: float
-    tidal: float
-    grid: float
-    hydro: float
-    geothermal: float
+
+class CompositionPoint(TrendsPoint):
+    pass
 
 class SummaryPoint(BaseModel):
     source: str
@@ -68,4 +62,46 @@ class SummaryPoint(BaseModel):
 class ComposedPoint(BaseModel):
     month: str
     total: float
-    highlight: float
\ No newline at end of file
+    highlight: float
+
+class DashboardOut(BaseModel):
+    trends: List[TrendsPoint]
+    composition: List[CompositionPoint]
+    summary: List[SummaryPoint]
+    composed: List[ComposedPoint]
+
+class AnomalyPoint(BaseModel):
+    """A month, or a calendar month's recent readings, far from its seasonal baseline.
+
+    For ``kind="month"``, ``month`` is e.g. ``Jun 2024`` and the kWh are the
+    month's total and the total expected from its number of readings. For
+    ``kind="recent"``, ``month`` is e.g. ``Jun`` and the kWh are per reading:
+    the recent (exponentially weighted) average and the long-run average.
+    """
+    site: str
+    type: str
+    source: str
+    kind: str
+    month: str
+    kwh: float
+    expected_kwh: float
+    z: float
+
+class PercentilePoint(BaseModel):
+    """Percentiles and peak of single readings of one source, over a period or the whole range.
+
+    ``period`` is a bucket label (``Jun 2024``, ``2024``) or ``None``. The
+    percentiles are within ``SKETCH_ACCURACY`` of the exact ones; ``peak_at``
+    is ``None`` when the peak reading was deleted since the last backfill.
+    Requested ``q`` values other than the defaults add fields, e.g. ``p99.9``.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    source: str
+    period: Optional[str] = None
+    count: int
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    peak_kwh: float
+    peak_at: Optional[str] = None
@@ -0,0 +1,80 @@
+"""Application settings, read from the environment (and ``.env``) once.
+
+``get_settings()`` loads them on first use, so importing the app does no
+I/O and does not fail when a variable is missing. The first request, script
+or ``create_app()`` call that needs them does. ``configure()`` installs
+explicit settings instead, e.g. ``create_app(Settings(...))`` in tests.
+
+Tuning knobs that belong to one module (cache sizes, pool sizes, hashing
+workers, profiling...) are still read by that module.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+
+class SettingsError(ValueError):
+    """A required setting is missing or malformed."""
+
+
+def _flag(value: Optional[str], default: bool = False) -> bool:
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class Settings:
+    db_url: str
+    secret_key: str = field(repr=False)
+    algorithm: str = "HS256"
+    access_token_expire_minutes: int = 30
+    # Defaults to the async driver matching ``db_url``
+    async_db_url: Optional[str] = None
+    # Read replicas for the /energy views (sync or async URLs); empty: read from the primary
+    replica_urls: Tuple[str, ...] = ()
+    cors_origins: Tuple[str, ...] = ("*",)
+    # Open pool connections and fill caches before serving
+    prewarm: bool = False
+
+    @classmethod
+    def from_env(cls, env=None) -> "Settings":
+        if env is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            env = os.environ
+        for name in ("DB_URL", "SECRET_KEY", "ALGORITHM", "ACCESS_TOKEN_EXPIRE_MINUTES"):
+            if not env.get(name):
+                raise SettingsError(f"{name} environment variable is required")
+        try:
+            expire_minutes = int(env["ACCESS_TOKEN_EXPIRE_MINUTES"])
+        except ValueError:
+            raise SettingsError("ACCESS_TOKEN_EXPIRE_MINUTES must be an integer")
+        return cls(
+            db_url=env["DB_URL"],
+            async_db_url=env.get("ASYNC_DB_URL") or None,
+            replica_urls=tuple(u.strip() for u in env.get("DB_REPLICA_URLS", "").split(",") if u.strip()),
+            secret_key=env["SECRET_KEY"],
+            algorithm=env["ALGORITHM"],
+            access_token_expire_minutes=expire_minutes,
+            cors_origins=tuple(o.strip() for o in env.get("CORS_ORIGINS", "*").split(",") if o.strip()),
+            prewarm=_flag(env.get("PREWARM")),
+        )
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """The configured settings, read from the environment the first time."""
+    global _settings
+    if _settings is None:
+        _settings = Settings.from_env()
+    return _settings
+
+
+def configure(settings: Optional[Settings]) -> None:
+    """Use ``settings`` from now on; ``None`` re-reads the environment on next use."""
+    global _settings
+    _settings = settings
@@ -0,0 +1,401 @@
+"""Live updates for the dashboard over Server-Sent Events (``GET /energy/stream``).
+
+Writers never talk to clients. When a transaction that changed
+``energy_monthly_rollup`` cells commits, the ``(site, type, source, year, month)``
+keys it touched (see app.utils.rollup) are published on a broker, by a
+session listener registered with the others in app.listeners. Every
+worker runs one :class:`StreamHub`, which collects the keys it hears about
+and, once per tick, reads the current value of each changed cell and fans a
+single ``delta`` event out to its subscribers:
+
+- a burst of writes within a tick becomes one delta, and the delta carries
+  absolute values, so clients stay correct without seeing every message,
+- subscribers are queues served by the event loop, so an idle connection
+  costs a coroutine and a few small objects, not a thread,
+- each subscriber only hears about the sites it may see, and each delta is
+  encoded once per (sites, energy type) pair, not once per subscriber. A
+  tick that finds the grants or sites changed re-reads its subscribers'
+  grants first, so a revoked site stops streaming at once,
+- a subscriber that falls ``SUBSCRIBER_BUFFER`` events behind, and everyone
+  after a full rollup rebuild or a tick whose cells couldn't be read, gets a
+  ``reset`` event instead and should refetch /energy/dashboard.
+
+The broker is chosen by ``ENERGY_STREAM_URL`` (default: ``ENERGY_CACHE_URL``):
+
+- ``memory://``: in-process pub/sub. Only writes made by the same worker
+  reach its subscribers, which is what the tests use.
+- ``redis://host:port/db``: Redis pub/sub, so writes from every worker and
+  from the seed/ingest scripts reach every subscriber. Needs the ``redis``
+  package.
+"""
+import asyncio
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.cache import ACCESS_VERSION, DIMENSIONS_VERSION, call_off_loop, data_version
+from app.core.authorization import granted_site_ids
+from app.models import EnergyMonthlyRollup
+from app.utils import rollup
+from app.utils.dimensions import registry, resolve
+from app.utils.periods import Granularity, label
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15.0
+SUBSCRIBER_BUFFER = 32
+# Cells read per query when a tick has many of them
+READ_BATCH = 500
+# Reconnection delay EventSource clients are told to use
+RETRY_MS = 3000
+
+Callback = Callable[[bytes], None]
+
+
+def sse(event_name: str, data: bytes, event_id: Optional[int] = None) -> bytes:
+    """One Server-Sent Events frame; ``data`` must be a single line."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_name}\n".encode() + b"data: " + data + b"\n\n"
+
+
+RESET = sse("reset", b"{}")
+KEEPALIVE = b": keep-alive\n\n"
+
+
+# ------------------ Brokers ------------------ #
+
+class Broker(ABC):
+    """Pub/sub for the changed-cell messages."""
+
+    @abstractmethod
+    def publish(self, message: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, callback: Callback) -> Callable[[], None]:
+        """Call ``callback`` (from any thread) with every message; returns the unsubscribe function."""
+
+
+class InMemoryBroker(Broker):
+    """Delivers messages synchronously to the subscribers of this process."""
+
+    def __init__(self):
+        self._callbacks: List[Callback] = []
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return unsubscribe
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub; each subscribing worker runs one listener thread."""
+
+    def __init__(self, client, channel: str = "energy-stream"):
+        self.client = client
+        self.channel = channel
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBroker":
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def publish(self, message):
+        # Commits of async sessions publish from the event loop
+        call_off_loop(self.client.publish, self.channel, message)
+
+    def subscribe(self, callback):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: lambda message: callback(message["data"])})
+        thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+        def unsubscribe():
+            thread.stop()
+            pubsub.close()
+
+        return unsubscribe
+
+
+def create_broker(url: Optional[str] = None) -> Broker:
+    url = url or os.getenv("ENERGY_STREAM_URL") or os.getenv("ENERGY_CACHE_URL", "memory://")
+    if url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker.from_url(url)
+    raise ValueError(f"Unsupported ENERGY_STREAM_URL: {url}")
+
+
+broker: Broker = create_broker()
+
+
+# ------------------ Publishing on commit ------------------ #
+
+def _publish_on_commit(session):
+    cells = session.info.pop(rollup.CHANGED_CELLS, None)
+    if session.info.pop(rollup.REBUILT, False):
+        broker.publish(orjson.dumps({"reset": True}))
+    elif cells:
+        broker.publish(orjson.dumps({"cells": sorted(cells)}))
+
+
+def _discard_on_rollback(session):
+    session.info.pop(rollup.CHANGED_CELLS, None)
+    session.info.pop(rollup.REBUILT, None)
+
+
+SESSION_LISTENERS = (("after_commit", _publish_on_commit), ("after_rollback", _discard_on_rollback))
+
+
+# ------------------ Reading cells ------------------ #
+
+def read_cells(session: Session, keys: Iterable[rollup.RollupKey]) -> Tuple[int, List[Dict]]:
+    """The tracks data version and the current kWh of each ``(site_id, type_id, source_id, year, month)`` cell.
+
+    Cells without a rollup row (all their tracks were deleted) come back as
+    ``0.0``; cells whose ids the dimension registry can't name are skipped.
+    """
+    keys = sorted(keys)
+    values = {}
+    for i in range(0, len(keys), READ_BATCH):
+        batch = keys[i:i + READ_BATCH]
+        rows = session.execute(
+            select(
+                EnergyMonthlyRollup.site_id,
+                EnergyMonthlyRollup.type_id,
+                EnergyMonthlyRollup.source_id,
+                EnergyMonthlyRollup.year,
+                EnergyMonthlyRollup.month,
+                EnergyMonthlyRollup.kwh,
+            ).where(tuple_(
+                EnergyMonthlyRollup.site_id,
+                EnergyMonthlyRollup.type_id,
+                EnergyMonthlyRollup.source_id,
+                EnergyMonthlyRollup.year,
+                EnergyMonthlyRollup.month,
+            ).in_(batch))
+        )
+        values.update({(site, t, s, y, m): kwh for site, t, s, y, m, kwh in rows})
+
+    dims = resolve(session, registry.get(session), {k[2] for k in keys}, {k[1] for k in keys}, {k[0] for k in keys})
+    cells = [
+        {
+            "site_id": site_id,
+            "site": dims.site_names[site_id],
+            "type": dims.type_names[type_id],
+            "source": dims.source_names[source_id],
+            # Same label as the month of a trends row
+            "month": label(year * 12 + month - 1, Granularity.month),
+            "kwh": float(values.get((site_id, type_id, source_id, year, month), 0)),
+        }
+        for site_id, type_id, source_id, year, month in keys
+        if site_id in dims.site_names and type_id in dims.type_names and source_id in dims.source_names
+    ]
+    return data_version(session).version, cells
+
+
+# ------------------ Fan-out ------------------ #
+
+@dataclass(eq=False)
+class Subscriber:
+    energy_type: Optional[str]
+    queue: asyncio.Queue
+    # None: every site
+    site_ids: Optional[FrozenSet[int]] = None
+    # Whose grants ``site_ids`` follows; None: they are fixed
+    user_id: Optional[int] = None
+
+    @property
+    def topic(self) -> Tuple[Optional[FrozenSet[int]], Optional[str]]:
+        return self.site_ids, self.energy_type
+
+
+class StreamHub:
+    """Coalesces changed cells per tick and fans them out to this worker's subscribers.
+
+    The hub subscribes to the broker when its first client connects and
+    unsubscribes when the last one leaves, so an unused worker holds no
+    broker connection. Cells are read through the session factory of the
+    first client of that period.
+    """
+
+    def __init__(self, broker: Broker, tick: float = DEFAULT_TICK_SECONDS, heartbeat: float = HEARTBEAT_SECONDS,
+                 buffer: int = SUBSCRIBER_BUFFER):
+        self.broker = broker
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self.buffer = buffer
+        self.deltas_sent = 0
+        self._subscribers: Set[Subscriber] = set()
+        self._pending: Set[rollup.RollupKey] = set()
+        self._reset = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sessionmaker: Optional[async_sessionmaker] = None
+        self._unsubscribe: Optional[Callable[[], None]] = None
+        # The grant and site versions the subscribers' sites were last read at
+        self._access: Optional[Tuple[int, int]] = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    async def subscribe(
+        self, sessionmaker: async_sessionmaker, energy_type: Optional[str] = None,
+        site_ids: Optional[Iterable[int]] = None, user_id: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        """SSE frames for one client, until it disconnects; keep-alive comments while idle.
+
+        Only cells of ``site_ids`` (default: every site) and ``energy_type``
+        (default: every type) are sent. With ``user_id``, ``site_ids`` are
+        the sites granted to that user, and follow their grants: a client
+        whose sites change gets a ``reset``.
+        """
+        subscriber = self._add(sessionmaker, energy_type, None if site_ids is None else frozenset(site_ids), user_id)
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+        finally:
+            self._remove(subscriber)
+
+    def _add(
+        self, sessionmaker: async_sessionmaker, energy_type: Optional[str], site_ids: Optional[FrozenSet[int]],
+        user_id: Optional[int],
+    ) -> Subscriber:
+        if not self._subscribers:
+            self._loop = asyncio.get_running_loop()
+            self._sessionmaker = sessionmaker
+            self._unsubscribe = self.broker.subscribe(self._on_message)
+        subscriber = Subscriber(energy_type, asyncio.Queue(self.buffer), site_ids, user_id)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def _remove(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if not self._subscribers:
+            self.close()
+
+    def close(self) -> None:
+        """Drop the broker subscription and anything not yet sent."""
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self._pending.clear()
+        self._reset = False
+        self._access = None
+
+    def _on_message(self, message: bytes) -> None:
+        # Brokers call from their own thread, or from whichever thread committed
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._collect, orjson.loads(message))
+
+    def _collect(self, message: dict) -> None:
+        if self._unsubscribe is None:
+            return
+        if message.get("reset"):
+            self._reset = True
+        self._pending.update(tuple(cell) for cell in message.get("cells", ()))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_after_tick())
+
+    async def _flush_after_tick(self) -> None:
+        await asyncio.sleep(self.tick)
+        keys, reset = self._pending, self._reset
+        # Messages arriving while the cells are read start the next tick
+        self._pending, self._reset, self._flusher = set(), False, None
+        if reset:
+            for subscriber in self._subscribers:
+                self._send(subscriber, RESET)
+            return
+        try:
+            async with self._sessionmaker() as db:
+                access, grants = await db.run_sync(self._read_grants)
+                version, cells = await db.run_sync(read_cells, keys)
+        except Exception:
+            # These cells are lost: every client has to refetch to catch up
+            logger.exception("Reading %d changed cells failed; resetting %d subscribers", len(keys), len(self))
+            for subscriber in self._subscribers:
+                self._send(subscriber, RESET)
+            return
+        if grants is not None:
+            self._regrant(grants)
+        self._access = access
+        self._broadcast(self._frames(version, cells))
+
+    def _read_grants(self, session: Session) -> Tuple[Tuple[int, int], Optional[Dict[int, FrozenSet[int]]]]:
+        """The grant and site versions, and each subscribed user's sites if either changed since the last tick."""
+        access = (data_version(session, ACCESS_VERSION).version, data_version(session, DIMENSIONS_VERSION).version)
+        if access == self._access:
+            return access, None
+        users = {s.user_id for s in self._subscribers if s.user_id is not None}
+        return access, {user_id: frozenset(granted_site_ids(session, user_id)) for user_id in users}
+
+    def _regrant(self, grants: Dict[int, FrozenSet[int]]) -> None:
+        for subscriber in self._subscribers:
+            if subscriber.user_id in grants and grants[subscriber.user_id] != subscriber.site_ids:
+                subscriber.site_ids = grants[subscriber.user_id]
+                # What it was sent so far no longer matches what it may see
+                self._send(subscriber, RESET)
+
+    def _frames(self, version: int, cells: List[Dict]) -> Dict[tuple, bytes]:
+        """One encoded delta for every (sites, energy type) pair subscribers filter on."""
+        frames = {}
+        for site_ids, energy_type in {s.topic for s in self._subscribers}:
+            selected = [
+                {k: v for k, v in c.items() if k != "site_id"} for c in cells
+                if (site_ids is None or c["site_id"] in site_ids) and energy_type in (None, c["type"])
+            ]
+            if selected:
+                frames[site_ids, energy_type] = sse(
+                    "delta", orjson.dumps({"version": version, "cells": selected}), version,
+                )
+        return frames
+
+    def _broadcast(self, frames: Dict[tuple, bytes]) -> None:
+        for subscriber in self._subscribers:
+            frame = frames.get(subscriber.topic)
+            if frame is not None:
+                self._send(subscriber, frame)
+        if frames:
+            self.deltas_sent += 1
+
+    def _send(self, subscriber: Subscriber, frame: bytes) -> None:
+        try:
+            subscriber.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Too far behind for deltas to help: drop them and ask for a refetch
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(RESET)
+
+
+hub = StreamHub(broker, tick=float(os.getenv("ENERGY_STREAM_TICK", DEFAULT_TICK_SECONDS)))
@@ -0,0 +1,338 @@
+"""Online statistics of meter readings, and the anomalies they reveal.
+
+``energy_reading_stats`` has one row per (site, type, source, calendar
+month). Each row holds the count, mean and sum of squared deviations (M2)
+of the readings' kWh, kept with Welford's algorithm. It also holds their
+exponentially weighted mean in the order they were written (EWMA, with
+smoothing factor ``ANOMALY_EWMA_ALPHA``). The June row of a series is the
+seasonal baseline of its June readings across all years.
+
+The rows are kept in sync like the rollup:
+
+- a ``before_flush`` listener (see :func:`app.listeners.register`) covers
+  tracks written through the ORM,
+- bulk loaders pass their readings to :func:`apply_readings` as NumPy arrays,
+- :func:`backfill_stats` recomputes the table from the whole history in
+  vectorised batches.
+
+Deleting a reading removes it from the count, mean and M2 exactly. The EWMA
+has no inverse, so it keeps the reading until newer ones outweigh it.
+
+:func:`find_anomalies` reads only the stats rows, plus the rollup cells it
+judges, so each series costs O(1). It flags:
+
+- ``month``: a (year, month) whose mean reading is more than ``threshold``
+  standard errors away from the same calendar month in the other years,
+- ``recent``: a calendar month whose EWMA is more than ``threshold`` times
+  its own standard deviation, ``σ·√(α / (2 − α))``, away from the month's
+  mean (an EWMA control chart). An example is the readings being ingested
+  for this June falling short of earlier Junes.
+"""
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, and_, cast, delete, extract, false, insert, select
+from sqlalchemy.orm import Session
+
+from app.cache import mark_tracks_changed
+from app.models import EnergyMonthlyRollup, EnergyReadingStats, EnergyTrack
+from app.utils.dimensions import Dimensions, registry, resolve
+from app.utils.periods import Granularity, Window, label
+from app.utils.rollup import RollupKey, collect_readings, lock_rows
+
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", 0.05))
+DEFAULT_THRESHOLD = 3.0
+# A baseline of fewer readings says too little about their spread
+MIN_BASELINE_READINGS = 10
+BACKFILL_BATCH_SIZE = 100_000
+
+StatsKey = Tuple[int, int, int, int]  # (site_id, type_id, source_id, month)
+Stats = Tuple[int, float, float, float]  # (count, mean, m2, ewma)
+
+_EMPTY: Stats = (0, 0.0, 0.0, 0.0)
+# The columns of a rollup key that make up a stats key
+_SERIES = [0, 1, 2, 4]
+_MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+class Summary(NamedTuple):
+    """What a batch of readings of one series adds to its stats row."""
+    count: int
+    mean: float
+    m2: float
+    first: float  # starts the EWMA of a series without readings
+    decay: float  # (1 - α) ** count, the weight the batch leaves to the previous EWMA
+    ew_sum: float  # the batch's own weighted contribution to the EWMA
+
+
+def stats_key(cell: RollupKey) -> StatsKey:
+    """The stats row the readings of a rollup cell count towards."""
+    site_id, type_id, source_id, _, month = cell
+    return (site_id, type_id, source_id, month)
+
+
+def summarize(keys, kwh, alpha: float = ANOMALY_EWMA_ALPHA) -> Dict[StatsKey, Summary]:
+    """Per-series summaries of readings in write order, in one vectorised pass.
+
+    ``keys`` is an ``(n, 4)`` array of (site_id, type_id, source_id, month)
+    and ``kwh`` the ``n`` readings.
+    """
+    kwh = np.asarray(kwh, dtype=np.float64)
+    if not len(kwh):
+        return {}
+    series, inverse = np.unique(np.asarray(keys, dtype=np.int64).reshape(-1, 4), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse)
+    means = np.bincount(inverse, weights=kwh) / counts
+    m2 = np.bincount(inverse, weights=(kwh - means[inverse]) ** 2)
+
+    # Position of each reading within its series; the last one weighs α,
+    # the one before α(1 - α), and so on
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.empty_like(inverse)
+    position[order] = np.arange(len(kwh)) - np.repeat(starts, counts)
+    weights = alpha * (1 - alpha) ** (counts[inverse] - 1 - position)
+    ew_sum = np.bincount(inverse, weights=weights * kwh)
+
+    first = kwh[order[starts]]
+    decay = (1 - alpha) ** counts
+    return {
+        tuple(key): Summary(*values)
+        for key, values in zip(series.tolist(), zip(*(
+            column.tolist() for column in (counts, means, m2, first, decay, ew_sum)
+        )))
+    }
+
+
+def combine(stats: Stats, summary: Summary) -> Stats:
+    """``stats`` with a batch of newer readings added (Chan et al.'s parallel Welford update)."""
+    count, mean, m2, ewma = stats
+    if count == 0:
+        # Starting from the first reading makes it the EWMA after one step
+        ewma = summary.first
+    total = count + summary.count
+    delta = summary.mean - mean
+    return (
+        total,
+        mean + delta * summary.count / total,
+        m2 + summary.m2 + delta * delta * count * summary.count / total,
+        summary.decay * ewma + summary.ew_sum,
+    )
+
+
+def remove(stats: Stats, value: float) -> Stats:
+    """``stats`` without one reading of ``value``; the EWMA is left as is."""
+    count, mean, m2, ewma = stats
+    if count <= 1:
+        return _EMPTY
+    rest = (count * mean - value) / (count - 1)
+    return (count - 1, rest, max(m2 - (value - rest) * (value - mean), 0.0), ewma)
+
+
+def _values(row: EnergyReadingStats) -> Stats:
+    return (row.count, row.mean, row.m2, row.ewma)
+
+
+def update_stats(
+    session: Session,
+    summaries: Dict[StatsKey, Summary],
+    removed: Optional[Dict[StatsKey, List[float]]] = None,
+) -> None:
+    """Remove ``removed`` readings from, then add ``summaries`` to, the matching stats rows.
+
+    The rows are locked while they are merged (see :func:`app.utils.rollup.lock_rows`).
+    """
+    removed = removed or {}
+    with session.no_autoflush:
+        rows = lock_rows(session, EnergyReadingStats, set(summaries) | set(removed))
+        for key in sorted(set(summaries) | set(removed)):
+            row = rows.get(key)
+            stats = _EMPTY if row is None else _values(row)
+            for value in removed.get(key, ()):
+                stats = remove(stats, value)
+            if key in summaries:
+                stats = combine(stats, summaries[key])
+
+            if stats[0] == 0:
+                if row is not None:
+                    session.delete(row)
+                continue
+            if row is None:
+                site_id, type_id, source_id, month = key
+                row = EnergyReadingStats(site_id=site_id, type_id=type_id, source_id=source_id, month=month)
+                session.add(row)
+            row.count, row.mean, row.m2, row.ewma = stats
+
+
+def apply_readings(session: Session, keys, kwh) -> None:
+    """Add bulk-loaded readings to their stats rows; ``keys`` are their rollup cells."""
+    update_stats(session, summarize(np.asarray(keys, dtype=np.int64).reshape(-1, 5)[:, _SERIES], kwh))
+
+
+def _update_stats(session, flush_context, instances):
+    added, removed = collect_readings(session)
+    if added or removed:
+        mark_tracks_changed(session, {cell[0] for cell, _, _ in added + removed})
+        summaries = summarize([stats_key(cell) for cell, _, _ in added], [kwh for _, _, kwh in added])
+        by_series = defaultdict(list)
+        for cell, _, kwh in removed:
+            by_series[stats_key(cell)].append(kwh)
+        update_stats(session, summaries, by_series)
+
+
+SESSION_LISTENERS = (("before_flush", _update_stats),)
+
+
+def backfill_stats(db: Session, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Recompute ``energy_reading_stats`` from every track, oldest first; returns the number of readings.
+
+    Tracks are read with a server-side cursor, ``batch_size`` at a time, and
+    each batch is summarised with NumPy before it is merged into the totals.
+    """
+    month = cast(extract("month", EnergyTrack.start_time), Integer)
+    stmt = select(
+        EnergyTrack.site_id, EnergyTrack.type_id, EnergyTrack.source_id, month, EnergyTrack.kwh,
+    ).order_by(EnergyTrack.start_time, EnergyTrack.id).execution_options(yield_per=batch_size)
+
+    totals: Dict[StatsKey, Stats] = {}
+    readings = 0
+    for rows in db.execute(stmt).partitions():
+        batch = np.array(rows, dtype=np.float64)
+        for key, summary in summarize(batch[:, :4].astype(np.int64), batch[:, 4]).items():
+            totals[key] = combine(totals.get(key, _EMPTY), summary)
+        readings += len(batch)
+
+    db.execute(delete(EnergyReadingStats))
+    if totals:
+        db.execute(insert(EnergyReadingStats), [
+            {"site_id": key[0], "type_id": key[1], "source_id": key[2], "month": key[3],
+             "count": count, "mean": mean, "m2": m2, "ewma": ewma}
+            for key, (count, mean, m2, ewma) in totals.items()
+        ])
+    # Cached anomalies of every site are now stale
+    mark_tracks_changed(db)
+    db.commit()
+    return readings
+
+
+# ------------------ Detection ------------------ #
+
+def _filters(table, dims: Dimensions, site_ids: Optional[Sequence[int]], energy_type, source) -> list:
+    filters = []
+    if site_ids is not None:
+        filters.append(table.site_id.in_(site_ids))
+    if energy_type is not None:
+        type_id = dims.types.get(energy_type)
+        filters.append(table.type_id == type_id if type_id is not None else false())
+    if source is not None:
+        source_id = dims.sources.get(source)
+        filters.append(table.source_id == source_id if source_id is not None else false())
+    return filters
+
+
+def _rows(columns: Dict[str, np.ndarray], flagged: np.ndarray, kind: str, labels: Iterable[str],
+          kwh: np.ndarray, expected: np.ndarray, z: np.ndarray, dims: Dimensions) -> List[dict]:
+    return [
+        {
+            "site": dims.site_names.get(site_id),
+            "type": dims.type_names.get(type_id),
+            "source": dims.source_names.get(source_id),
+            "kind": kind,
+            "month": month,
+            "kwh": round(value, 2),
+            "expected_kwh": round(baseline, 2),
+            "z": round(score, 2),
+        }
+        for site_id, type_id, source_id, month, value, baseline, score in zip(
+            columns["site_id"][flagged].tolist(), columns["type_id"][flagged].tolist(),
+            columns["source_id"][flagged].tolist(), [m for m, keep in zip(labels, flagged) if keep],
+            kwh[flagged].tolist(), expected[flagged].tolist(), z[flagged].tolist(),
+        )
+    ]
+
+
+def _flagged(z: np.ndarray, baseline: np.ndarray, threshold: float) -> np.ndarray:
+    """Scores past ``threshold`` with a baseline of enough readings to trust."""
+    valid = (baseline >= MIN_BASELINE_READINGS) & np.isfinite(z)
+    return valid & (np.abs(np.where(valid, z, 0)) > threshold)
+
+
+def _columns(result, names: Sequence[str]) -> Dict[str, np.ndarray]:
+    rows = np.array(result.all(), dtype=np.float64).reshape(-1, len(names))
+    return {name: rows[:, i] for i, name in enumerate(names)}
+
+
+def find_anomalies(
+    db: Session,
+    dims: Optional[Dimensions] = None,
+    site_ids: Optional[Sequence[int]] = None,
+    energy_type: Optional[str] = None,
+    source: Optional[str] = None,
+    window: Window = Window(),
+    threshold: float = DEFAULT_THRESHOLD,
+    alpha: float = ANOMALY_EWMA_ALPHA,
+) -> List[dict]:
+    """Months and recent readings of ``site_ids`` (default: every site) that stray from their baseline.
+
+    ``month`` anomalies are looked for in the months that overlap ``window``;
+    ``recent`` ones always describe the latest readings. Each row has the
+    site, type and source names, the ``kind``, the ``month`` (``Jun 2024`` or,
+    for ``recent``, ``Jun``), ``kwh`` and ``expected_kwh``, and the score
+    ``z``. For a month they are its total and the total its readings would
+    have at the baseline's mean; for ``recent`` they are the EWMA and the
+    mean of a single reading. Rows are ordered by ``|z|``, largest first.
+    """
+    dims = dims or registry.get(db)
+    stats = EnergyReadingStats
+    rollup = EnergyMonthlyRollup
+
+    # month: one row per rollup cell, with its calendar month's stats row
+    ordinal = rollup.year * 12 + rollup.month - 1
+    window_filters = []
+    if window.start is not None:
+        window_filters.append(ordinal >= Window(window.start, None, Granularity.month).first_ordinal())
+    if window.end is not None:
+        window_filters.append(ordinal <= Window(None, window.end, Granularity.month).last_ordinal())
+    names = ("site_id", "type_id", "source_id", "ordinal", "kwh", "track_count", "count", "mean", "m2")
+    cells = _columns(db.execute(
+        select(rollup.site_id, rollup.type_id, rollup.source_id, ordinal, rollup.kwh, rollup.track_count,
+               stats.count, stats.mean, stats.m2)
+        .join(stats, and_(stats.site_id == rollup.site_id, stats.type_id == rollup.type_id,
+                          stats.source_id == rollup.source_id, stats.month == rollup.month))
+        .where(*_filters(rollup, dims, site_ids, energy_type, source), *window_filters)
+    ), names)
+    n, n_month, total = cells["count"], cells["track_count"], cells["kwh"]
+    rest = n - n_month
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(cells["m2"] / (n - 1))
+        rest_mean = (n * cells["mean"] - total) / rest
+        month_z = (total / n_month - rest_mean) / (sigma * np.sqrt(1 / n_month + 1 / rest))
+    month_flagged = _flagged(month_z, rest, threshold)
+
+    # recent: the stats rows alone
+    names = ("site_id", "type_id", "source_id", "month", "count", "mean", "m2", "ewma")
+    series = _columns(db.execute(
+        select(*(getattr(stats, name) for name in names))
+        .where(*_filters(stats, dims, site_ids, energy_type, source))
+    ), names)
+    n = series["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(series["m2"] / (n - 1)) * np.sqrt(alpha / (2 - alpha))
+        recent_z = (series["ewma"] - series["mean"]) / sigma
+    recent_flagged = _flagged(recent_z, n, threshold)
+
+    dims = resolve(
+        db, dims,
+        np.concatenate([cells["source_id"], series["source_id"]]).astype(int),
+        np.concatenate([cells["type_id"], series["type_id"]]).astype(int),
+        np.concatenate([cells["site_id"], series["site_id"]]).astype(int),
+    )
+    rows = _rows(cells, month_flagged, "month", [label(int(o), Granularity.month) for o in cells["ordinal"]],
+                 total, rest_mean * n_month, month_z, dims)
+    rows += _rows(series, recent_flagged, "recent", [_MONTH_NAMES[int(m) - 1] for m in series["month"]],
+                  series["ewma"], series["mean"], recent_z, dims)
+    rows.sort(key=lambda r: -abs(r["z"]))
+    return rows
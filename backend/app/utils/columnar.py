@@ -0,0 +1,209 @@
+"""Columnar aggregation of energy tracks into a dense NumPy cube.
+
+The database returns one grouped row per (type, source, time bucket) over the
+requested sites, read from ``energy_tracks`` (or the rollup) alone; names come
+from the dimension registry. Both tables lead their indexes with ``site_id``,
+so one site's query reads that site's rows only, however many sites share the
+tables. Those rows are fetched into typed columns and scattered into an
+``int64`` array of shape ``(types, sources, buckets)`` that holds kWh in
+cents. Keeping cents as integers makes every sum exact to the cent. Every
+/energy view is a slice or a sum over that array, so no view builds
+dictionaries row by row.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models import EnergyMonthlyRollup, EnergyTrack
+from app.utils.dimensions import Dimensions, registry, resolve
+from app.utils.periods import Granularity, Window, bucket, from_ordinal, label, ordinal
+
+# Upper bound on the time axis, e.g. a bit over a year of hours
+MAX_BUCKETS = 10_000
+
+# Typed columns the grouped rows are read into
+ROW_DTYPE = np.dtype([
+    ("type_id", np.int32),
+    ("source_id", np.int32),
+    ("bucket", np.int64),
+    ("cents", np.int64),
+    ("count", np.int64),
+])
+
+Pivot = Dict[datetime, Dict[str, float]]
+
+
+class TooManyBuckets(ValueError):
+    """Raised when a window would need more than ``MAX_BUCKETS`` time buckets."""
+
+
+def aggregate(
+    type_codes: np.ndarray,
+    source_codes: np.ndarray,
+    bucket_codes: np.ndarray,
+    cents: np.ndarray,
+    shape: Tuple[int, int, int],
+    counts: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum ``cents`` (and ``counts``, default 1 per row) into ``(types, sources, buckets)`` arrays.
+
+    All codes are 0-based positions along their axis. Rows may repeat a cell;
+    they are added together.
+    """
+    n_types, n_sources, n_buckets = shape
+    size = n_types * n_sources * n_buckets
+    flat = (type_codes.astype(np.intp) * n_sources + source_codes) * n_buckets + bucket_codes
+
+    # np.add.at keeps the int64 sum exact; bincount's float64 weights would not
+    # past 2**53 cents
+    cent_totals = np.zeros(size, dtype=np.int64)
+    np.add.at(cent_totals, flat, cents.astype(np.int64, copy=False))
+    if counts is None:
+        count_totals = np.bincount(flat, minlength=size)
+    else:
+        count_totals = np.bincount(flat, weights=counts, minlength=size)
+
+    return cent_totals.reshape(shape), count_totals.astype(np.int64).reshape(shape)
+
+
+@dataclass(frozen=True)
+class EnergyCube:
+    """kWh (in cents) and track counts per (type, source, time bucket).
+
+    ``types`` and ``sources`` are sorted by name and give the meaning of the
+    first two axes; the third holds consecutive ``granularity`` buckets
+    starting at ordinal ``first``.
+    """
+    types: Tuple[str, ...]
+    sources: Tuple[str, ...]
+    granularity: Granularity
+    first: int
+    cents: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def n_buckets(self) -> int:
+        return self.cents.shape[2]
+
+    def periods(self) -> List[datetime]:
+        return [from_ordinal(self.first + i, self.granularity) for i in range(self.n_buckets)]
+
+    def labels(self) -> List[str]:
+        return [label(self.first + i, self.granularity) for i in range(self.n_buckets)]
+
+    def type_slice(self, energy_type: str) -> Tuple[np.ndarray, np.ndarray]:
+        """``(sources, buckets)`` cents and counts for one type; zeros for unknown types."""
+        if energy_type not in self.types:
+            empty = np.zeros(self.cents.shape[1:], dtype=np.int64)
+            return empty, empty
+        i = self.types.index(energy_type)
+        return self.cents[i], self.counts[i]
+
+    def pivot(self, energy_type: str) -> Pivot:
+        """``{bucket start: {source: kwh}}`` for the cells that have tracks."""
+        cents, counts = self.type_slice(energy_type)
+        periods = self.periods()
+        out: Pivot = {}
+        for s, b in zip(*np.nonzero(counts)):
+            out.setdefault(periods[b], {})[self.sources[s]] = int(cents[s, b]) / 100
+        return out
+
+
+def _codes(ids: Sequence[int], values: np.ndarray) -> np.ndarray:
+    """Map database ids in ``values`` to their position in ``ids``."""
+    lookup = np.full(max(ids) + 1, -1, dtype=np.int16)
+    lookup[np.asarray(ids)] = np.arange(len(ids), dtype=np.int16)
+    return lookup[values]
+
+
+def _check_size(n_buckets: int) -> None:
+    if n_buckets > MAX_BUCKETS:
+        raise TooManyBuckets(
+            f"The window spans {n_buckets} buckets (max {MAX_BUCKETS}); "
+            "narrow start/end or use a coarser granularity"
+        )
+
+
+def _grouped_query(window: Window, use_rollup: bool, site_ids: Optional[Sequence[int]] = None):
+    g = window.granularity
+    filters = []
+    if use_rollup:
+        table = EnergyMonthlyRollup
+        month = table.year * 12 + table.month - 1
+        key = table.year if g == Granularity.year else month
+        count = func.sum(table.track_count)
+        if window.start is not None:
+            filters.append(month >= ordinal(window.start, Granularity.month))
+        if window.end is not None:
+            filters.append(month < ordinal(window.end, Granularity.month))
+    else:
+        table = EnergyTrack
+        key = bucket(table.start_time, g)
+        count = func.count()
+        # Plain range predicates on start_time, so Postgres prunes partitions
+        if window.start is not None:
+            filters.append(table.start_time >= window.start)
+        if window.end is not None:
+            filters.append(table.start_time < window.end)
+
+    if site_ids is not None:
+        filters.append(table.site_id.in_(site_ids))
+
+    return select(
+        table.type_id,
+        table.source_id,
+        key,
+        cast(func.round(func.sum(table.kwh) * 100), BigInteger),
+        cast(count, BigInteger),
+    ).where(*filters).group_by(table.type_id, table.source_id, key)
+
+
+def load_energy_cube(
+    db: Session,
+    window: Window = Window(),
+    use_rollup: bool = True,
+    dims: Optional[Dimensions] = None,
+    site_ids: Optional[Sequence[int]] = None,
+) -> EnergyCube:
+    """Aggregate every energy type in ``window`` into an :class:`EnergyCube`.
+
+    Reads ``energy_monthly_rollup`` when ``use_rollup`` is set and the window
+    is month-aligned at month or year granularity; otherwise groups the raw
+    ``energy_tracks`` rows in the window. Open-ended windows span the buckets
+    that have data. The type and source axes are every name in ``dims``
+    (default: the registry's current snapshot). ``site_ids`` limits the
+    tracks to those sites, summed together (default: every site).
+    """
+    first, last = window.first_ordinal(), window.last_ordinal()
+    if first is not None and last is not None:
+        _check_size(last - first + 1)
+
+    rows = db.execute(_grouped_query(window, use_rollup and window.month_aligned(), site_ids))
+    columns = np.fromiter(map(tuple, rows), dtype=ROW_DTYPE)
+    dims = resolve(db, dims or registry.get(db), np.unique(columns["source_id"]), np.unique(columns["type_id"]))
+
+    if len(columns):
+        first = int(columns["bucket"].min()) if first is None else first
+        last = int(columns["bucket"].max()) if last is None else last
+    n_buckets = 0 if first is None or last is None else last - first + 1
+    _check_size(n_buckets)
+
+    type_names, source_names = tuple(dims.types), tuple(dims.sources)
+    shape = (len(type_names), len(source_names), n_buckets)
+    if not len(columns):
+        empty = np.zeros(shape, dtype=np.int64)
+        return EnergyCube(type_names, source_names, window.granularity, first or 0, empty, empty.copy())
+
+    cents, counts = aggregate(
+        _codes(list(dims.types.values()), columns["type_id"]),
+        _codes(list(dims.sources.values()), columns["source_id"]),
+        columns["bucket"] - first,
+        columns["cents"],
+        shape,
+        counts=columns["count"],
+    )
+    return EnergyCube(type_names, source_names, window.granularity, first, cents, counts)
@@ -0,0 +1,104 @@
+"""In-process registry of energy sources, types and sites.
+
+``energy_sources``, ``energy_types`` and ``sites`` are small and rarely
+change, so their name/id maps are held in memory. Queries resolve names to ids up front, filter
+``energy_tracks`` on ``type_id``/``source_id`` alone and label results from
+the registry, instead of joining the dimension tables every time.
+
+Each snapshot is tagged with the ``energy_dimensions`` data version, which
+every transaction writing any of the tables bumps (see app.cache). The registry
+reloads when a caller passes, or the database reports, a different version.
+Snapshots are kept per engine, so each database gets its own.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.cache import DIMENSIONS_VERSION, data_version
+from app.models import EnergySource, EnergyType, Site
+
+
+@dataclass(frozen=True)
+class Dimensions:
+    """Name → id maps for sources, types and sites, ordered by name."""
+    version: int
+    sources: Dict[str, int]
+    types: Dict[str, int]
+    sites: Dict[str, int] = field(default_factory=dict)
+    source_names: Dict[int, str] = field(init=False, repr=False)
+    type_names: Dict[int, str] = field(init=False, repr=False)
+    site_names: Dict[int, str] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "source_names", {id_: name for name, id_ in self.sources.items()})
+        object.__setattr__(self, "type_names", {id_: name for name, id_ in self.types.items()})
+        object.__setattr__(self, "site_names", {id_: name for name, id_ in self.sites.items()})
+
+    def covers(self, source_ids: Iterable[int] = (), type_ids: Iterable[int] = (), site_ids: Iterable[int] = ()) -> bool:
+        """Whether every id is known, i.e. the snapshot isn't older than the rows."""
+        return all(int(i) in self.source_names for i in source_ids) \
+            and all(int(i) in self.type_names for i in type_ids) \
+            and all(int(i) in self.site_names for i in site_ids)
+
+
+def _by_name(session: Session, model) -> Dict[str, int]:
+    return {name: id_ for id_, name in session.execute(select(model.id, model.name).order_by(model.name))}
+
+
+def load_dimensions(session: Session, version: int) -> Dimensions:
+    return Dimensions(version, _by_name(session, EnergySource), _by_name(session, EnergyType), _by_name(session, Site))
+
+
+class DimensionRegistry:
+    def __init__(self):
+        self._snapshots: "WeakKeyDictionary[object, Dimensions]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _engine(session: Session):
+        bind = session.get_bind()
+        return getattr(bind, "engine", bind)
+
+    def get(self, session: Session, version: Optional[int] = None) -> Dimensions:
+        """The snapshot for ``session``'s database at ``version``.
+
+        Without ``version`` the current one is read from ``data_versions``
+        (one primary-key lookup); a snapshot at that version is reused.
+        """
+        if version is None:
+            version = data_version(session, DIMENSIONS_VERSION).version
+        snapshot = self._snapshots.get(self._engine(session))
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        return self.reload(session, version)
+
+    def reload(self, session: Session, version: Optional[int] = None) -> Dimensions:
+        """Read the tables again, e.g. after meeting ids the snapshot doesn't know."""
+        if version is None:
+            version = data_version(session, DIMENSIONS_VERSION).version
+        snapshot = load_dimensions(session, version)
+        with self._lock:
+            self._snapshots[self._engine(session)] = snapshot
+        return snapshot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+
+registry = DimensionRegistry()
+
+
+def resolve(
+    session: Session, dims: Dimensions,
+    source_ids: Iterable[int] = (), type_ids: Iterable[int] = (), site_ids: Iterable[int] = (),
+) -> Dimensions:
+    """``dims``, or a fresh snapshot if it lacks any of the ids."""
+    if dims.covers(source_ids, type_ids, site_ids):
+        return dims
+    return registry.reload(session)
+
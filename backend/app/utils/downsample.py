@@ -0,0 +1,126 @@
+"""Downsampling of dense series for charts.
+
+A chart needs a few hundred points per series, while an hourly or daily
+window can have thousands of buckets. Both methods pick a subset of the
+*existing* points of each row of a ``(series, points)`` array, so every value
+a client gets is a real bucket total:
+
+- ``lttb``: Largest-Triangle-Three-Buckets, which keeps the points that
+  contribute most to the visual shape of the line,
+- ``minmax``: the minimum and the maximum of each group of consecutive
+  points, so no peak or trough is ever lost.
+
+Each method returns a boolean mask of the points kept. The first and the
+last point are always kept. Work is vectorized over all series at once;
+LTTB still loops over its ``n`` output buckets, because each choice depends
+on the previous one.
+"""
+from enum import Enum
+
+import numpy as np
+
+
+class Downsampling(str, Enum):
+    lttb = "lttb"
+    minmax = "minmax"
+
+
+def _as_2d(y) -> np.ndarray:
+    return np.atleast_2d(np.asarray(y, dtype=np.float64))
+
+
+def lttb(y, n: int) -> np.ndarray:
+    """Mask of the ``n`` points LTTB keeps in each row of ``y``.
+
+    Points are assumed to be evenly spaced, as consecutive time buckets are.
+    """
+    y = _as_2d(y)
+    series, size = y.shape
+    mask = np.zeros(y.shape, dtype=bool)
+    if n >= size:
+        mask[:] = True
+        return mask
+    mask[:, 0] = mask[:, -1] = True
+    if n < 3:
+        return mask
+
+    # n - 2 buckets over the interior points 1 .. size - 2
+    edges = np.linspace(1, size - 1, n - 1).astype(np.intp)
+    counts = np.diff(edges)
+    means = np.add.reduceat(y[:, :size - 1], edges[:-1], axis=1) / counts
+    # The third vertex of bucket i's triangles: the mean of bucket i + 1,
+    # and the last point for the last bucket
+    third_x = np.append((edges[1:-1] + edges[2:] - 1) / 2, size - 1)
+    third_y = np.concatenate([means[:, 1:], y[:, -1:]], axis=1)
+
+    rows = np.arange(series)
+    selected = np.zeros(series, dtype=np.intp)
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        xa = selected[:, None]
+        ya = y[rows, selected][:, None]
+        # Twice the triangle areas; the factor doesn't change the argmax
+        area = np.abs(
+            (xa - third_x[i]) * (y[:, lo:hi] - ya)
+            - (xa - np.arange(lo, hi)) * (third_y[:, i:i + 1] - ya)
+        )
+        selected = lo + area.argmax(axis=1)
+        mask[rows, selected] = True
+    return mask
+
+
+def minmax(y, n: int) -> np.ndarray:
+    """Mask of the first, the last, and each group's minimum and maximum point.
+
+    The points are split into ``(n - 2) // 2`` groups, so at most ``n``
+    points are kept per row; fewer where a group's minimum and maximum are
+    the same point.
+    """
+    y = _as_2d(y)
+    series, size = y.shape
+    mask = np.zeros(y.shape, dtype=bool)
+    if n >= size:
+        mask[:] = True
+        return mask
+    mask[:, 0] = mask[:, -1] = True
+    groups = (n - 2) // 2
+    if groups < 1:
+        return mask
+
+    starts = np.linspace(0, size, groups + 1).astype(np.intp)[:-1]
+    group = np.repeat(np.arange(groups), np.diff(np.append(starts, size)))
+    for reduce in (np.maximum, np.minimum):
+        extreme = reduce.reduceat(y, starts, axis=1)
+        s, j = np.nonzero(y == extreme[:, group])
+        # nonzero is row-major, so return_index finds each group's first hit
+        _, first = np.unique(s * groups + group[j], return_index=True)
+        mask[s[first], j[first]] = True
+    return mask
+
+
+METHODS = {
+    Downsampling.lttb: lttb,
+    Downsampling.minmax: minmax,
+}
+
+
+def keep(y, max_points: int, method: Downsampling = Downsampling.lttb) -> np.ndarray:
+    """Sorted indices of the points to keep so ``y``'s rows share at most ``max_points`` x values.
+
+    The budget is split evenly between the rows that aren't all zero, and
+    the points any row keeps are kept for all of them. When there are too
+    many rows for at least three points each, their sum is downsampled
+    instead.
+    """
+    y = _as_2d(y)
+    size = y.shape[1]
+    if size <= max_points:
+        return np.arange(size)
+
+    active = y[y.any(axis=1)]
+    if not len(active):
+        active = y[:1]
+    per_series = max_points // len(active)
+    if per_series < 3:
+        active, per_series = active.sum(axis=0, keepdims=True), max_points
+    return np.flatnonzero(METHODS[method](active, per_series).any(axis=0))
@@ -1,35 +1,95 @@
+import numpy as np
+from sqlalchemy import Integer, cast, extract, func
 from sqlalchemy.orm import Session
-from app.models import EnergyTrack, EnergySource, EnergyType
+from app.models import EnergyTrack, EnergyMonthlyRollup
+from app.utils.columnar import load_energy_cube
+from app.utils.dimensions import registry, resolve
 from collections import defaultdict
+from typing import Dict, Optional, Sequence, Tuple
 
-def get_all_energy_tracks(db: Session):
-    raw_tracks = db.query(
-        EnergyTrack.month,
-        EnergyTrack.kwh,
-        EnergySource.name.label("source"),
-        EnergyType.name.label("type")
-    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id)\
-     .join(EnergyType, EnergyTrack.type_id == EnergyType.id)\
+YearMonth = Tuple[int, int]
+
+
+def _year_month(table):
+    if table is EnergyMonthlyRollup:
+        return table.year, table.month
+    return (
+        cast(extract("year", table.start_time), Integer),
+        cast(extract("month", table.start_time), Integer),
+    )
+
+
+def _site_filter(table, site_ids: Optional[Sequence[int]]):
+    return [] if site_ids is None else [table.site_id.in_(site_ids)]
+
+
+def monthly_totals_by_source(
+    db: Session, energy_type: str, use_rollup: bool = True, site_ids: Optional[Sequence[int]] = None,
+) -> Dict[YearMonth, Dict[str, float]]:
+    """Total kWh per ((year, month), source) for one energy type, summed in the database.
+
+    Reads ``energy_monthly_rollup`` by default; pass ``use_rollup=False`` to
+    aggregate the raw ``energy_tracks`` rows instead. Tracks count towards the
+    month their ``start_time`` falls in. ``site_ids`` limits the sum to those
+    sites (default: every site).
+    """
+    dims = registry.get(db)
+    if energy_type not in dims.types:
+        return {}
+
+    table = EnergyMonthlyRollup if use_rollup else EnergyTrack
+    year, month = _year_month(table)
+    rows = db.query(
+        year,
+        month,
+        table.source_id,
+        func.sum(table.kwh).label("kwh"),
+    ).filter(*_site_filter(table, site_ids), table.type_id == dims.types[energy_type])\
+     .group_by(year, month, table.source_id)\
      .all()
 
-    result = defaultdict(lambda: defaultdict(float))
+    dims = resolve(db, dims, source_ids=(source_id for _, _, source_id, _ in rows))
+    pivot: Dict[YearMonth, Dict[str, float]] = defaultdict(dict)
+    for y, m, source_id, kwh in rows:
+        pivot[(y, m)][dims.source_names[source_id]] = float(kwh)
+    return pivot
 
-    for entry in raw_tracks:
-        key = (entry.source, entry.type)
-        result[key][entry.month] += float(entry.kwh)
 
-    response = []
-    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                   'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+def totals_by_source(
+    db: Session, energy_type: str, use_rollup: bool = True, site_ids: Optional[Sequence[int]] = None,
+) -> Dict[str, float]:
+    """Total kWh per source over all time for one energy type, optionally for ``site_ids`` only."""
+    dims = registry.get(db)
+    if energy_type not in dims.types:
+        return {}
+
+    table = EnergyMonthlyRollup if use_rollup else EnergyTrack
+    rows = db.query(
+        table.source_id,
+        func.sum(table.kwh).label("kwh"),
+    ).filter(*_site_filter(table, site_ids), table.type_id == dims.types[energy_type])\
+     .group_by(table.source_id)\
+     .all()
 
-    for (source, typ), monthly_data in result.items():
-        for month_num in range(1, 13):
-            if month_num in monthly_data:
-                response.append({
-                    "month": month_names[month_num - 1],
-                    "kwh": monthly_data[month_num],
-                    "source": source,
-                    "type": typ
-                })
+    dims = resolve(db, dims, source_ids=(source_id for source_id, _ in rows))
+    totals = {dims.source_names[source_id]: float(kwh) for source_id, kwh in rows}
+    return dict(sorted(totals.items()))
+
+
+def get_all_energy_tracks(db: Session):
+    cube = load_energy_cube(db, use_rollup=False)
 
-    return response
+    # (source, type, month) order, skipping cells without tracks
+    periods = cube.periods()
+    counts = cube.counts.transpose(1, 0, 2)
+    kwh = (cube.cents.transpose(1, 0, 2) / 100).tolist()
+    return [
+        {
+            "year": periods[m].year,
+            "month": periods[m].strftime("%b"),
+            "kwh": kwh[s][t][m],
+            "source": cube.sources[s],
+            "type": cube.types[t]
+        }
+        for s, t, m in zip(*np.nonzero(counts))
+    ]
@@ -0,0 +1,63 @@
+"""Conditional GET support (ETag / Last-Modified) for the /energy routes.
+
+A response is fully determined by its path, its query parameters, its
+negotiated media type and the ``energy_tracks`` data version, so the ETag is
+a hash of those. Clients send it back in ``If-None-Match`` and get a ``304``
+while the data is unchanged, without the server running any aggregation.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Mapping, Optional, Tuple
+
+# Per-user (the routes need a token) and only valid until the next write
+CACHE_CONTROL = os.getenv("ENERGY_CACHE_CONTROL", "private, no-cache")
+
+
+def make_etag(path: str, params: Iterable[Tuple[str, str]], version: int, media_type: str = "") -> str:
+    """A strong ETag; ``media_type`` tells apart the encodings of one resource."""
+    digest = hashlib.blake2b(repr((path, sorted(params), media_type)).encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def http_date(dt: datetime) -> str:
+    """``dt`` (naive UTC) as an HTTP date."""
+    return format_datetime(dt.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def _etags(header: str) -> Iterable[str]:
+    for tag in header.split(","):
+        tag = tag.strip()
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        yield tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(headers: Mapping[str, str], etag: str, last_modified: Optional[datetime]) -> bool:
+    """Whether a GET with ``headers`` can be answered with ``304 Not Modified``.
+
+    ``If-None-Match`` takes precedence; ``If-Modified-Since`` is only
+    consulted when it is absent.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in _etags(if_none_match)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    # HTTP dates have whole seconds
+    return last_modified.replace(microsecond=0) <= since.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
@@ -0,0 +1,350 @@
+"""Streaming bulk ingestion of meter readings.
+
+Each record has ``source``, ``type`` and ``kwh``, optionally the ``site`` it
+belongs to (default: the loader's ``default_site``), plus either
+
+- ``start`` (ISO 8601 timestamp) and optionally ``end`` and ``meter_id``, or
+- a legacy ``month`` (1-12 or a month name) and optionally ``year``; the
+  reading then covers that whole calendar month.
+
+Files are read in fixed-size chunks, so memory use depends on ``chunk_size``
+and not on the file size. For each chunk:
+
+1. site/source/type names are resolved to ids through an in-memory dictionary;
+   unknown names are upserted into ``sites``/``energy_sources``/``energy_types``,
+2. the monthly partitions the chunk falls into are created on Postgres,
+3. the tracks are written with one ``executemany`` batch, or with ``COPY`` on
+   Postgres/psycopg2,
+4. the touched ``energy_monthly_rollup`` cells, ``energy_reading_stats``
+   rows and ``energy_reading_sketches`` are adjusted, the latter two in
+   vectorised passes over the chunk, and the chunk is committed, which also
+   invalidates the /energy cache of the sites it wrote.
+"""
+import csv
+import io
+import json
+import os
+import resource
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.cache import mark_tracks_changed
+from app.models import EnergySource, EnergyType, EnergyTrack, Site
+from app.utils import anomalies, rollup, sketches
+from app.utils.partitions import ensure_month_partitions
+from app.utils.periods import add_months, to_utc
+
+DEFAULT_CHUNK_SIZE = 50_000
+# The site tracks without one are assigned to; the migration that added sites created it
+DEFAULT_SITE = "default"
+COLUMNS = ("site", "source", "type", "kwh", "start", "end", "meter_id", "month", "year")
+REQUIRED = ("source", "type", "kwh")
+
+_MONTHS = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1
+)}
+_CENT = Decimal("0.01")
+
+
+class IngestError(ValueError):
+    """Raised for rows or files that can't be ingested."""
+
+
+# ------------------ Readers ------------------ #
+
+def _chunked(records: Iterable[dict], chunk_size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    with open(path, newline="") as f:
+        yield from _chunked(csv.DictReader(f), chunk_size)
+
+
+def iter_ndjson(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    with open(path) as f:
+        yield from _chunked((json.loads(line) for line in f if line.strip()), chunk_size)
+
+
+def iter_parquet(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[dict]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:  # pragma: no cover - pyarrow is in requirements.txt
+        raise IngestError("Reading Parquet needs the pyarrow package") from exc
+
+    parquet = pq.ParquetFile(path)
+    columns = [c for c in COLUMNS if c in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pylist()
+
+
+READERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "jsonl": iter_ndjson,
+    "parquet": iter_parquet,
+}
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if ext not in READERS:
+        raise IngestError(f"Can't infer the format of {path}; pass one of {sorted(READERS)}")
+    return ext
+
+
+def _int(value, what: str) -> int:
+    try:
+        return int(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError) as exc:
+        raise IngestError(f"Invalid {what}: {value!r}") from exc
+
+
+def parse_month(value) -> int:
+    if isinstance(value, str) and not value.strip().isdigit():
+        month = _MONTHS.get(value.strip()[:3].lower())
+    else:
+        month = _int(value, "month")
+    if month is None or not 1 <= month <= 12:
+        raise IngestError(f"Invalid month: {value!r}")
+    return month
+
+
+def parse_year(value) -> int:
+    return _int(value, "year")
+
+
+def parse_timestamp(value) -> datetime:
+    """A naive UTC datetime from an ISO 8601 string or a datetime."""
+    if isinstance(value, datetime):
+        return to_utc(value)
+    try:
+        return to_utc(datetime.fromisoformat(str(value).strip()))
+    except ValueError as exc:
+        raise IngestError(f"Invalid timestamp: {value!r}") from exc
+
+
+def _present(record: dict, field: str) -> bool:
+    value = record.get(field)
+    return value is not None and str(value).strip() != ""
+
+
+def parse_period(record: dict, default_year: int):
+    """``(start_time, end_time)`` of a record; month-only records span the month."""
+    if _present(record, "start"):
+        start = parse_timestamp(record["start"])
+        end = parse_timestamp(record["end"]) if _present(record, "end") else None
+        if end is not None and end < start:
+            raise IngestError(f"Reading ends before it starts: {record!r}")
+        return start, end
+    if _present(record, "month"):
+        year = parse_year(record["year"]) if _present(record, "year") else default_year
+        start = datetime(year, parse_month(record["month"]), 1)
+        return start, add_months(start, 1)
+    raise IngestError(f"Record has neither a start nor a month: {record!r}")
+
+
+def check_required(record: dict) -> None:
+    missing = [field for field in REQUIRED if not _present(record, field)]
+    if missing:
+        raise IngestError(f"Record has no {', '.join(missing)}: {record!r}")
+
+
+def parse_kwh(value) -> Decimal:
+    try:
+        return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError) as exc:
+        raise IngestError(f"Invalid kWh value: {value!r}") from exc
+
+
+# ------------------ Dimensions ------------------ #
+
+class DimensionResolver:
+    """Name → id lookup for sites, sources and types, filled from the database on demand."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.ids: Dict[type, Dict[str, int]] = {
+            model: {name: id_ for id_, name in session.execute(select(model.id, model.name))}
+            for model in (Site, EnergySource, EnergyType)
+        }
+
+    def _upsert(self, model, names: List[str]) -> None:
+        dialect = self.session.get_bind().dialect.name
+        values = [{"name": name} for name in names]
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            dialect_insert = None
+
+        if dialect_insert is not None:
+            self.session.execute(dialect_insert(model).values(values).on_conflict_do_nothing(index_elements=["name"]))
+        else:
+            existing = set(self.session.scalars(select(model.name).where(model.name.in_(names))))
+            missing = [v for v in values if v["name"] not in existing]
+            if missing:
+                self.session.execute(insert(model), missing)
+
+        for id_, name in self.session.execute(select(model.id, model.name).where(model.name.in_(names))):
+            self.ids[model][name] = id_
+
+    def resolve(self, model, names: Iterable[str]) -> Dict[str, int]:
+        lookup = self.ids[model]
+        missing = sorted({n for n in names if n not in lookup})
+        if missing:
+            self._upsert(model, missing)
+        return lookup
+
+
+# ------------------ Loading ------------------ #
+
+@dataclass
+class IngestStats:
+    rows: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def peak_rss_mb(self) -> float:
+        # ru_maxrss is reported in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _copy_tracks(session: Session, rows: List[dict]) -> None:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        # None is written as an unquoted empty field, which COPY reads as NULL
+        writer.writerow((
+            r["site_id"], r["source_id"], r["type_id"], r["meter_id"], r["start_time"], r["end_time"], r["kwh"],
+        ))
+    buf.seek(0)
+
+    cursor = session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY energy_tracks (site_id, source_id, type_id, meter_id, start_time, end_time, kwh) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+def supports_copy(session: Session) -> bool:
+    bind = session.get_bind()
+    return bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2"
+
+
+def load_chunk(
+    session: Session,
+    resolver: DimensionResolver,
+    records: List[dict],
+    method: str,
+    default_year: Optional[int] = None,
+    default_site: str = DEFAULT_SITE,
+) -> int:
+    """Insert one chunk of raw records and update the rollup and stats; returns the row count.
+
+    ``default_year`` is used for month-only records without a ``year``
+    (default: the current year), ``default_site`` for records without a
+    ``site``.
+    """
+    default_year = default_year or datetime.now(timezone.utc).year
+    for r in records:
+        check_required(r)
+    sites = [str(r["site"]).strip() if _present(r, "site") else default_site for r in records]
+    site_ids = resolver.resolve(Site, sites)
+    source_ids = resolver.resolve(EnergySource, (str(r["source"]).strip() for r in records))
+    type_ids = resolver.resolve(EnergyType, (str(r["type"]).strip() for r in records))
+
+    rows, cells = [], []
+    deltas: rollup.Deltas = defaultdict(lambda: [Decimal("0.00"), 0])
+    for r, site in zip(records, sites):
+        start, end = parse_period(r, default_year)
+        row = {
+            "site_id": site_ids[site],
+            "source_id": source_ids[str(r["source"]).strip()],
+            "type_id": type_ids[str(r["type"]).strip()],
+            "meter_id": str(r["meter_id"]).strip() if _present(r, "meter_id") else None,
+            "start_time": start,
+            "end_time": end,
+            "kwh": parse_kwh(r["kwh"]),
+        }
+        rows.append(row)
+        cells.append(rollup.track_key(row["site_id"], row["type_id"], row["source_id"], start))
+        cell = deltas[cells[-1]]
+        cell[0] += row["kwh"]
+        cell[1] += 1
+
+    starts = [row["start_time"] for row in rows]
+    ensure_month_partitions(session, min(starts), max(starts))
+    # The data versions first, then the derived rows: the lock order every writer follows
+    mark_tracks_changed(session, {row["site_id"] for row in rows})
+    if method == "copy":
+        _copy_tracks(session, rows)
+    else:
+        session.execute(insert(EnergyTrack), rows)
+    rollup.apply_deltas(session, deltas)
+    kwh = [float(r["kwh"]) for r in rows]
+    anomalies.apply_readings(session, cells, kwh)
+    sketches.apply_readings(session, cells, starts, kwh)
+    return len(rows)
+
+
+def ingest_file(
+    session: Session,
+    path: str,
+    fmt: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    method: str = "auto",
+    stats: Optional[IngestStats] = None,
+    on_chunk=None,
+    default_year: Optional[int] = None,
+    default_site: str = DEFAULT_SITE,
+) -> IngestStats:
+    """Stream ``path`` into ``energy_tracks``, committing once per chunk."""
+    if method == "auto":
+        method = "copy" if supports_copy(session) else "executemany"
+    if method == "copy" and not supports_copy(session):
+        raise IngestError("COPY needs a PostgreSQL database with the psycopg2 driver")
+
+    reader = READERS[fmt or detect_format(path)]
+    stats = stats or IngestStats()
+    resolver = DimensionResolver(session)
+    elapsed_before = stats.seconds
+    start = time.perf_counter()
+    try:
+        for records in reader(path, chunk_size):
+            stats.rows += load_chunk(session, resolver, records, method, default_year, default_site)
+            stats.chunks += 1
+            session.commit()
+            stats.seconds = elapsed_before + time.perf_counter() - start
+            if on_chunk is not None:
+                on_chunk(stats)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        stats.seconds = elapsed_before + time.perf_counter() - start
+    return stats
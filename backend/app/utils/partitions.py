@@ -0,0 +1,55 @@
+"""Monthly range partitions of ``energy_tracks`` on Postgres.
+
+The ``c5d9e2f4a816`` migration turns ``energy_tracks`` into a table
+partitioned by ``RANGE (start_time)`` with one partition per calendar month
+(``energy_tracks_2024_01``, ...) and a ``energy_tracks_default`` catch-all.
+Loaders call :func:`ensure_month_partitions` before writing, so new months get
+their own partition instead of piling up in the default one. Postgres refuses
+to create a partition whose range already has rows in the default partition;
+move those rows out first if that happens.
+
+On other databases, or when the table isn't partitioned (e.g. created with
+``Base.metadata.create_all``), every function here is a no-op.
+"""
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.utils.periods import add_months, month_start
+
+
+def partition_name(month: datetime) -> str:
+    return f"energy_tracks_{month:%Y_%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('energy_tracks'))"
+    )).scalar()
+
+
+def ensure_month_partitions(db: Session, start: datetime, end: datetime) -> List[str]:
+    """Create the missing monthly partitions covering ``start`` through ``end``.
+
+    Returns the names of the partitions that were checked; runs in the
+    caller's transaction.
+    """
+    if not is_partitioned(db):
+        return []
+
+    names = []
+    month = month_start(start)
+    while month <= end:
+        upper = add_months(month, 1)
+        name = partition_name(month)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF energy_tracks "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+        names.append(name)
+        month = upper
+    return names
@@ -0,0 +1,158 @@
+"""Time windows and buckets for the /energy views.
+
+Timestamps are naive UTC. A bucket is identified by an integer *ordinal* per
+granularity:
+
+- ``hour``/``day``: whole hours/days since the Unix epoch,
+- ``month``: ``year * 12 + month - 1``,
+- ``year``: the year itself.
+
+Ordinals are computed in SQL by :class:`bucket` (one ``GROUP BY`` key per
+bucket) and turned back into datetimes and labels in Python, so the
+columnar engine can index its time axis with plain integers.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy import BigInteger, Integer, cast, extract
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class Granularity(str, Enum):
+    hour = "hour"
+    day = "day"
+    month = "month"
+    year = "year"
+
+
+_SECONDS = {Granularity.hour: 3600, Granularity.day: 86400}
+
+_LABEL_FORMATS = {
+    Granularity.hour: "%Y-%m-%d %H:00",
+    Granularity.day: "%Y-%m-%d",
+    Granularity.month: "%b %Y",
+    Granularity.year: "%Y",
+}
+
+
+def ordinal(dt: datetime, granularity: Granularity) -> int:
+    """The ordinal of the bucket containing ``dt``."""
+    if granularity in _SECONDS:
+        return int((dt - EPOCH).total_seconds()) // _SECONDS[granularity]
+    if granularity == Granularity.month:
+        return dt.year * 12 + dt.month - 1
+    return dt.year
+
+
+def from_ordinal(n: int, granularity: Granularity) -> datetime:
+    """The start of bucket ``n``."""
+    if granularity in _SECONDS:
+        return EPOCH + timedelta(seconds=n * _SECONDS[granularity])
+    if granularity == Granularity.month:
+        return datetime(n // 12, n % 12 + 1, 1)
+    return datetime(n, 1, 1)
+
+
+def label(n: int, granularity: Granularity) -> str:
+    return from_ordinal(n, granularity).strftime(_LABEL_FORMATS[granularity])
+
+
+def to_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """``dt`` as naive UTC; naive values are assumed to be UTC already."""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    n = dt.year * 12 + dt.month - 1 + months
+    return dt.replace(year=n // 12, month=n % 12 + 1)
+
+
+@dataclass(frozen=True)
+class Window:
+    """A half-open ``[start, end)`` time range split into ``granularity`` buckets.
+
+    Either bound may be ``None`` for "since the first"/"until the last" reading.
+    """
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    granularity: Granularity = Granularity.month
+
+    def __post_init__(self):
+        if self.start and self.end and self.start >= self.end:
+            raise ValueError("start must be before end")
+
+    def first_ordinal(self) -> Optional[int]:
+        return None if self.start is None else ordinal(self.start, self.granularity)
+
+    def last_ordinal(self) -> Optional[int]:
+        if self.end is None:
+            return None
+        return ordinal(self.end - timedelta(microseconds=1), self.granularity)
+
+    def month_aligned(self) -> bool:
+        """Whether the monthly rollup can answer this window exactly."""
+        return (
+            self.granularity in (Granularity.month, Granularity.year)
+            and all(b is None or b == month_start(b) for b in (self.start, self.end))
+        )
+
+
+# ------------------ SQL ------------------ #
+
+class bucket(FunctionElement):
+    """``bucket(column, granularity)``: the bucket ordinal of a timestamp column."""
+    type = BigInteger()
+    name = "bucket"
+    inherit_cache = True
+    # Granularity is part of the statement cache key
+    _traverse_internals = FunctionElement._traverse_internals + [
+        ("granularity_name", InternalTraversal.dp_string),
+    ]
+
+    def __init__(self, column, granularity: Granularity):
+        self.granularity = Granularity(granularity)
+        self.granularity_name = self.granularity.value
+        super().__init__(column)
+
+
+def _int(expr):
+    return cast(expr, Integer)
+
+
+@compiles(bucket)
+def _bucket_default(element, compiler, **kw):
+    column = list(element.clauses)[0]
+    g = element.granularity
+    if g in _SECONDS:
+        # floor() rather than a cast: casting a numeric rounds on Postgres
+        return f"CAST(FLOOR({compiler.process(extract('epoch', column), **kw)} / {_SECONDS[g]}) AS BIGINT)"
+    year = compiler.process(_int(extract("year", column)), **kw)
+    if g == Granularity.year:
+        return year
+    month = compiler.process(_int(extract("month", column)), **kw)
+    return f"({year} * 12 + {month} - 1)"
+
+
+@compiles(bucket, "sqlite")
+def _bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(list(element.clauses)[0], **kw)
+    g = element.granularity
+    if g in _SECONDS:
+        # Integer division of a non-negative epoch is already a floor
+        return f"(CAST(STRFTIME('%s', {column}) AS INTEGER) / {_SECONDS[g]})"
+    year = f"CAST(STRFTIME('%Y', {column}) AS INTEGER)"
+    if g == Granularity.year:
+        return year
+    return f"({year} * 12 + CAST(STRFTIME('%m', {column}) AS INTEGER) - 1)"
@@ -0,0 +1,282 @@
+"""Incremental maintenance of the ``energy_monthly_rollup`` table.
+
+:data:`SESSION_LISTENERS` holds a ``before_flush`` listener, registered on
+every SQLAlchemy session by :func:`app.listeners.register`. Whenever ``EnergyTrack`` rows are added, changed or deleted through
+the ORM, only the affected (site, type, source, year, month) cells of the rollup are
+adjusted, inside the same flush and transaction as the tracks themselves. A
+track counts towards the month its ``start_time`` falls in.
+
+Bulk statements (``query.delete()``, ``DELETE FROM`` or Core inserts) bypass
+the ORM and therefore the listener; callers doing those must pass the deltas
+to :func:`apply_deltas` themselves or run :func:`rebuild_rollup` afterwards.
+
+The keys of the cells a transaction touched are collected in
+``session.info[CHANGED_CELLS]`` (or ``session.info[REBUILT]`` is set) for
+app.stream, which publishes them when the transaction commits.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Integer, bindparam, cast, extract, func, inspect, insert, select, delete, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.cache import mark_tracks_changed
+from app.models import EnergyTrack, EnergyMonthlyRollup
+
+RollupKey = Tuple[int, int, int, int, int]  # (site_id, type_id, source_id, year, month)
+Deltas = Dict[RollupKey, List]  # key -> [kwh delta, track count delta]
+Reading = Tuple[RollupKey, datetime, float]  # (cell, start_time, kwh)
+
+_CENT = Decimal("0.01")
+
+# session.info keys read by app.stream
+CHANGED_CELLS = "energy_rollup_changed_cells"
+REBUILT = "energy_rollup_rebuilt"
+
+# Dialects whose INSERT takes ON CONFLICT DO UPDATE; others update, then insert
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _to_decimal(value) -> Decimal:
+    if isinstance(value, Decimal):
+        return value.quantize(_CENT)
+    return Decimal(str(value)).quantize(_CENT)
+
+
+def previous_value(state, name):
+    """The value of a track's ``name`` column before the changes being flushed."""
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), name)
+
+
+def _key(site_id, type_id, source_id, year, month) -> RollupKey:
+    return (int(site_id), int(type_id), int(source_id), int(year), int(month))
+
+
+def track_key(site_id, type_id, source_id, start_time) -> RollupKey:
+    """The rollup cell a track starting at ``start_time`` belongs to."""
+    return _key(site_id, type_id, source_id, start_time.year, start_time.month)
+
+
+def previous_key(state) -> RollupKey:
+    """The rollup cell a track belonged to before the changes being flushed."""
+    return track_key(*(previous_value(state, name) for name in ("site_id", "type_id", "source_id", "start_time")))
+
+
+def collect_deltas(session: Session) -> Deltas:
+    """Per-cell kWh/count changes implied by the session's pending tracks."""
+    deltas: Deltas = defaultdict(lambda: [Decimal("0.00"), 0])
+
+    for obj in session.new:
+        if isinstance(obj, EnergyTrack):
+            cell = deltas[track_key(obj.site_id, obj.type_id, obj.source_id, obj.start_time)]
+            cell[0] += _to_decimal(obj.kwh)
+            cell[1] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, EnergyTrack):
+            state = inspect(obj)
+            cell = deltas[previous_key(state)]
+            cell[0] -= _to_decimal(previous_value(state, "kwh"))
+            cell[1] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, EnergyTrack) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        old = deltas[previous_key(state)]
+        old[0] -= _to_decimal(previous_value(state, "kwh"))
+        old[1] -= 1
+        new = deltas[track_key(obj.site_id, obj.type_id, obj.source_id, obj.start_time)]
+        new[0] += _to_decimal(obj.kwh)
+        new[1] += 1
+
+    return {k: v for k, v in deltas.items() if v[0] != 0 or v[1] != 0}
+
+
+def collect_readings(session: Session) -> Tuple[List[Reading], List[Reading]]:
+    """Readings the session's pending tracks add, oldest first, and the ones they remove.
+
+    Used by the per-reading summaries (app.utils.anomalies, app.utils.sketches).
+    A changed track whose cell and kWh stay the same, e.g. after a corrected
+    ``meter_id``, neither adds nor removes a reading.
+    """
+    added, removed = [], []
+    for obj in session.new:
+        if isinstance(obj, EnergyTrack):
+            key = track_key(obj.site_id, obj.type_id, obj.source_id, obj.start_time)
+            added.append((key, obj.start_time, float(obj.kwh)))
+
+    for obj in session.deleted:
+        if isinstance(obj, EnergyTrack):
+            state = inspect(obj)
+            removed.append((previous_key(state), previous_value(state, "start_time"),
+                            float(previous_value(state, "kwh"))))
+
+    for obj in session.dirty:
+        if not isinstance(obj, EnergyTrack) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        old = (previous_key(state), previous_value(state, "start_time"), float(previous_value(state, "kwh")))
+        new = (track_key(obj.site_id, obj.type_id, obj.source_id, obj.start_time), obj.start_time, float(obj.kwh))
+        if (old[0], old[2]) != (new[0], new[2]):
+            removed.append(old)
+            added.append(new)
+
+    added.sort(key=lambda reading: reading[1])
+    return added, removed
+
+
+def lock_rows(session: Session, model, keys: Iterable[tuple]) -> dict:
+    """Load ``model``'s rows with primary keys ``keys`` ``FOR UPDATE``, in key order; returns them by key.
+
+    For the per-series summaries, which are merged in Python: callers bump the
+    tracks' data versions first, so every writer takes its locks in the same
+    order. Rows already in the session are refreshed from the database.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+    pk = model.__table__.primary_key.columns
+    stmt = (
+        select(model)
+        .where(tuple_(*pk).in_(keys))
+        .order_by(*pk)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return {inspect(row).identity: row for row in session.scalars(stmt)}
+
+
+def _upsert(conn, rows: List[dict]) -> None:
+    table = EnergyMonthlyRollup.__table__
+    dialect = conn.dialect.name
+    if dialect in _UPSERT_INSERTS:
+        stmt = _UPSERT_INSERTS[dialect](table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key],
+            set_={
+                "kwh": table.c.kwh + stmt.excluded.kwh,
+                "track_count": table.c.track_count + stmt.excluded.track_count,
+            },
+        ), rows)
+        return
+    for row in rows:
+        updated = conn.execute(
+            update(table)
+            .where(*(c == row[c.name] for c in table.primary_key))
+            .values(kwh=table.c.kwh + row["kwh"], track_count=table.c.track_count + row["track_count"])
+        )
+        if not updated.rowcount:
+            conn.execute(insert(table).values(**row))
+
+
+def apply_deltas(session: Session, deltas: Deltas) -> None:
+    """Add ``deltas`` to the matching rollup rows, creating or removing them as needed.
+
+    Each cell is changed by a single ``kwh = kwh + delta`` upsert in the
+    database, so concurrent writers never overwrite each other's deltas. Cells
+    are written in key order, after the tracks' data versions were bumped (see
+    :func:`app.cache.mark_tracks_changed`), the lock order ingest follows too.
+    """
+    if not deltas:
+        return
+    session.info.setdefault(CHANGED_CELLS, set()).update(deltas)
+    table = EnergyMonthlyRollup.__table__
+    keys = sorted(deltas)
+    names = [c.name for c in table.primary_key]
+    # Core statements on the connection, so no ORM events fire from inside the listener
+    conn = session.connection()
+    _upsert(conn, [
+        {**dict(zip(names, key)), "kwh": deltas[key][0], "track_count": deltas[key][1]} for key in keys
+    ])
+    emptied = [dict(zip(names, key)) for key in keys if deltas[key][1] < 0]
+    if emptied:
+        conn.execute(
+            delete(table)
+            .where(*(c == bindparam(c.name) for c in table.primary_key), table.c.track_count <= 0),
+            emptied,
+        )
+
+    # Rows already loaded into the session are reloaded on their next access
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, EnergyMonthlyRollup) and inspect(obj).identity in deltas:
+            session.expire(obj)
+
+
+def _update_rollup(session, flush_context, instances):
+    deltas = collect_deltas(session)
+    if deltas:
+        # Same lock order as ingest: the data versions first, then the rollup
+        mark_tracks_changed(session, {key[0] for key in deltas})
+        apply_deltas(session, deltas)
+
+
+SESSION_LISTENERS = (("before_flush", _update_rollup),)
+
+
+def _raw_aggregate():
+    year = cast(extract("year", EnergyTrack.start_time), Integer)
+    month = cast(extract("month", EnergyTrack.start_time), Integer)
+    return select(
+        EnergyTrack.site_id,
+        EnergyTrack.type_id,
+        EnergyTrack.source_id,
+        year.label("year"),
+        month.label("month"),
+        func.sum(EnergyTrack.kwh).label("kwh"),
+        func.count(EnergyTrack.id).label("track_count"),
+    ).group_by(EnergyTrack.site_id, EnergyTrack.type_id, EnergyTrack.source_id, year, month)
+
+
+def rebuild_rollup(db: Session) -> None:
+    """Recompute the whole rollup from ``energy_tracks``."""
+    db.execute(delete(EnergyMonthlyRollup))
+    db.execute(insert(EnergyMonthlyRollup).from_select(
+        ["site_id", "type_id", "source_id", "year", "month", "kwh", "track_count"],
+        _raw_aggregate(),
+    ))
+    db.info[REBUILT] = True
+    db.commit()
+
+
+def check_rollup_consistency(db: Session) -> List[dict]:
+    """Compare the rollup with a fresh aggregate of ``energy_tracks``.
+
+    Returns one entry per mismatching (site, type, source, year, month) cell; an empty
+    list means the rollup is consistent.
+    """
+    raw = {
+        _key(r.site_id, r.type_id, r.source_id, r.year, r.month): (_to_decimal(r.kwh), r.track_count)
+        for r in db.execute(_raw_aggregate())
+    }
+    rolled = {
+        _key(r.site_id, r.type_id, r.source_id, r.year, r.month): (_to_decimal(r.kwh), r.track_count)
+        for r in db.query(EnergyMonthlyRollup)
+    }
+
+    mismatches = []
+    for key in sorted(set(raw) | set(rolled)):
+        expected = raw.get(key, (Decimal("0.00"), 0))
+        actual = rolled.get(key, (Decimal("0.00"), 0))
+        if expected != actual:
+            site_id, type_id, source_id, year, month = key
+            mismatches.append({
+                "site_id": site_id,
+                "type_id": type_id,
+                "source_id": source_id,
+                "year": year,
+                "month": month,
+                "raw_kwh": expected[0],
+                "raw_count": expected[1],
+                "rollup_kwh": actual[0],
+                "rollup_count": actual[1],
+            })
+    return mismatches
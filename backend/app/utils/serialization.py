@@ -0,0 +1,67 @@
+"""Response encoding for the /energy views.
+
+The view rows are built from the NumPy cube with plain ``str``/``float``
+values, so they already match the declared response models. Routes encode
+them straight to bytes with orjson (or msgpack, when the client's ``Accept``
+header prefers it) and return a ``Response``. That skips FastAPI's second
+validation pass and its ``jsonable_encoder`` walk. The ``response_model``
+declarations stay on the routes, so the OpenAPI schema does not change.
+"""
+from typing import Any, Dict, Optional
+
+import msgpack
+import orjson
+from fastapi import Response
+
+from app.profiling import phase
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Preferred first: a tie or a wildcard picks JSON
+MEDIA_TYPES = (JSON, MSGPACK)
+_ALIASES = {"application/x-msgpack": MSGPACK}
+
+# ``responses=`` entry advertising the msgpack variant in OpenAPI
+MSGPACK_RESPONSE = {200: {"content": {MSGPACK: {}}, "description": "JSON, or MessagePack with `Accept: application/msgpack`"}}
+
+
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """The media type in ``MEDIA_TYPES`` that ``accept`` rates highest (JSON by default)."""
+    if not accept:
+        return JSON
+    scores: Dict[str, float] = {}
+    for item in accept.split(","):
+        media_range, _, params = item.strip().partition(";")
+        media_range = _ALIASES.get(media_range.strip().lower(), media_range.strip().lower())
+        q = _quality(params)
+        for media_type in MEDIA_TYPES:
+            if media_range in (media_type, "*/*", media_type.split("/")[0] + "/*"):
+                # An exact match overrides a wildcard's quality
+                if media_range == media_type or media_type not in scores:
+                    scores[media_type] = q
+    best = max(MEDIA_TYPES, key=lambda m: scores.get(m, 0.0))
+    return best if scores.get(best, 0.0) > 0 else JSON
+
+
+def encode(data: Any, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(data)
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def encoded_response(data: Any, media_type: str = JSON, headers: Optional[dict] = None) -> Response:
+    with phase("encode"):
+        content = encode(data, media_type)
+    return Response(content=content, media_type=media_type, headers=headers)
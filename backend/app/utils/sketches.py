@@ -0,0 +1,389 @@
+"""Mergeable quantile sketches of meter readings, and the percentiles they answer.
+
+``energy_reading_sketches`` has one row per rollup cell (site, type, source,
+year, month). Each row holds a :class:`QuantileSketch` of the cell's readings,
+their count and the largest reading with its ``start_time`` (the peak). Sketches
+of any set of cells merge exactly, so :func:`find_percentiles` answers any
+month-aligned range, site scope or period from the rows alone.
+
+The sketch is a DDSketch (Masson et al., 2019): readings are counted in
+logarithmic buckets ``(γ^(i-1), γ^i]`` with ``γ = (1 + α) / (1 - α)``, and a
+quantile is read as the centre of the bucket holding its rank. Error bound:
+the estimate of the q-quantile is within a relative ``α``
+(``SKETCH_ACCURACY``, 1% by default) of the reading of rank ``⌊q·(n - 1)⌋``,
+for any data and after any number of merges. ``percentile_cont`` interpolates
+between that reading and the next, so the two can also differ by the gap
+between adjacent readings, which is negligible for the hundreds of readings
+of a month. Negative readings (corrections) are counted in a mirrored set of
+buckets, zeros separately.
+
+Unlike t-digest or KLL, bucket counts also subtract exactly, so deleted or
+corrected tracks are removed from their sketch. The rows are kept in sync like
+the rollup:
+
+- a ``before_flush`` listener (see :func:`app.listeners.register`) covers
+  tracks written through the ORM,
+- bulk loaders pass their readings to :func:`apply_readings`,
+- :func:`backfill_sketches` recomputes the table from the whole history in
+  vectorised batches.
+
+Deleting a cell's peak leaves the sketch's estimate of its largest reading,
+without a ``peak_at``, until :func:`backfill_sketches` recomputes it.
+"""
+import math
+import os
+import struct
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, cast, delete, extract, false, insert, select
+from sqlalchemy.orm import Session
+
+from app.cache import mark_tracks_changed
+from app.models import EnergyReadingSketch, EnergyTrack
+from app.utils.dimensions import Dimensions, registry, resolve
+from app.utils.periods import Granularity, Window, label
+from app.utils.rollup import Reading, RollupKey, collect_readings, lock_rows
+
+SKETCH_ACCURACY = float(os.getenv("SKETCH_ACCURACY", 0.01))
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+BACKFILL_BATCH_SIZE = 100_000
+
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+# Readings are in cents, so anything smaller is a zero
+_MIN_VALUE = 1e-6
+# version, accuracy, zeros, positive buckets, negative buckets
+_HEADER = struct.Struct("<BdqII")
+_VERSION = 1
+
+Buckets = Tuple[np.ndarray, np.ndarray]  # (int32 bucket indexes, int64 counts), sorted by index
+_NO_BUCKETS: Buckets = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64))
+
+
+def _merge_buckets(parts: Sequence[Buckets]) -> Buckets:
+    """The bucket-wise sum of ``parts``, without empty buckets."""
+    parts = [p for p in parts if len(p[0])]
+    if not parts:
+        return _NO_BUCKETS
+    if len(parts) == 1:
+        keys, counts = parts[0]
+    else:
+        keys, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        counts = np.bincount(inverse.reshape(-1), weights=np.concatenate([p[1] for p in parts]), minlength=len(keys))
+        counts = np.rint(counts).astype(np.int64)
+    # Removing a reading that was never added can't make a count negative
+    kept = counts > 0
+    return keys[kept].astype(np.int32), counts[kept]
+
+
+def _bucket(magnitudes: np.ndarray) -> Buckets:
+    if not len(magnitudes):
+        return _NO_BUCKETS
+    keys, counts = np.unique(np.ceil(np.log(magnitudes) / _LOG_GAMMA).astype(np.int32), return_counts=True)
+    return keys, counts.astype(np.int64)
+
+
+class QuantileSketch:
+    """Counts of readings in logarithmic buckets (a DDSketch with relative accuracy ``SKETCH_ACCURACY``).
+
+    Sketches are immutable: :meth:`merge` and :meth:`remove` return new ones.
+    """
+
+    __slots__ = ("positive", "negative", "zeros")
+
+    def __init__(self, positive: Buckets = _NO_BUCKETS, negative: Buckets = _NO_BUCKETS, zeros: int = 0):
+        self.positive = positive
+        self.negative = negative
+        self.zeros = int(zeros)
+
+    @classmethod
+    def of(cls, values) -> "QuantileSketch":
+        values = np.asarray(values, dtype=np.float64)
+        return cls(
+            _bucket(values[values >= _MIN_VALUE]),
+            _bucket(-values[values <= -_MIN_VALUE]),
+            np.count_nonzero(np.abs(values) < _MIN_VALUE),
+        )
+
+    @property
+    def count(self) -> int:
+        return int(self.positive[1].sum() + self.negative[1].sum()) + self.zeros
+
+    def merge(self, *others: "QuantileSketch") -> "QuantileSketch":
+        sketches = (self, *others)
+        return QuantileSketch(
+            _merge_buckets([s.positive for s in sketches]),
+            _merge_buckets([s.negative for s in sketches]),
+            sum(s.zeros for s in sketches),
+        )
+
+    def remove(self, values) -> "QuantileSketch":
+        """This sketch without ``values``, which must have been added to it."""
+        gone = QuantileSketch.of(values)
+        return QuantileSketch(
+            _merge_buckets([self.positive, (gone.positive[0], -gone.positive[1])]),
+            _merge_buckets([self.negative, (gone.negative[0], -gone.negative[1])]),
+            max(self.zeros - gone.zeros, 0),
+        )
+
+    def _values_and_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Each bucket's estimate and count, in ascending order of value."""
+        neg_keys, neg_counts = self.negative
+        pos_keys, pos_counts = self.positive
+        centre = 2 / (_GAMMA + 1)
+        zeros = 1 if self.zeros else 0
+        values = np.concatenate([
+            -centre * _GAMMA ** neg_keys[::-1].astype(np.float64),
+            np.zeros(zeros),
+            centre * _GAMMA ** pos_keys.astype(np.float64),
+        ])
+        counts = np.concatenate([neg_counts[::-1], np.full(zeros, self.zeros, dtype=np.int64), pos_counts])
+        return values, counts
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Estimates of the ``qs`` quantiles (0 to 1); ``None`` for an empty sketch."""
+        values, counts = self._values_and_counts()
+        if not len(values):
+            return [None] * len(qs)
+        ranks = np.floor(np.asarray(qs, dtype=np.float64) * (counts.sum() - 1))
+        return values[np.searchsorted(np.cumsum(counts), ranks, side="right")].tolist()
+
+    def max(self) -> Optional[float]:
+        """An estimate of the largest reading, within the same relative accuracy."""
+        return self.quantiles([1.0])[0]
+
+    def to_bytes(self) -> bytes:
+        (pos_keys, pos_counts), (neg_keys, neg_counts) = self.positive, self.negative
+        return b"".join([
+            _HEADER.pack(_VERSION, SKETCH_ACCURACY, self.zeros, len(pos_keys), len(neg_keys)),
+            pos_keys.astype("<i4").tobytes(), pos_counts.astype("<i8").tobytes(),
+            neg_keys.astype("<i4").tobytes(), neg_counts.astype("<i8").tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "QuantileSketch":
+        version, accuracy, zeros, n_pos, n_neg = _HEADER.unpack_from(data)
+        if version != _VERSION or accuracy != SKETCH_ACCURACY:
+            raise ValueError(
+                f"Sketch has version {version} and accuracy {accuracy}, not {_VERSION} and {SKETCH_ACCURACY}; "
+                "run `python scripts/sketches.py backfill`"
+            )
+        arrays, offset = [], _HEADER.size
+        for n, dtype in ((n_pos, "<i4"), (n_pos, "<i8"), (n_neg, "<i4"), (n_neg, "<i8")):
+            arrays.append(np.frombuffer(data, dtype=dtype, count=n, offset=offset).astype(dtype[1:]))
+            offset += n * np.dtype(dtype).itemsize
+        return cls((arrays[0], arrays[1]), (arrays[2], arrays[3]), zeros)
+
+
+_EMPTY = QuantileSketch()
+
+
+# ------------------ Maintenance ------------------ #
+
+class CellReadings:
+    """What a batch of readings adds to one cell: their sketch and peak."""
+    __slots__ = ("sketch", "peak_kwh", "peak_at")
+
+    def __init__(self, sketch: QuantileSketch, peak_kwh: float, peak_at: datetime):
+        self.sketch, self.peak_kwh, self.peak_at = sketch, peak_kwh, peak_at
+
+    def merge(self, other: "CellReadings") -> "CellReadings":
+        peak = other if other.peak_kwh > self.peak_kwh else self
+        return CellReadings(self.sketch.merge(other.sketch), peak.peak_kwh, peak.peak_at)
+
+
+def _groups(keys: np.ndarray) -> Iterator[Tuple[RollupKey, np.ndarray]]:
+    """Each distinct row of the ``(n, 5)`` array ``keys`` with the indexes of its readings."""
+    if not len(keys):
+        return
+    cells, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    for cell, indexes in zip(cells.tolist(), np.split(order, np.cumsum(np.bincount(inverse))[:-1])):
+        yield tuple(cell), indexes
+
+
+def summarize(keys, starts: Sequence[datetime], kwh) -> Dict[RollupKey, CellReadings]:
+    """Per-cell sketches and peaks of readings; ``keys`` are their rollup cells."""
+    keys = np.asarray(keys, dtype=np.int64).reshape(-1, 5)
+    kwh = np.asarray(kwh, dtype=np.float64)
+    summaries = {}
+    for cell, indexes in _groups(keys):
+        values = kwh[indexes]
+        top = int(np.argmax(values))
+        summaries[cell] = CellReadings(QuantileSketch.of(values), float(values[top]), starts[indexes[top]])
+    return summaries
+
+
+def update_sketches(
+    session: Session,
+    summaries: Dict[RollupKey, CellReadings],
+    removed: Optional[Dict[RollupKey, List[float]]] = None,
+) -> None:
+    """Remove ``removed`` readings from, then add ``summaries`` to, the matching sketch rows.
+
+    The rows are locked while they are merged (see :func:`app.utils.rollup.lock_rows`).
+    """
+    removed = removed or {}
+    with session.no_autoflush:
+        rows = lock_rows(session, EnergyReadingSketch, set(summaries) | set(removed))
+        for key in sorted(set(summaries) | set(removed)):
+            row = rows.get(key)
+            sketch = _EMPTY if row is None else QuantileSketch.from_bytes(row.sketch)
+            peak_kwh = None if row is None else float(row.peak_kwh)
+            peak_at = None if row is None else row.peak_at
+            if key in removed:
+                sketch = sketch.remove(removed[key])
+                if peak_kwh is not None and max(removed[key]) >= peak_kwh:
+                    peak_kwh, peak_at = sketch.max(), None
+            if key in summaries:
+                added = summaries[key]
+                sketch = sketch.merge(added.sketch)
+                if peak_kwh is None or added.peak_kwh > peak_kwh:
+                    peak_kwh, peak_at = added.peak_kwh, added.peak_at
+
+            if sketch.count == 0:
+                if row is not None:
+                    session.delete(row)
+                continue
+            if row is None:
+                site_id, type_id, source_id, year, month = key
+                row = EnergyReadingSketch(site_id=site_id, type_id=type_id, source_id=source_id, year=year, month=month)
+                session.add(row)
+            row.count, row.sketch, row.peak_kwh, row.peak_at = sketch.count, sketch.to_bytes(), round(peak_kwh, 2), peak_at
+
+
+def apply_readings(session: Session, keys, starts: Sequence[datetime], kwh) -> None:
+    """Add bulk-loaded readings to their sketch rows; ``keys`` are their rollup cells."""
+    update_sketches(session, summarize(keys, starts, kwh))
+
+
+def _summarize_readings(readings: List[Reading]) -> Dict[RollupKey, CellReadings]:
+    return summarize([r[0] for r in readings], [r[1] for r in readings], [r[2] for r in readings])
+
+
+def _update_sketches(session, flush_context, instances):
+    added, removed = collect_readings(session)
+    if added or removed:
+        mark_tracks_changed(session, {cell[0] for cell, _, _ in added + removed})
+        by_cell = defaultdict(list)
+        for cell, _, kwh in removed:
+            by_cell[cell].append(kwh)
+        update_sketches(session, _summarize_readings(added), by_cell)
+
+
+SESSION_LISTENERS = (("before_flush", _update_sketches),)
+
+
+def backfill_sketches(db: Session, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Recompute ``energy_reading_sketches`` from every track; returns the number of readings.
+
+    Tracks are read with a server-side cursor, ``batch_size`` at a time, and
+    each batch is sketched with NumPy before it is merged into the totals.
+    """
+    year = cast(extract("year", EnergyTrack.start_time), Integer)
+    month = cast(extract("month", EnergyTrack.start_time), Integer)
+    stmt = select(
+        EnergyTrack.site_id, EnergyTrack.type_id, EnergyTrack.source_id, year, month,
+        EnergyTrack.start_time, EnergyTrack.kwh,
+    ).execution_options(yield_per=batch_size)
+
+    totals: Dict[RollupKey, CellReadings] = {}
+    readings = 0
+    for rows in db.execute(stmt).partitions():
+        for cell, summary in summarize(
+            [r[:5] for r in rows], [r[5] for r in rows], [float(r[6]) for r in rows],
+        ).items():
+            totals[cell] = totals[cell].merge(summary) if cell in totals else summary
+        readings += len(rows)
+
+    db.execute(delete(EnergyReadingSketch))
+    if totals:
+        db.execute(insert(EnergyReadingSketch), [
+            {"site_id": key[0], "type_id": key[1], "source_id": key[2], "year": key[3], "month": key[4],
+             "count": s.sketch.count, "sketch": s.sketch.to_bytes(), "peak_kwh": round(s.peak_kwh, 2),
+             "peak_at": s.peak_at}
+            for key, s in totals.items()
+        ])
+    # Cached percentiles of every site are now stale
+    mark_tracks_changed(db)
+    db.commit()
+    return readings
+
+
+# ------------------ Queries ------------------ #
+
+def _percentile_field(q: float) -> str:
+    """``p95`` for 0.95, ``p99.9`` for 0.999."""
+    return "p" + f"{q * 100:.6f}".rstrip("0").rstrip(".")
+
+
+def find_percentiles(
+    db: Session,
+    dims: Optional[Dimensions] = None,
+    site_ids: Optional[Sequence[int]] = None,
+    energy_type: Optional[str] = None,
+    source: Optional[str] = None,
+    window: Window = Window(),
+    by: Optional[Granularity] = None,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+) -> List[dict]:
+    """Percentiles and peak of single readings, per source and period, merged from the sketches.
+
+    ``window`` must be month-aligned (see :meth:`Window.month_aligned`). With
+    ``by`` (``month`` or ``year``) there is one row per source and bucket,
+    labelled like the other views; without it, one row per source for the
+    whole window, with a ``period`` of ``None``. Each row has the ``source``,
+    ``period``, ``count``, a ``p50``-style field per quantile (in kWh, within
+    ``SKETCH_ACCURACY`` and never above the peak), and the exact ``peak_kwh`` with its ``peak_at``
+    (ISO 8601, ``None`` if the peak reading was deleted since the last
+    backfill). Rows are ordered by period, then source name.
+    """
+    dims = dims or registry.get(db)
+    sk = EnergyReadingSketch
+    ordinal = sk.year * 12 + sk.month - 1
+    filters = []
+    if energy_type is not None:
+        type_id = dims.types.get(energy_type)
+        filters.append(sk.type_id == type_id if type_id is not None else false())
+    if source is not None:
+        source_id = dims.sources.get(source)
+        filters.append(sk.source_id == source_id if source_id is not None else false())
+    if site_ids is not None:
+        filters.append(sk.site_id.in_(site_ids))
+    if window.start is not None:
+        filters.append(ordinal >= Window(window.start, None, Granularity.month).first_ordinal())
+    if window.end is not None:
+        filters.append(ordinal <= Window(None, window.end, Granularity.month).last_ordinal())
+
+    groups: Dict[Tuple[Optional[int], int], list] = defaultdict(list)
+    for source_id, year, month, sketch, peak_kwh, peak_at in db.execute(
+        select(sk.source_id, sk.year, sk.month, sk.sketch, sk.peak_kwh, sk.peak_at).where(*filters)
+    ):
+        period = None if by is None else (year * 12 + month - 1 if by == Granularity.month else year)
+        groups[(period, source_id)].append((QuantileSketch.from_bytes(sketch), float(peak_kwh), peak_at))
+
+    dims = resolve(db, dims, [source_id for _, source_id in groups])
+    rows = []
+    for (period, source_id), cells in sorted(
+        groups.items(), key=lambda item: (item[0][0] or 0, dims.source_names.get(item[0][1]) or ""),
+    ):
+        sketch = cells[0][0].merge(*(cell[0] for cell in cells[1:]))
+        _, peak_kwh, peak_at = max(cells, key=lambda cell: cell[1])
+        # Estimates are only within SKETCH_ACCURACY: keep them between the smallest one and the exact peak
+        lowest, *estimates = sketch.quantiles([0.0, *quantiles])
+        rows.append({
+            "source": dims.source_names.get(source_id),
+            "period": None if period is None else label(period, by),
+            "count": sketch.count,
+            **{
+                _percentile_field(q): round(min(max(v, lowest), peak_kwh), 2)
+                for q, v in zip(quantiles, estimates)
+            },
+            "peak_kwh": peak_kwh,
+            "peak_at": None if peak_at is None else peak_at.isoformat(),
+        })
+    return rows
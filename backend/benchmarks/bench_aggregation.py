@@ -0,0 +1,154 @@
+"""Benchmark Python-side pivoting against SQL ``GROUP BY`` aggregation.
+
+Four paths are compared: the legacy row-by-row pivot, ``GROUP BY`` over the
+raw ``energy_tracks`` rows, a read of the ``energy_monthly_rollup`` table, and
+the NumPy cube the routes use (``load_energy_cube`` over raw tracks, all types
+at once).
+
+Usage:
+    python benchmarks/bench_aggregation.py                  # 10k, 1M and 10M rows on SQLite
+    python benchmarks/bench_aggregation.py --rows 10000 100000
+    python benchmarks/bench_aggregation.py --db-url postgresql+psycopg2://...
+    python benchmarks/bench_aggregation.py --rows 100000 --json aggregation.json
+
+Each dataset is generated by ``benchmarks/datagen.py`` (same seed, same rows)
+and loaded into a scratch database (a temporary SQLite file unless
+``--db-url`` is given; the target tables are cleared first), then all four
+paths are timed on the same ``energy_type`` query.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault("DB_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import EnergySource, EnergyType, EnergyTrack
+from app.utils.columnar import load_energy_cube
+from app.utils.energy_data import monthly_totals_by_source, totals_by_source
+from benchmarks import datagen
+from benchmarks.results import write_results
+
+
+def legacy_pivot(db, energy_type):
+    raw = db.query(
+        EnergyTrack.start_time,
+        EnergyTrack.kwh,
+        EnergySource.name.label("source"),
+        EnergyType.name.label("type"),
+    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
+     .join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
+     .filter(EnergyType.name == energy_type) \
+     .all()
+
+    pivot = defaultdict(lambda: defaultdict(float))
+    for start, kwh, source, _ in raw:
+        pivot[(start.year, start.month)][source] += float(kwh)
+    return pivot
+
+
+def legacy_totals(db, energy_type):
+    totals = defaultdict(float)
+    for sources in legacy_pivot(db, energy_type).values():
+        for source, kwh in sources.items():
+            totals[source] += kwh
+    return totals
+
+
+def cube_pivot(db, energy_type):
+    pivot = load_energy_cube(db, use_rollup=False).pivot(energy_type)
+    return {(period.year, period.month): sources for period, sources in pivot.items()}
+
+
+def cube_totals(db, energy_type):
+    cube = load_energy_cube(db, use_rollup=False)
+    cents, counts = cube.type_slice(energy_type)
+    return {
+        source: int(cents[i].sum()) / 100
+        for i, source in enumerate(cube.sources)
+        if counts[i].any()
+    }
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--db-url", default=None, help="Scratch database URL (default: temporary SQLite file)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="Also write the timings as JSON")
+    args = parser.parse_args()
+
+    tmpdir = None
+    db_url = args.db_url
+    if db_url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    engine = create_engine(db_url)
+    Session = sessionmaker(bind=engine)
+    results = []
+
+    print(f"{'rows':>12} {'query':<10} {'python (s)':>12} {'sql (s)':>10} {'rollup (s)':>11} "
+          f"{'numpy (s)':>10} {'speedup':>9}")
+    for rows in args.rows:
+        datagen.load(engine, datagen.Spec(tracks=rows, seed=args.seed))
+        db = Session()
+        try:
+            for name, legacy, pushed_down, columnar in (
+                ("monthly", legacy_pivot, monthly_totals_by_source, cube_pivot),
+                ("summary", legacy_totals, totals_by_source, cube_totals),
+            ):
+                t_legacy, expected = timed(legacy, db, "generation", repeat=args.repeat)
+                t_sql, actual = timed(pushed_down, db, "generation", False, repeat=args.repeat)
+                t_rollup, rolled = timed(pushed_down, db, "generation", True, repeat=args.repeat)
+                t_numpy, cubed = timed(columnar, db, "generation", repeat=args.repeat)
+                _assert_same(expected, actual)
+                _assert_same(expected, rolled)
+                _assert_same(expected, cubed)
+                print(f"{rows:>12,} {name:<10} {t_legacy:>12.4f} {t_sql:>10.4f} {t_rollup:>11.4f} "
+                      f"{t_numpy:>10.4f} {t_legacy / t_sql:>8.1f}x")
+                for path, seconds in (("python", t_legacy), ("sql", t_sql), ("rollup", t_rollup), ("numpy", t_numpy)):
+                    results.append({"name": f"{name}/{path}/{rows}", "seconds": seconds})
+        finally:
+            db.close()
+
+    engine.dispose()
+    if args.json:
+        write_results(args.json, "aggregation", vars(args), results)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+def _assert_same(expected, actual):
+    if expected and isinstance(next(iter(expected.values())), dict):
+        assert set(expected) == set(actual)
+        for key in expected:
+            _assert_same(expected[key], actual[key])
+        return
+    assert set(expected) == set(actual)
+    for key, value in expected.items():
+        # float accumulation in the legacy path drifts by well under a cent
+        assert abs(value - actual[key]) < 0.01 * max(1.0, abs(value) / 1e6), (key, value, actual[key])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Microbenchmark of per-request authentication overhead.
+
+Usage:
+    python benchmarks/bench_auth.py [--iterations 20000] [--json auth.json]
+
+Compares, per request:
+
+- ``legacy``: decode the JWT, then look the user up in the database (the old
+  ``get_current_user``),
+- ``claims (cold)``: verify and decode the JWT with an empty token cache,
+- ``claims (cached)``: the steady state of ``get_current_claims``,
+- ``user (cached)``: ``get_current_user`` with warm token and user caches,
+  awaited in a loop on an ``AsyncSession``, so the user cache's expiries
+  cost their real database round trip.
+
+The user table lives in a temporary SQLite file, so the database numbers are a
+lower bound for a networked Postgres.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault("DB_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User
+from app.core import authentication
+from app.core.jwt import create_access_token, decode_access_token
+from benchmarks.results import write_results
+
+
+def legacy(token, db):
+    user_id = decode_access_token(token)
+    return db.query(User).filter(User.id == int(user_id)).first()
+
+
+def claims_cold(token, db):
+    authentication.token_cache.clear()
+    return authentication.get_current_claims(token)
+
+
+def claims_cached(token, db):
+    return authentication.get_current_claims(token)
+
+
+async def user_cached(token, path, iterations):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    try:
+        async with AsyncSession(engine) as db:
+            await authentication.get_current_user(authentication.get_current_claims(token), db)  # warm up
+            start = time.perf_counter()
+            for _ in range(iterations):
+                await authentication.get_current_user(authentication.get_current_claims(token), db)
+            return time.perf_counter() - start
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--json", metavar="PATH", help="Also write the timings as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'auth.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        user = User(email="bench@test.com", username="bench", hashed_password="x")
+        db.add(user)
+        db.commit()
+        token = create_access_token({"sub": str(user.id), "email": user.email, "username": user.username})
+
+        print(f"{'path':<18} {'µs/request':>12}")
+        for name, fn in (
+            ("legacy", legacy),
+            ("claims (cold)", claims_cold),
+            ("claims (cached)", claims_cached),
+        ):
+            fn(token, db)  # warm up
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                fn(token, db)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<18} {elapsed / args.iterations * 1e6:>12.1f}")
+            results.append({"name": name, "us": elapsed / args.iterations * 1e6})
+
+        elapsed = asyncio.run(user_cached(token, path, args.iterations))
+        print(f"{'user (cached)':<18} {elapsed / args.iterations * 1e6:>12.1f}")
+        results.append({"name": "user (cached)", "us": elapsed / args.iterations * 1e6})
+
+        db.close()
+        engine.dispose()
+
+    if args.json:
+        write_results(args.json, "auth", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Cold start of the API: time to first response and memory per worker.
+
+Usage:
+    python benchmarks/bench_cold_start.py                   # 1 worker, lazy vs prewarmed, 3 runs each
+    python benchmarks/bench_cold_start.py --workers 4 --repeat 5
+    python benchmarks/bench_cold_start.py --db-url postgresql+psycopg2://... --tracks 0
+    python benchmarks/bench_cold_start.py --json cold_start.json
+
+Each run starts ``uvicorn --factory app.main:create_app`` in a fresh process
+and measures, from the moment the process is spawned:
+
+- ``import``: importing ``app.main`` in a bare interpreter (measured once),
+- ``ready``: the first ``200`` from ``/``, i.e. the server is listening,
+- ``first /energy``: the first ``/energy/dashboard`` response, and its latency,
+  the request that pays for lazily created engines, registry and cube
+  unless ``PREWARM`` did it during startup,
+- the resident memory of each worker process, and of the whole process tree
+  (which includes the password hashing workers once they are started).
+
+The database is a temporary SQLite file filled by ``benchmarks/datagen.py``
+unless ``--db-url`` is given.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import datagen
+from benchmarks.results import write_results
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+POLL_SECONDS = 0.005
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> list:
+    # Per thread: the hashing pool is started from a worker thread
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    return children
+
+
+def _rss_mib(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _tree(pid: int) -> list:
+    pids = [pid]
+    for child in _children(pid):
+        pids += _tree(child)
+    return pids
+
+
+def import_seconds(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=BACKEND, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def run_once(env: dict, workers: int, token: str) -> dict:
+    import httpx
+
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "uvicorn", "--factory", "app.main:create_app",
+        "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+    ]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, cwd=BACKEND)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {server.returncode}")
+                try:
+                    if client.get("/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(POLL_SECONDS)
+            ready = time.perf_counter() - start
+
+            sent = time.perf_counter()
+            res = client.get(
+                "/energy/dashboard", params={"energy_type": "generation", "highlight": "solar"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            res.raise_for_status()
+            first = time.perf_counter()
+
+        # With --workers 1 uvicorn serves from the process it started in
+        serving = _children(server.pid) if workers > 1 else [server.pid]
+        worker_rss = [_rss_mib(pid) for pid in serving]
+        return {
+            "ready_s": ready,
+            "first_energy_s": first - start,
+            "first_energy_ms": (first - sent) * 1000,
+            "worker_rss_mib": statistics.mean(worker_rss),
+            "total_rss_mib": sum(_rss_mib(pid) for pid in _tree(server.pid)),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tracks", type=int, default=50_000, help="Tracks to generate (0: use the database as is)")
+    parser.add_argument("--db-url", default=None, help="Database URL (default: temporary SQLite file)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    db_url = args.db_url or f"sqlite:///{os.path.join(tmpdir.name, 'cold.db')}"
+    env = {
+        **os.environ,
+        "DB_URL": db_url,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark-secret"),
+        "ALGORITHM": os.environ.get("ALGORITHM", "HS256"),
+        "ACCESS_TOKEN_EXPIRE_MINUTES": os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"),
+    }
+    os.environ.update({k: env[k] for k in ("DB_URL", "SECRET_KEY", "ALGORITHM", "ACCESS_TOKEN_EXPIRE_MINUTES")})
+
+    from app.core.jwt import create_access_token
+    from app.database import engine
+
+    if args.tracks:
+        datagen.load(engine, datagen.Spec(tracks=args.tracks))
+    user_id = datagen.bench_user(engine)
+    token = create_access_token({"sub": str(user_id), "email": datagen.BENCH_EMAIL, "username": "bench"})
+    engine.dispose()
+
+    imported = import_seconds(env)
+    print(f"import app.main: {imported * 1000:.0f} ms")
+    print(f"{'mode':<9} {'workers':>7} {'ready (s)':>10} {'first /energy (s)':>18} {'its latency (ms)':>17} "
+          f"{'RSS/worker (MiB)':>17} {'RSS tree (MiB)':>15}")
+    results = [{"name": "import", "seconds": imported}]
+    for mode, prewarm in (("lazy", "false"), ("prewarm", "true")):
+        runs = [run_once({**env, "PREWARM": prewarm}, args.workers, token) for _ in range(args.repeat)]
+        # Medians, so one slow spawn doesn't skew the comparison
+        row = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(f"{mode:<9} {args.workers:>7} {row['ready_s']:>10.2f} {row['first_energy_s']:>18.2f} "
+              f"{row['first_energy_ms']:>17.1f} {row['worker_rss_mib']:>17.1f} {row['total_rss_mib']:>15.1f}")
+        results.append({"name": f"{mode}/{args.workers}", **row})
+
+    tmpdir.cleanup()
+    if args.json:
+        write_results(args.json, "cold_start", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
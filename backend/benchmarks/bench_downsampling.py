@@ -0,0 +1,99 @@
+"""Benchmark downsampling of long series to chart-sized ones.
+
+Times the vectorized ``lttb`` and ``minmax`` from ``app.utils.downsample``
+on random-walk series with a few spikes, against a per-point Python LTTB, and
+checks that the spikes survive.
+
+Usage:
+    python benchmarks/bench_downsampling.py                       # 1M points, 1 and 5 series, 500 points out
+    python benchmarks/bench_downsampling.py --points 100000 1000000 --series 5 --max-points 300
+    python benchmarks/bench_downsampling.py --skip-python         # the Python loop takes seconds at 1M
+    python benchmarks/bench_downsampling.py --json downsampling.json
+
+The Python baseline downsamples the first series only; its time is per series.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.utils.downsample import keep, lttb, minmax
+from benchmarks.results import write_results
+
+
+def python_lttb(data, threshold):
+    size = len(data)
+    every = (size - 2) / (threshold - 2)
+    a, kept = 0, [0]
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, size)
+        avg_x = sum(range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(data[avg_start:avg_end]) / (avg_end - avg_start)
+        best, chosen = -1.0, None
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((a - avg_x) * (data[j] - data[a]) - (a - j) * (avg_y - data[a]))
+            if area > best:
+                best, chosen = area, j
+        kept.append(chosen)
+        a = chosen
+    return kept + [size - 1]
+
+
+def series(n_series: int, n_points: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 1, (n_series, n_points)).cumsum(axis=1)
+    peaks = rng.integers(0, n_points, n_series)
+    y[np.arange(n_series), peaks] += 10 * np.abs(y).max()
+    return y, peaks
+
+
+def best_of(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--series", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--max-points", type=int, default=500)
+    parser.add_argument("--skip-python", action="store_true", help="Don't time the per-point Python LTTB")
+    parser.add_argument("--json", metavar="PATH", help="Also write the timings as JSON")
+    args = parser.parse_args()
+
+    results = []
+
+    print(f"{'points':>9} {'series':>6} {'lttb (ms)':>10} {'minmax (ms)':>12} {'keep (ms)':>10} "
+          f"{'python lttb (ms)':>17} {'peaks kept':>11}")
+    for n_points in args.points:
+        for n_series in args.series:
+            y, peaks = series(n_series, n_points)
+            rows = np.arange(n_series)
+            kept = all(method(y, args.max_points)[rows, peaks].all() for method in (lttb, minmax))
+
+            t_lttb = best_of(lttb, y, args.max_points)
+            t_minmax = best_of(minmax, y, args.max_points)
+            t_keep = best_of(keep, y, args.max_points)
+            t_python = float("nan") if args.skip_python else best_of(python_lttb, y[0].tolist(), args.max_points, repeat=1)
+            print(f"{n_points:>9} {n_series:>6} {t_lttb:>10.1f} {t_minmax:>12.1f} {t_keep:>10.1f} "
+                  f"{t_python:>17.1f} {str(kept):>11}")
+            for name, ms in (("lttb", t_lttb), ("minmax", t_minmax), ("keep", t_keep)):
+                results.append({"name": f"{name}/{n_series}x{n_points}", "ms": ms})
+            if not args.skip_python:
+                results.append({"name": f"python_lttb/{n_points}", "ms": t_python})
+
+    if args.json:
+        write_results(args.json, "downsampling", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
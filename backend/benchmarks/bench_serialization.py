@@ -0,0 +1,130 @@
+"""Benchmark the cost of turning /energy view rows into a response body.
+
+Three paths are compared for the trends, summary, composed and dashboard
+payloads:
+
+- ``fastapi``: what FastAPI does for a route that returns plain data,
+  i.e. validate against the ``response_model``, ``jsonable_encoder`` and
+  ``json.dumps`` in ``JSONResponse``,
+- ``orjson``: the routes' default path, which encodes the rows directly,
+- ``msgpack``: the same, for clients sending ``Accept: application/msgpack``.
+
+Usage:
+    python benchmarks/bench_serialization.py                 # 12 months and 10 years
+    python benchmarks/bench_serialization.py --months 12 60 240 --number 2000
+    python benchmarks/bench_serialization.py --json serialization.json
+
+Payloads are built from a synthetic cube, so no database is needed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault("DB_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+import numpy as np
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.routes.energy import _composed_rows, _summary_rows, _trends_rows
+from app.schemas import ComposedPoint, DashboardOut, SummaryPoint, TrendsPoint
+from app.utils.columnar import EnergyCube
+from app.utils.periods import Granularity, ordinal
+from app.utils.serialization import JSON, MSGPACK, encode
+from benchmarks.results import write_results
+
+SOURCES = ("geothermal", "grid", "hydro", "solar", "tidal")
+TYPES = ("consumption", "generation")
+
+
+def synthetic_cube(months: int, seed: int = 0) -> EnergyCube:
+    rng = np.random.default_rng(seed)
+    shape = (len(TYPES), len(SOURCES), months)
+    cents = rng.integers(10_000, 10_000_000, size=shape, dtype=np.int64)
+    counts = rng.integers(1, 1_000, size=shape, dtype=np.int64)
+    first = ordinal(datetime(2015, 1, 1), Granularity.month)
+    return EnergyCube(TYPES, SOURCES, Granularity.month, first, cents, counts)
+
+
+def payloads(cube: EnergyCube):
+    trends = _trends_rows(cube, "generation")
+    return {
+        "trends": (List[TrendsPoint], trends),
+        "summary": (List[SummaryPoint], _summary_rows(cube, "generation")),
+        "composed": (List[ComposedPoint], _composed_rows(cube, "generation", "solar")),
+        "dashboard": (DashboardOut, {
+            "trends": trends,
+            "composition": trends,
+            "summary": _summary_rows(cube, "generation"),
+            "composed": _composed_rows(cube, "generation", "solar"),
+        }),
+    }
+
+
+def _serialize(field, data):
+    # serialize_response is a coroutine only to offload sync routes to a
+    # thread; drive it to completion without an event loop
+    coro = serialize_response(field=field, response_content=data, is_coroutine=True)
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("serialize_response awaited unexpectedly")
+
+
+def fastapi_path(field, data) -> bytes:
+    return JSONResponse(_serialize(field, data)).body
+
+
+def per_call_us(fn, *args, number: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months", type=int, nargs="+", default=[12, 120])
+    parser.add_argument("--number", type=int, default=1000, help="Encodings per timing run")
+    parser.add_argument("--json", metavar="PATH", help="Also write the timings as JSON")
+    args = parser.parse_args()
+
+    results = []
+
+    print(f"{'months':>6} {'payload':<10} {'fastapi (us)':>13} {'orjson (us)':>12} {'msgpack (us)':>13} "
+          f"{'speedup':>8} {'json (B)':>9} {'msgpack (B)':>12}")
+    for months in args.months:
+        for name, (model, data) in payloads(synthetic_cube(months)).items():
+            field = create_model_field(name=f"Response_{name}", type_=model, mode="serialization")
+            baseline, fast, packed = fastapi_path(field, data), encode(data, JSON), encode(data, MSGPACK)
+
+            t_fastapi = per_call_us(fastapi_path, field, data, number=args.number)
+            t_orjson = per_call_us(encode, data, JSON, number=args.number)
+            t_msgpack = per_call_us(encode, data, MSGPACK, number=args.number)
+            print(f"{months:>6} {name:<10} {t_fastapi:>13.1f} {t_orjson:>12.1f} {t_msgpack:>13.1f} "
+                  f"{t_fastapi / t_orjson:>7.1f}x {len(fast):>9} {len(packed):>12}")
+            assert json.loads(fast) == json.loads(baseline)
+            for path, us in (("fastapi", t_fastapi), ("orjson", t_orjson), ("msgpack", t_msgpack)):
+                results.append({"name": f"{name}/{path}/{months}", "us": us})
+
+    if args.json:
+        write_results(args.json, "serialization", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Throughput of a sync route on the threadpool vs. the async route stack.
+
+Usage:
+    python benchmarks/bench_sync_vs_async.py                       # temporary SQLite file
+    python benchmarks/bench_sync_vs_async.py --db-url postgresql+psycopg2://user:pw@localhost/bench
+
+Two routes run the same uncached aggregation (``monthly_totals_by_source`` on
+raw tracks):
+
+- ``sync``: a plain ``def`` route with a psycopg2/pysqlite ``Session``, which
+  Starlette runs on its threadpool (40 threads by default),
+- ``async``: an ``async def`` route with an ``AsyncSession`` on the async
+  engine from ``app.database``, sized by ``DB_POOL_SIZE``/``DB_MAX_OVERFLOW``.
+
+For each level of ``--clients`` concurrent clients the app is driven in-process
+through httpx's ASGI transport and requests/second plus p50/p99 are printed.
+The scratch database's tables are dropped and recreated first. On SQLite both
+paths serialise on the file lock, so run against Postgres for meaningful
+numbers.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+async def drive(client, path, clients, requests_per_client):
+    latencies = []
+
+    async def worker():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            res = await client.get(path)
+            res.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return len(latencies) / elapsed, q[49], q[98]
+
+
+async def run(args):
+    import httpx
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.orm import Session
+
+    from app.database import SessionLocal, get_db, async_engine
+    from app.utils.energy_data import monthly_totals_by_source
+
+    app = FastAPI()
+
+    def get_sync_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def by_month(pivot):
+        return {f"{year}-{month:02d}": sources for (year, month), sources in pivot.items()}
+
+    @app.get("/sync")
+    def sync_route(db: Session = Depends(get_sync_db)):
+        return by_month(monthly_totals_by_source(db, "generation", use_rollup=False))
+
+    @app.get("/async")
+    async def async_route(db=Depends(get_db)):
+        return by_month(await db.run_sync(monthly_totals_by_source, "generation", use_rollup=False))
+
+    transport = httpx.ASGITransport(app=app)
+    print(f"{'clients':>8} {'stack':<6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for clients in args.clients:
+            for stack in ("sync", "async"):
+                rps, p50, p99 = await drive(client, f"/{stack}", clients, args.requests_per_client)
+                print(f"{clients:>8} {stack:<6} {rps:>9.1f} {p50:>9.2f} {p99:>9.2f}")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--db-url", default=None, help="Scratch database URL (default: temporary SQLite file)")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db_url:
+        os.environ["DB_URL"] = args.db_url
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        os.environ["DB_URL"] = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    from sqlalchemy import insert
+    from app.database import Base, engine
+    from app.models import EnergySource, EnergyType, EnergyTrack, Site
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(EnergyType), [{"id": 1, "name": "generation"}, {"id": 2, "name": "consumption"}])
+        conn.execute(insert(EnergySource), [{"id": i, "name": f"source-{i}"} for i in range(1, 6)])
+        conn.execute(insert(Site), [{"id": 1, "name": "bench"}])
+        conn.execute(insert(EnergyTrack), [
+            {"site_id": 1, "type_id": i % 2 + 1, "source_id": i % 5 + 1,
+             "start_time": datetime(2024, 1, 1) + timedelta(hours=i % 8760), "kwh": 100 + i % 900}
+            for i in range(args.rows)
+        ])
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        engine.dispose()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare two benchmark result files, e.g. from two commits.
+
+Usage:
+    python benchmarks/compare.py results/base.json results/head.json
+    python benchmarks/compare.py base.json head.json --threshold 0.05 --all
+
+Both files are either single-benchmark results (``--json`` of any benchmark
+script) or suites from ``benchmarks/run_suite.py``. Every metric measured in
+both is compared; changes beyond ``--threshold`` (relative, default 10%) are
+printed, as are all of them with ``--all``. Exits with status 1 when any
+metric regressed beyond the threshold, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import sys
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.results import HIGHER_IS_BETTER
+
+
+def measurements(path: str) -> dict:
+    """``{(benchmark, name, metric): value}`` for a result or suite file."""
+    with open(path) as f:
+        data = json.load(f)
+    runs = data["benchmarks"].values() if "benchmarks" in data else [data]
+    values = {}
+    for run in runs:
+        for result in run["results"]:
+            for metric, value in result.items():
+                if metric != "name" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[(run["benchmark"], result["name"], metric)] = value
+    return values
+
+
+def change(metric: str, old: float, new: float) -> float:
+    """Relative change, positive when ``new`` is worse."""
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    delta = (new - old) / abs(old)
+    return -delta if metric in HIGHER_IS_BETTER else delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--all", action="store_true", help="Print unchanged metrics too")
+    args = parser.parse_args()
+
+    base, head = measurements(args.base), measurements(args.head)
+    regressions = 0
+    print(f"{'benchmark':<14} {'name':<28} {'metric':<8} {'base':>12} {'head':>12} {'change':>9}")
+    for key in sorted(base.keys() & head.keys()):
+        worse = change(key[2], base[key], head[key])
+        regressed = worse > args.threshold
+        regressions += regressed
+        if args.all or abs(worse) > args.threshold:
+            flag = "  REGRESSED" if regressed else ""
+            delta = (head[key] - base[key]) / abs(base[key]) if base[key] else (0.0 if not head[key] else float("inf"))
+            print(f"{key[0]:<14} {key[1]:<28} {key[2]:<8} {base[key]:>12.4g} {head[key]:>12.4g} "
+                  f"{delta:>+8.1%}{flag}")
+    for name, keys in (("only in base", base.keys() - head.keys()), ("only in head", head.keys() - base.keys())):
+        if keys:
+            print(f"{len(keys)} metrics {name}")
+
+    print(f"{regressions} regressions beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Load test: /energy latency while a burst of logins is being hashed.
+
+Usage:
+    python benchmarks/load_login_burst.py                      # bcrypt in the process pool
+    python benchmarks/load_login_burst.py --hash-workers 0     # old behaviour: bcrypt in the threadpool
+
+The app runs in-process (httpx ``ASGITransport``) against a temporary SQLite
+database. A steady stream of ``/energy/summary?raw=true`` probes is measured
+on its own and then again while ``--logins`` concurrent logins are in flight,
+and p50/p95/p99 latency is printed for both phases.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    q = statistics.quantiles(ordered, n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98], "n": len(ordered)}
+
+
+async def probe(client, headers, stop, latencies, concurrency):
+    async def worker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            res = await client.get("/energy/summary", params={"energy_type": "generation", "raw": True},
+                                   headers=headers)
+            res.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def login_burst(client, n):
+    async def login():
+        res = await client.post("/auth/login", data={"email": "bench@test.com", "password": "benchpass"})
+        return res.status_code
+
+    return await asyncio.gather(*(login() for _ in range(n)))
+
+
+async def run(args):
+    import httpx
+    from app.main import app
+    from app.core import hashing
+    from app.core.jwt import create_access_token
+
+    token = create_access_token({"sub": "1", "email": "bench@test.com", "username": "bench"})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        baseline = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, baseline, args.probe_concurrency))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await task
+
+        during = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, during, args.probe_concurrency))
+        start = time.perf_counter()
+        statuses = await login_burst(client, args.logins)
+        burst_seconds = time.perf_counter() - start
+        stop.set()
+        await task
+
+    hashing.shutdown_pool()
+
+    print(f"hash workers: {hashing.HASH_POOL_WORKERS}, logins: {args.logins} "
+          f"({statuses.count(200)} ok, {statuses.count(503)} shed with 503) in {burst_seconds:.2f}s")
+    print(f"{'phase':<14} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, samples in (("baseline", baseline), ("login burst", during)):
+        p = percentiles(samples)
+        print(f"{name:<14} {p['n']:>6} {p['p50']:>9.2f} {p['p95']:>9.2f} {p['p99']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--hash-workers", type=int, default=None,
+                        help="Size of the bcrypt process pool (0 = hash in the request threadpool)")
+    parser.add_argument("--max-pending", type=int, default=None, help="Queue bound before logins get a 503")
+    parser.add_argument("--probe-concurrency", type=int, default=4)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ["DB_URL"] = f"sqlite:///{os.path.join(tmpdir.name, 'load.db')}"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    if args.hash_workers is not None:
+        os.environ["HASH_POOL_WORKERS"] = str(args.hash_workers)
+    if args.max_pending is not None:
+        os.environ["HASH_POOL_MAX_PENDING"] = str(args.max_pending)
+
+    from app.database import Base, engine, SessionLocal
+    from app.models import User, EnergySource, EnergyType, EnergyTrack, Site, UserSite
+    from app.core.hashing import hash_password
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = User(email="bench@test.com", username="bench", hashed_password=hash_password("benchpass"))
+    site = Site(name="bench")
+    db.add_all([user, site])
+    types = [EnergyType(name="generation"), EnergyType(name="consumption")]
+    sources = [EnergySource(name=n) for n in ("solar", "tidal", "grid", "hydro", "geothermal")]
+    db.add_all(types + sources)
+    db.flush()
+    db.add(UserSite(user_id=user.id, site_id=site.id))
+    for i in range(5000):
+        db.add(EnergyTrack(site_id=site.id, type_id=types[i % 2].id, source_id=sources[i % 5].id,
+                           start_time=datetime(2024, 1, 1) + timedelta(hours=i % 8760), kwh=100 + i % 900))
+    db.commit()
+    db.close()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        engine.dispose()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Machine-readable benchmark results, so runs can be compared across commits.
+
+Every script that takes ``--json PATH`` writes::
+
+    {
+      "benchmark": "aggregation",
+      "meta": {"commit": "...", "dirty": false, "python": "3.12.1", ...},
+      "params": {...the command line...},
+      "results": [{"name": "monthly/rollup/10000", "seconds": 0.0012, ...}, ...]
+    }
+
+``name`` identifies a measurement across runs; every other numeric field is
+a metric. ``benchmarks/compare.py`` diffs two such files (or two suite files
+made by ``benchmarks/run_suite.py``), reading a metric as lower-is-better
+unless its name is in ``HIGHER_IS_BETTER``.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+HIGHER_IS_BETTER = {"rps", "rows_per_second", "speedup"}
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def metadata() -> dict:
+    """Where and on what a run happened."""
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path: str, benchmark: str, params: dict, results: list) -> None:
+    with open(path, "w") as f:
+        json.dump(
+            {"benchmark": benchmark, "meta": metadata(), "params": params, "results": results},
+            f, indent=2, default=str,
+        )
+        f.write("\n")
+
+
+def percentiles(samples) -> dict:
+    """p50/p95/p99 of latency samples, in their unit."""
+    q = statistics.quantiles(sorted(samples), n=100, method="inclusive")
+    return {"p50": q[49], "p95": q[94], "p99": q[98]}
@@ -0,0 +1,96 @@
+"""Run the benchmark suite and merge the results into one JSON file.
+
+Usage:
+    python benchmarks/run_suite.py                          # quick profile, writes benchmarks/results/<commit>.json
+    python benchmarks/run_suite.py --profile full --out head.json
+    python benchmarks/run_suite.py --only aggregation load_energy
+    python benchmarks/compare.py benchmarks/results/<base>.json benchmarks/results/<head>.json
+
+Each benchmark runs in its own process with fixed arguments and seeds, on
+temporary SQLite databases, so two runs on the same machine differ only by
+the code under test. ``quick`` takes a few minutes; ``full`` uses the
+datasets the individual scripts default to. Pass ``--db-url`` to run the
+database benchmarks against a local Postgres instead (its energy tables are
+replaced).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.results import metadata
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# benchmark -> (script, arguments per profile)
+SUITE = {
+    "aggregation": ("bench_aggregation.py", {
+        "quick": ["--rows", "10000", "100000"],
+        "full": ["--rows", "10000", "1000000", "10000000"],
+    }),
+    "auth": ("bench_auth.py", {
+        "quick": ["--iterations", "5000"],
+        "full": ["--iterations", "20000"],
+    }),
+    "serialization": ("bench_serialization.py", {
+        "quick": ["--months", "12", "120", "--number", "300"],
+        "full": ["--months", "12", "120", "600"],
+    }),
+    "downsampling": ("bench_downsampling.py", {
+        "quick": ["--points", "100000", "--skip-python"],
+        "full": ["--points", "100000", "1000000"],
+    }),
+    "load_energy": ("load_energy.py", {
+        "quick": ["--tracks", "100000", "--requests", "200"],
+        "full": ["--tracks", "1000000", "--requests", "2000", "--concurrency", "32"],
+    }),
+    "cold_start": ("bench_cold_start.py", {
+        "quick": ["--tracks", "20000", "--repeat", "2"],
+        "full": ["--workers", "4", "--repeat", "5"],
+    }),
+    "tenants": ("bench_tenants.py", {
+        "quick": ["--tenants", "1", "10", "50", "--tracks-per-tenant", "1000", "--requests", "100"],
+        "full": ["--tenants", "1", "10", "100", "1000"],
+    }),
+}
+# Benchmarks that take --db-url
+USES_DATABASE = {"aggregation", "load_energy", "cold_start", "tenants"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=["quick", "full"], default="quick")
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITE), help="Run these benchmarks only")
+    parser.add_argument("--db-url", help="Database for the database benchmarks (default: temporary SQLite)")
+    parser.add_argument("--out", help="Where to write the suite results (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    meta = metadata()
+    out = args.out or os.path.join(HERE, "results", f"{(meta['commit'] or 'unknown')[:12]}.json")
+    suite = {"meta": meta, "profile": args.profile, "benchmarks": {}}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in args.only or SUITE:
+            script, profiles = SUITE[name]
+            path = os.path.join(tmpdir, f"{name}.json")
+            command = [sys.executable, os.path.join(HERE, script), *profiles[args.profile], "--json", path]
+            if args.db_url and name in USES_DATABASE:
+                command += ["--db-url", args.db_url]
+            print(f"==> {name}: {' '.join(command[1:])}", flush=True)
+            subprocess.run(command, check=True)
+            with open(path) as f:
+                suite["benchmarks"][name] = json.load(f)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(suite, f, indent=2)
+        f.write("\n")
+    print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import Site
+from app.utils.anomalies import BACKFILL_BATCH_SIZE, DEFAULT_THRESHOLD, backfill_stats, find_anomalies
+from app import listeners
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain energy_reading_stats and list the anomalies it finds")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="Recompute the stats from every track, oldest first")
+    backfill.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    listing = commands.add_parser("list", help="Print the anomalies of every site, or of one")
+    listing.add_argument("--site", help="Only this site")
+    listing.add_argument("--type", help="Only this energy type")
+    listing.add_argument("--source", help="Only this source")
+    listing.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+    listeners.register()
+
+    db = SessionLocal()
+    try:
+        if args.command == "backfill":
+            start = time.perf_counter()
+            readings = backfill_stats(db, args.batch_size)
+            print(f"Recomputed energy_reading_stats from {readings:,} readings in {time.perf_counter() - start:.1f}s.")
+            return 0
+
+        site_ids = None
+        if args.site is not None:
+            site_ids = db.scalars(select(Site.id).where(Site.name == args.site)).all()
+            if not site_ids:
+                raise SystemExit(f"No site named {args.site}")
+        rows = find_anomalies(db, site_ids=site_ids, energy_type=args.type, source=args.source, threshold=args.threshold)
+        for r in rows:
+            print(
+                f"{r['site']} {r['type']} {r['source']} {r['month']} ({r['kind']}): "
+                f"{r['kwh']} kWh, expected {r['expected_kwh']} kWh, z={r['z']}"
+            )
+        print(f"{len(rows)} anomalies.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+import sys
+import argparse
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import SessionLocal
+from app.utils.rollup import check_rollup_consistency, rebuild_rollup
+from app import listeners
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check energy_monthly_rollup against energy_tracks")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollup if it has drifted")
+    args = parser.parse_args()
+    listeners.register()
+
+    db = SessionLocal()
+    try:
+        mismatches = check_rollup_consistency(db)
+        if not mismatches:
+            print("energy_monthly_rollup is consistent with energy_tracks.")
+            return 0
+
+        for m in mismatches:
+            print(
+                f"site={m['site_id']} type={m['type_id']} source={m['source_id']} year={m['year']} month={m['month']}: "
+                f"raw {m['raw_kwh']} kWh / {m['raw_count']} tracks, "
+                f"rollup {m['rollup_kwh']} kWh / {m['rollup_count']} tracks"
+            )
+        print(f"{len(mismatches)} inconsistent cell(s).")
+
+        if args.rebuild:
+            rebuild_rollup(db)
+            print("Rebuilt energy_monthly_rollup from energy_tracks.")
+            return 0
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
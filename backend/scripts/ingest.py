@@ -0,0 +1,56 @@
+import os
+import sys
+import argparse
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import SessionLocal
+from app.utils.ingest import DEFAULT_CHUNK_SIZE, DEFAULT_SITE, READERS, IngestError, IngestStats, ingest_file
+from app import listeners
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream CSV/NDJSON/Parquet files of meter readings into energy_tracks. Records need "
+                    "source, type and kwh, optionally site, plus either start (and optionally end, meter_id) or month "
+                    "(and optionally year).",
+    )
+    parser.add_argument("paths", nargs="+", help="Files to load; the format is taken from the extension")
+    parser.add_argument("--format", choices=sorted(READERS), help="Override the detected file format")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per batch and commit")
+    parser.add_argument("--method", choices=["auto", "copy", "executemany"], default="auto",
+                        help="COPY is used automatically on PostgreSQL with psycopg2")
+    parser.add_argument("--year", type=int, default=None,
+                        help="Year for month-only records without a year column (default: the current year)")
+    parser.add_argument("--site", default=DEFAULT_SITE,
+                        help=f"Site for records without a site column (default: {DEFAULT_SITE})")
+    parser.add_argument("--quiet", action="store_true", help="Only print the final summary")
+    args = parser.parse_args()
+    listeners.register()
+
+    def progress(stats: IngestStats):
+        if not args.quiet:
+            print(f"  {stats.rows:>12,} rows  {stats.rows_per_sec:>10,.0f} rows/s  "
+                  f"peak RSS {stats.peak_rss_mb:,.1f} MiB", flush=True)
+
+    stats = IngestStats()
+    db = SessionLocal()
+    try:
+        for path in args.paths:
+            print(f"Loading {path}")
+            ingest_file(db, path, fmt=args.format, chunk_size=args.chunk_size, method=args.method,
+                        stats=stats, on_chunk=progress, default_year=args.year, default_site=args.site)
+    except (IngestError, OSError) as exc:
+        print(f"Ingestion failed: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    print(f"Loaded {stats.rows:,} rows in {stats.seconds:.1f}s "
+          f"({stats.rows_per_sec:,.0f} rows/s, peak RSS {stats.peak_rss_mb:,.1f} MiB).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
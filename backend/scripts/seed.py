@@ -1,16 +1,22 @@
 import os
 import sys
 import random
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import select, text
 
 # Add backend root to Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.database import SessionLocal
-from app.models import EnergySource, EnergyType, EnergyTrack
+from app.models import EnergySource, EnergyType, EnergyTrack, Site, User, UserSite
+from app.utils.ingest import DEFAULT_SITE
+from app.utils.partitions import ensure_month_partitions
+from app.utils.periods import add_months
+from app import cache, listeners
 
-# Configuration
+# Configuration: monthly readings for the last two full years
+YEARS = [datetime.now().year - 2, datetime.now().year - 1]
 MONTHS = list(range(1, 13))
 ENERGY_TYPES = ["generation", "consumption"]
 SOURCES = ["solar", "tidal", "grid", "hydropower", "geothermal"]
@@ -22,14 +28,28 @@ KWH_RANGES = {
 }
 
 def seed_energy_tracks():
+    listeners.register()
     db: Session = SessionLocal()
 
-    # Clear existing records
+    # Clear existing records. Raw statements bypass the cache listeners, so
+    # every site's tracks and the dimensions are marked changed by hand
+    cache.mark_tracks_changed(db)
+    cache.mark_changed(db, cache.DIMENSIONS_VERSION)
+    db.execute(text("DELETE FROM energy_monthly_rollup"))
+    db.execute(text("DELETE FROM energy_reading_stats"))
+    db.execute(text("DELETE FROM energy_reading_sketches"))
     db.execute(text("DELETE FROM energy_tracks"))
     db.execute(text("DELETE FROM energy_sources"))
     db.execute(text("DELETE FROM energy_types"))
     db.commit()
 
+    # Every existing user can see the seeded site
+    site = db.scalars(select(Site).where(Site.name == DEFAULT_SITE)).first() or Site(name=DEFAULT_SITE)
+    db.add(site)
+    db.flush()
+    granted = set(db.scalars(select(UserSite.user_id).where(UserSite.site_id == site.id)))
+    db.add_all(UserSite(user_id=user_id, site_id=site.id) for user_id in db.scalars(select(User.id)) if user_id not in granted)
+
     # Insert energy types
     type_ids = {}
     for energy_type in ENERGY_TYPES:
@@ -46,18 +66,25 @@ def seed_energy_tracks():
         db.flush()
         source_ids[source] = es.id
 
+    ensure_month_partitions(db, datetime(YEARS[0], 1, 1), datetime(YEARS[-1], 12, 1))
+
     # Add energy track entries
     for source in SOURCES:
         for etype in ENERGY_TYPES:
-            months = random.sample(MONTHS, k=random.randint(6, 12))  # randomly choose months
-            for month in months:
-                kwh = round(random.uniform(*KWH_RANGES[etype]), 2)
-                db.add(EnergyTrack(
-                    source_id=source_ids[source],
-                    type_id=type_ids[etype],
-                    month=month,
-                    kwh=kwh
-                ))
+            for year in YEARS:
+                months = random.sample(MONTHS, k=random.randint(6, 12))  # randomly choose months
+                for month in months:
+                    start = datetime(year, month, 1)
+                    kwh = round(random.uniform(*KWH_RANGES[etype]), 2)
+                    db.add(EnergyTrack(
+                        site_id=site.id,
+                        source_id=source_ids[source],
+                        type_id=type_ids[etype],
+                        meter_id=f"{source}-{etype}",
+                        start_time=start,
+                        end_time=add_months(start, 1),
+                        kwh=kwh
+                    ))
 
     db.commit()
     db.close()
@@ -0,0 +1,73 @@
+import os
+import sys
+import argparse
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import delete, func, select
+
+from app.database import SessionLocal
+from app.models import EnergyTrack, Site, User, UserSite
+from app import listeners
+
+
+def _user(db, email: str) -> User:
+    user = db.scalars(select(User).where(User.email == email.strip().lower())).first()
+    if user is None:
+        raise SystemExit(f"No user with email {email}")
+    return user
+
+
+def _site(db, name: str, create: bool = False) -> Site:
+    site = db.scalars(select(Site).where(Site.name == name)).first()
+    if site is None:
+        if not create:
+            raise SystemExit(f"No site named {name}")
+        site = Site(name=name)
+        db.add(site)
+        db.flush()
+    return site
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage sites and which users can see them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Sites with their track counts and users")
+    grant = commands.add_parser("grant", help="Let a user see a site (created if missing)")
+    revoke = commands.add_parser("revoke", help="Stop a user from seeing a site")
+    for command in (grant, revoke):
+        command.add_argument("email")
+        command.add_argument("site")
+    args = parser.parse_args()
+    listeners.register()
+
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            tracks = dict(db.execute(select(EnergyTrack.site_id, func.count()).group_by(EnergyTrack.site_id)).all())
+            users = {}
+            for site_id, email in db.execute(
+                select(UserSite.site_id, User.email).join(User, User.id == UserSite.user_id).order_by(User.email)
+            ):
+                users.setdefault(site_id, []).append(email)
+            for site in db.scalars(select(Site).order_by(Site.name)):
+                print(f"{site.name}: {tracks.get(site.id, 0):,} tracks; users: {', '.join(users.get(site.id, [])) or '-'}")
+        elif args.command == "grant":
+            user, site = _user(db, args.email), _site(db, args.site, create=True)
+            if db.get(UserSite, (user.id, site.id)) is None:
+                db.add(UserSite(user_id=user.id, site_id=site.id))
+            db.commit()
+            print(f"{user.email} can see {site.name}")
+        else:
+            user, site = _user(db, args.email), _site(db, args.site)
+            db.execute(delete(UserSite).where(UserSite.user_id == user.id, UserSite.site_id == site.id))
+            db.commit()
+            print(f"{user.email} can no longer see {site.name}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
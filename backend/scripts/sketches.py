@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+
+# Add backend root to Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import Site
+from app.utils.sketches import BACKFILL_BATCH_SIZE, backfill_sketches, find_percentiles
+from app import listeners
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain energy_reading_sketches and print the percentiles they give")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="Recompute the sketches from every track")
+    backfill.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    listing = commands.add_parser("list", help="Print p50/p95/p99 and the peak per source")
+    listing.add_argument("--site", help="Only this site")
+    listing.add_argument("--type", default="generation", help="Energy type (default: generation)")
+    listing.add_argument("--source", help="Only this source")
+    args = parser.parse_args()
+    listeners.register()
+
+    db = SessionLocal()
+    try:
+        if args.command == "backfill":
+            start = time.perf_counter()
+            readings = backfill_sketches(db, args.batch_size)
+            print(f"Recomputed energy_reading_sketches from {readings:,} readings in {time.perf_counter() - start:.1f}s.")
+            return 0
+
+        site_ids = None
+        if args.site is not None:
+            site_ids = db.scalars(select(Site.id).where(Site.name == args.site)).all()
+            if not site_ids:
+                raise SystemExit(f"No site named {args.site}")
+        for r in find_percentiles(db, site_ids=site_ids, energy_type=args.type, source=args.source):
+            print(
+                f"{r['source']}: {r['count']:,} readings, p50 {r['p50']} kWh, p95 {r['p95']} kWh, "
+                f"p99 {r['p99']} kWh, peak {r['peak_kwh']} kWh at {r['peak_at'] or 'unknown'}"
+            )
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# tests/conftest.py
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import listeners
+from app.database import Base
+from app.models import EnergySource, EnergyType, EnergyTrack, Site, User, UserSite
+
+# The fixtures write through the ORM before any test builds the app
+listeners.register()
+
+SOURCES = ["solar", "tidal", "grid", "hydro", "geothermal"]
+TYPES = ["generation", "consumption"]
+# Every seeded track belongs to this site, which user 1 (the client's stub user) can see
+SITE = "north"
+
+# Seeded readings are hourly and spread over two years
+SEED_START = datetime(2023, 1, 1)
+SEED_HOURS = 2 * 365 * 24
+
+
+# Throwaway SQLite file, so sync fixtures and the async app see the same data
+@pytest.fixture(scope="function")
+def db_path(tmp_path):
+    return tmp_path / "test.db"
+
+
+@pytest.fixture(scope="function")
+def db_engine(db_path):
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def async_db_engine(db_engine, db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    try:
+        yield engine
+    finally:
+        engine.sync_engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def db_session(db_engine):
+    session = sessionmaker(bind=db_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="function")
+def seeded(db_session):
+    rng = random.Random(42)
+    types = {name: EnergyType(name=name) for name in TYPES}
+    sources = {name: EnergySource(name=name) for name in SOURCES}
+    site = Site(name=SITE)
+    viewer = User(email="viewer@test.com", username="viewer", hashed_password="x")
+    db_session.add_all(list(types.values()) + list(sources.values()) + [site, viewer])
+    db_session.flush()
+    db_session.add(UserSite(user_id=viewer.id, site_id=site.id))
+
+    for _ in range(500):
+        start = SEED_START + timedelta(hours=rng.randrange(SEED_HOURS))
+        db_session.add(EnergyTrack(
+            site_id=site.id,
+            source_id=sources[rng.choice(SOURCES)].id,
+            type_id=types[rng.choice(TYPES)].id,
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            kwh=round(rng.uniform(100, 1000), 2),
+        ))
+    db_session.commit()
+    return db_session
+
+
+@pytest.fixture(scope="function")
+def client(async_db_engine, seeded):
+    """TestClient bound to the seeded database, authenticated as a stub user."""
+    from fastapi.testclient import TestClient
+
+    from app import cache
+    from app.main import app
+    from app.database import get_db, get_read_db, get_read_sessionmaker, get_sessionmaker
+    from app.core.authentication import get_current_claims
+    from app.schemas import TokenData
+
+    TestingSessionLocal = async_sessionmaker(bind=async_db_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with TestingSessionLocal() as db:
+            yield db
+
+    # Reads and writes share the one test database
+    for dependency in (get_db, get_read_db):
+        app.dependency_overrides[dependency] = override_get_db
+    for dependency in (get_sessionmaker, get_read_sessionmaker):
+        app.dependency_overrides[dependency] = lambda: TestingSessionLocal
+    app.dependency_overrides[get_current_claims] = lambda: TokenData(user_id=1, email="user@test.com", username="testuser")
+    cache.energy_cache.clear()
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        cache.energy_cache.clear()
@@ -0,0 +1,149 @@
+# tests/test_anomalies.py
+import csv
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import EnergySource, EnergyReadingStats, EnergyTrack, EnergyType, Site
+from app.utils import anomalies
+from app.utils.anomalies import backfill_stats, combine, remove, summarize
+from app.utils.ingest import ingest_file
+
+
+def _stats(db):
+    return {
+        (r.site_id, r.type_id, r.source_id, r.month): (r.count, r.mean, r.m2, r.ewma)
+        for r in db.scalars(select(EnergyReadingStats))
+    }
+
+
+def _assert_same_stats(actual, expected, ewma=True):
+    assert actual.keys() == expected.keys()
+    for key, (count, mean, m2, ewm) in expected.items():
+        assert actual[key][0] == count
+        assert actual[key][1:3] == pytest.approx((mean, m2), rel=1e-9, abs=1e-6)
+        if ewma:
+            assert actual[key][3] == pytest.approx(ewm, rel=1e-9)
+
+
+def test_batches_merge_into_the_statistics_of_the_whole_series():
+    rng = np.random.default_rng(7)
+    kwh = rng.gamma(4.0, 50.0, 1000)
+    keys = np.column_stack([np.ones(1000), np.ones(1000), rng.integers(1, 3, 1000), np.full(1000, 6)])
+    alpha = 0.1
+
+    merged = {}
+    for batch in np.array_split(np.arange(1000), 7):
+        for key, summary in summarize(keys[batch], kwh[batch], alpha).items():
+            merged[key] = combine(merged.get(key, anomalies._EMPTY), summary)
+
+    for source in (1, 2):
+        values = kwh[keys[:, 2] == source]
+        ewma = values[0]
+        for value in values[1:]:
+            ewma = (1 - alpha) * ewma + alpha * value
+        count, mean, m2, ewm = merged[(1, 1, source, 6)]
+        assert count == len(values)
+        assert (mean, m2 / (count - 1), ewm) == pytest.approx((values.mean(), values.var(ddof=1), ewma), rel=1e-9)
+
+        # Removing readings is exact for the moments
+        rest = merged[(1, 1, source, 6)]
+        for value in values[:10]:
+            rest = remove(rest, value)
+        assert rest[:3] == pytest.approx((len(values) - 10, values[10:].mean(), values[10:].var() * (len(values) - 10)))
+
+
+def test_orm_writes_keep_the_stats_in_sync(seeded):
+    # The fixture wrote its tracks through the ORM, in one flush
+    written = _stats(seeded)
+    assert sum(count for count, *_ in written.values()) == 500
+    backfill_stats(seeded, batch_size=64)
+    _assert_same_stats(written, _stats(seeded))
+
+    tracks = seeded.scalars(select(EnergyTrack).order_by(EnergyTrack.id).limit(3)).all()
+    seeded.delete(tracks[0])
+    tracks[1].kwh = Decimal("12.34")
+    tracks[2].start_time += timedelta(days=40)
+    tracks[2].meter_id = "moved"
+    seeded.commit()
+    # The EWMA can't forget deleted or changed readings, so only the moments must match
+    written = _stats(seeded)
+    backfill_stats(seeded)
+    _assert_same_stats(written, _stats(seeded), ewma=False)
+
+
+def test_concurrent_writers_merge_into_the_latest_stats(seeded, db_engine):
+    row = seeded.scalars(select(EnergyReadingStats).limit(1)).one()
+    key = (row.site_id, row.type_id, row.source_id, row.month)
+    count = row.count
+
+    with Session(db_engine) as other:
+        anomalies.update_stats(other, summarize([key], [10.0]))
+        other.commit()
+    # ``seeded`` still holds the row as it was before the other writer committed
+    anomalies.update_stats(seeded, summarize([key], [20.0]))
+    seeded.commit()
+    assert _stats(seeded)[key][0] == count + 2
+
+
+def test_ingest_updates_the_stats(tmp_path, db_session):
+    rng = random.Random(3)
+    path = tmp_path / "readings.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["site", "source", "type", "start", "kwh"])
+        writer.writeheader()
+        for i in range(300):
+            start = datetime(2024, 1, 1) + timedelta(hours=7 * i)
+            writer.writerow({"site": rng.choice(["a", "b"]), "source": rng.choice(["solar", "wind"]),
+                             "type": "generation", "start": start.isoformat(), "kwh": round(rng.uniform(1, 99), 2)})
+    ingest_file(db_session, str(path), chunk_size=64)
+
+    ingested = _stats(db_session)
+    assert sum(count for count, *_ in ingested.values()) == 300
+    backfill_stats(db_session)
+    _assert_same_stats(ingested, _stats(db_session))
+
+
+def _geothermal(db, year, kwh, n=30, rng=random.Random(11)):
+    site = db.scalar(select(Site.id).where(Site.name == "north"))
+    source = db.scalar(select(EnergySource.id).where(EnergySource.name == "geothermal"))
+    generation = db.scalar(select(EnergyType.id).where(EnergyType.name == "generation"))
+    db.add_all(
+        EnergyTrack(site_id=site, source_id=source, type_id=generation,
+                    start_time=datetime(year, 6, 1) + timedelta(hours=i), kwh=round(rng.uniform(0.9, 1.1) * kwh, 2))
+        for i in range(n)
+    )
+    db.commit()
+
+
+def test_anomalies_flag_a_geothermal_drop(client, seeded):
+    for year in range(2016, 2023):
+        _geothermal(seeded, year, 500)
+    assert client.get("/energy/anomalies").json() == []
+
+    _geothermal(seeded, 2025, 100)
+    rows = client.get("/energy/anomalies").json()
+    geothermal = {(r["kind"], r["month"]): r for r in rows if r["source"] == "geothermal"}
+    assert geothermal.keys() == {("month", "Jun 2025"), ("recent", "Jun")}
+
+    drop = geothermal[("month", "Jun 2025")]
+    assert drop["site"] == "north" and drop["type"] == "generation"
+    assert drop["z"] < -3
+    assert drop["kwh"] == pytest.approx(3000, rel=0.05)
+    assert drop["expected_kwh"] > 4 * drop["kwh"]
+    recent = geothermal[("recent", "Jun")]
+    assert recent["z"] < -3 and recent["kwh"] < recent["expected_kwh"]
+    assert rows[0]["z"] == min(r["z"] for r in rows)
+
+    # Filters, the window and the site scope
+    assert client.get("/energy/anomalies", params={"energy_type": "consumption"}).json() == []
+    assert client.get("/energy/anomalies", params={"source": "solar"}).json() == []
+    windowed = client.get("/energy/anomalies", params={"start": "2020-01-01T00:00:00", "end": "2025-06-01T00:00:00"})
+    assert [r["kind"] for r in windowed.json()] == ["recent"]
+    assert client.get("/energy/anomalies", params={"threshold": 1000}).json() == []
+    assert client.get("/energy/anomalies", params={"site": "south"}).status_code == 404
@@ -1,14 +1,20 @@
-from fastapi.testclient import TestClient
-from app.main import app
+from app.core.hashing import hash_password
+from app.models import User
 
-client = TestClient(app)
+FORM = {"Content-Type": "application/x-www-form-urlencoded"}
 
-def test_health_check():
+
+def _add_user(db, email="user@test.com", username="testuser", password="testuser"):
+    db.add(User(email=email, username=username, hashed_password=hash_password(password)))
+    db.commit()
+
+
+def test_health_check(client):
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Backend is running 🚀"}
 
-def test_register_validation_errors():
+def test_register_validation_errors(client):
     response = client.post(
         "/auth/register",
         data={
@@ -26,18 +32,17 @@ def test_register_validation_errors():
         or data.get("detail") == "Invalid registration data format"
     )
 
-def test_login_invalid_credentials():
-    res = client.post("/auth/login", data={
-        "email": "invalid@example.com",
-        "password": "wrongpassword"
-    }, headers={"Content-Type": "application/x-www-form-urlencoded"})
-
-    assert res.status_code == 401
-    assert res.json()["detail"] == "Invalid credentials"
+def test_login_invalid_credentials(client, db_session):
+    _add_user(db_session)
+    for email, password in (("invalid@example.com", "wrongpassword"), ("user@test.com", "wrongpassword")):
+        res = client.post("/auth/login", data={"email": email, "password": password}, headers=FORM)
+        assert res.status_code == 401
+        assert res.json()["detail"] == "Invalid credentials"
 
-def test_login_success():
+def test_login_success(client, db_session):
     email = "user@test.com"
     password = "testuser"
+    _add_user(db_session, email=email, password=password)
 
     # Login
     res = client.post("/auth/login", data={
@@ -49,3 +54,102 @@ def test_login_success():
     data = res.json()
     assert "access_token" in data
     assert data["token_type"] == "bearer"
+
+def test_claims_come_from_token_without_db():
+    from app.core import authentication
+    from app.core.jwt import create_access_token
+
+    token = create_access_token({"sub": "42", "email": "a@b.com", "username": "alice"})
+    claims = authentication.get_current_claims(token)
+    assert (claims.user_id, claims.email, claims.username) == (42, "a@b.com", "alice")
+
+    # Second call is served from the decoded-token cache
+    hits = authentication.token_cache.hits
+    assert authentication.get_current_claims(token) == claims
+    assert authentication.token_cache.hits == hits + 1
+
+def test_invalid_and_expired_tokens_are_rejected():
+    from datetime import timedelta
+    from fastapi import HTTPException
+    from app.core import authentication
+    from app.core.jwt import create_access_token
+
+    expired = create_access_token({"sub": "1"}, expires_delta=timedelta(seconds=-1))
+    for token in ("not-a-jwt", expired, create_access_token({"email": "no-sub@b.com"})):
+        try:
+            authentication.get_current_claims(token)
+        except HTTPException as exc:
+            assert exc.status_code == 401
+        else:
+            raise AssertionError(f"{token!r} was accepted")
+
+def test_current_user_is_cached_briefly(db_session, async_db_engine):
+    import asyncio
+    from fastapi import HTTPException
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.core import authentication
+    from app.models import User
+    from app.schemas import TokenData
+
+    user = User(email="cached@test.com", username="cached", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    claims = TokenData(user_id=user.id, email=user.email, username=user.username)
+
+    async def current_user():
+        async with AsyncSession(async_db_engine) as db:
+            return await authentication.get_current_user(claims, db)
+
+    authentication.user_cache.clear()
+    assert asyncio.run(current_user()).email == "cached@test.com"
+    db_session.query(User).delete()
+    db_session.commit()
+    assert asyncio.run(current_user()).email == "cached@test.com"
+
+    authentication.user_cache.clear()
+    try:
+        asyncio.run(current_user())
+    except HTTPException as exc:
+        assert exc.status_code == 404
+    else:
+        raise AssertionError("deleted user was returned")
+
+def test_async_hashing_round_trip_in_process_pool():
+    import asyncio
+    from app.core import hashing
+
+    async def round_trip():
+        hashed = await hashing.hash_password_async("s3cret!")
+        return (
+            await hashing.verify_password_async("s3cret!", hashed),
+            await hashing.verify_password_async("wrong", hashed),
+        )
+
+    try:
+        assert asyncio.run(round_trip()) == (True, False)
+        assert hashing.pending() == 0
+    finally:
+        hashing.shutdown_pool()
+
+def test_full_hashing_queue_returns_503(client, db_session, monkeypatch):
+    from app.core import hashing
+
+    _add_user(db_session)
+    monkeypatch.setattr(hashing, "HASH_POOL_MAX_PENDING", 0)
+    res = client.post("/auth/login", data={"email": "invalid@example.com", "password": "wrongpassword"}, headers=FORM)
+    # Unknown users never reach the pool, so this is still a 401
+    assert res.status_code == 401
+
+    # A known user's password has to be verified, and the pool is full
+    res = client.post("/auth/login", data={"email": "user@test.com", "password": "testuser"}, headers=FORM)
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == str(hashing.HASH_POOL_RETRY_AFTER)
+
+    res = client.post(
+        "/auth/register",
+        data={"username": "busyuser", "email": "busy@example.com", "password": "password1"},
+        headers=FORM,
+    )
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == str(hashing.HASH_POOL_RETRY_AFTER)
+    assert db_session.query(User).filter(User.email == "busy@example.com").count() == 0
@@ -0,0 +1,253 @@
+# tests/test_cache.py
+import asyncio
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import cache
+from app.cache import InMemoryCache, RedisCache
+from app.models import EnergyTrack, EnergyType
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_counters():
+    c = InMemoryCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1  # "a" is now most recently used
+    c.set("c", 3)  # evicts "b"
+
+    assert c.get("b") is None
+    assert c.get("c") == 3
+    assert c.stats() == {"hits": 2, "misses": 1, "evictions": 1, "hit_ratio": 2 / 3}
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    c = InMemoryCache(maxsize=10, ttl=5, clock=clock)
+    c.set("a", 1)
+    clock.now = 4.9
+    assert c.get("a") == 1
+    clock.now = 5.0
+    assert c.get("a") is None
+    assert len(c) == 0
+
+
+def test_get_or_set_computes_once():
+    c = InMemoryCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [1, 2, 3]
+
+    assert c.get_or_set("k", compute) == [1, 2, 3]
+    assert c.get_or_set("k", compute) == [1, 2, 3]
+    assert len(calls) == 1
+
+
+class FakeRedis:
+    """The subset of the redis client API RedisCache uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def test_shared_backend_clear_reaches_every_worker():
+    server = FakeRedis()
+    worker_a, worker_b = RedisCache(server), RedisCache(server)
+
+    worker_a.set(("trends", "generation", None), [{"month": "Jan"}])
+    assert worker_b.get(("trends", "generation", None)) == [{"month": "Jan"}]
+
+    worker_a.set(("versions",), {})
+    worker_b.delete(("versions",))
+    assert worker_a.get(("versions",)) is None
+
+    worker_b.clear()
+    assert worker_a.get(("trends", "generation", None)) is None
+
+
+def test_shared_backend_keeps_redis_off_the_event_loop():
+    loop_thread = threading.get_ident()
+    threads = set()
+
+    class WatchedRedis(FakeRedis):
+        def get(self, key):
+            threads.add(threading.get_ident())
+            return super().get(key)
+
+    worker = RedisCache(WatchedRedis())
+
+    async def run():
+        async def compute():
+            return [1, 2]
+
+        assert await worker.aget_or_set("k", compute) == [1, 2]
+        assert await worker.aget("k") == [1, 2]
+        done = threading.Event()
+        cache.call_off_loop(lambda: threads.add(threading.get_ident()) or done.set())
+        await asyncio.to_thread(done.wait, 5)
+
+    asyncio.run(run())
+    assert threads and loop_thread not in threads
+
+
+def test_track_writes_invalidate_their_site_on_commit(seeded):
+    track = seeded.query(EnergyTrack).first()
+    written = cache.version_key(cache.site_version_name(track.site_id))
+    other = cache.version_key(cache.site_version_name(track.site_id + 1))
+    for key in (written, other, cache.VERSIONS_KEY, ("summary", "generation", None)):
+        cache.energy_cache.set(key, "cached")
+
+    track.kwh = 1.23
+    seeded.flush()
+    # Not committed yet: other requests may still see the cached version
+    assert cache.energy_cache.get(written) == "cached"
+
+    seeded.commit()
+    assert cache.energy_cache.get(written) is None
+    assert cache.energy_cache.get(cache.VERSIONS_KEY) is None
+    # Other sites' versions, and the entries keyed on them, stay
+    assert cache.energy_cache.get(other) == "cached"
+    assert cache.energy_cache.get(("summary", "generation", None)) == "cached"
+
+
+def test_bulk_delete_invalidates(seeded):
+    cache.energy_cache.set(("summary", "generation", None), ["stale"])
+    seeded.query(EnergyTrack).filter(EnergyTrack.start_time < datetime(2023, 2, 1)).delete()
+    seeded.commit()
+    assert cache.energy_cache.get(("summary", "generation", None)) is None
+
+
+def test_rollback_keeps_cache(seeded):
+    cache.energy_cache.set(("summary", "generation", None), ["cached"])
+    seeded.delete(seeded.query(EnergyTrack).first())
+    seeded.flush()
+    seeded.rollback()
+    assert cache.energy_cache.get(("summary", "generation", None)) == ["cached"]
+
+
+def test_routes_serve_from_cache_until_tracks_change(client, seeded):
+    first = client.get("/energy/summary", params={"energy_type": "generation"}).json()
+    hits = cache.energy_cache.hits
+    assert client.get("/energy/summary", params={"energy_type": "generation"}).json() == first
+    # Hits for the data versions, the user's sites, their site's version and the response
+    assert cache.energy_cache.hits == hits + 4
+
+    track = seeded.query(EnergyTrack).join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
+        .filter(EnergyType.name == "generation").first()
+    track.kwh = 100000
+    seeded.commit()
+
+    updated = client.get("/energy/summary", params={"energy_type": "generation"}).json()
+    assert updated != first
+    assert updated == client.get("/energy/summary", params={"energy_type": "generation", "raw": True}).json()
+
+
+def test_data_version_bumps_once_per_committed_write(seeded):
+    before = cache.data_version(seeded).version
+    assert before > 0  # seeding wrote tracks
+
+    tracks = seeded.query(EnergyTrack).limit(2).all()
+    site = cache.site_version_name(tracks[0].site_id)
+    site_before = cache.data_version(seeded, site).version
+    tracks[0].kwh = 1.11
+    seeded.flush()
+    tracks[1].kwh = 2.22
+    seeded.commit()
+    assert cache.data_version(seeded).version == before + 1
+    assert cache.data_version(seeded, site).version == site_before + 1
+
+    seeded.delete(seeded.query(EnergyTrack).first())
+    seeded.flush()
+    seeded.rollback()
+    assert cache.data_version(seeded).version == before + 1
+
+    # Bulk deletes can't tell which sites they touch
+    seeded.query(EnergyTrack).filter(EnergyTrack.start_time < datetime(2023, 2, 1)).delete()
+    seeded.commit()
+    assert cache.data_version(seeded).version == before + 2
+    assert cache.data_version(seeded, cache.ALL_SITES_VERSION).version == 1
+
+
+class _Statements(list):
+    """Every SQL statement run on ``engine`` while the block is active."""
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine.sync_engine
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def test_unchanged_data_answers_304_without_queries(client, seeded, async_db_engine):
+    params = {"energy_type": "generation", "highlight": "solar"}
+    first = client.get("/energy/composed", params=params)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert "last-modified" in first.headers
+
+    with _Statements(async_db_engine) as statements:
+        res = client.get("/energy/composed", params=params, headers={"If-None-Match": f'W/"x", {etag}'})
+    assert res.status_code == 304
+    assert res.content == b""
+    assert res.headers["etag"] == etag
+    assert statements == []
+
+    # Other parameters, other ETag
+    assert client.get("/energy/composed", params={**params, "highlight": "grid"}).headers["etag"] != etag
+
+    seeded.query(EnergyTrack).join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
+        .filter(EnergyType.name == "generation").first().kwh = 99999
+    seeded.commit()
+    res = client.get("/energy/composed", params=params, headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+    assert res.json() != first.json()
+
+
+def test_if_modified_since_and_export_validators(client):
+    first = client.get("/energy/export", params={"format": "ndjson"})
+    assert first.status_code == 200
+    last_modified = first.headers["last-modified"]
+
+    res = client.get("/energy/export", params={"format": "ndjson"}, headers={"If-Modified-Since": last_modified})
+    assert res.status_code == 304
+    res = client.get("/energy/export", params={"format": "ndjson"}, headers={"If-None-Match": first.headers["etag"]})
+    assert res.status_code == 304
+    # If-None-Match wins over If-Modified-Since
+    res = client.get("/energy/export", params={"format": "ndjson"}, headers={
+        "If-None-Match": '"stale"', "If-Modified-Since": last_modified,
+    })
+    assert res.status_code == 200
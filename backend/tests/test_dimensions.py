@@ -0,0 +1,74 @@
+# tests/test_dimensions.py
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import cache
+from app.models import EnergySource, EnergyTrack, EnergyType
+from app.utils.dimensions import registry
+
+
+class _Statements(list):
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = getattr(engine, "sync_engine", engine)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def test_registry_reloads_only_when_the_version_moves(seeded, db_engine):
+    dims = registry.get(seeded)
+    assert list(dims.sources) == sorted(dims.sources)
+    assert set(dims.types) == {"generation", "consumption"}
+
+    with _Statements(db_engine) as statements:
+        assert registry.get(seeded) is dims
+    assert len(statements) == 1 and "data_versions" in statements[0]
+
+    seeded.add(EnergySource(name="wind"))
+    seeded.commit()
+    reloaded = registry.get(seeded)
+    assert reloaded.version == dims.version + 1
+    assert "wind" in reloaded.sources
+    assert reloaded.source_names[reloaded.sources["wind"]] == "wind"
+
+
+def test_new_sources_get_trend_columns_without_code_changes(client, seeded):
+    # The seed script's name for hydro, which used to come back as zeros
+    hydropower = EnergySource(name="hydropower")
+    seeded.add(hydropower)
+    seeded.flush()
+    generation = seeded.query(EnergyType).filter_by(name="generation").one()
+    site_id = seeded.query(EnergyTrack.site_id).limit(1).scalar()
+    seeded.add(EnergyTrack(site_id=site_id, source_id=hydropower.id, type_id=generation.id,
+                           start_time=datetime(2024, 5, 3), kwh=321.5))
+    seeded.commit()
+
+    trends = client.get("/energy/trends", params={"energy_type": "generation"}).json()
+    may = next(row for row in trends if row["month"] == "May 2024")
+    assert may["hydropower"] == 321.5
+    assert set(trends[0]) == {"month", "geothermal", "grid", "hydro", "hydropower", "solar", "tidal"}
+
+    summary = client.get("/energy/summary", params={"energy_type": "generation"}).json()
+    assert {"source": "hydropower", "kwh": 321.5} in summary
+
+
+def test_views_query_energy_tracks_without_joins(client, async_db_engine):
+    client.get("/energy/summary", params={"energy_type": "generation"})
+    cache.energy_cache.clear()
+
+    with _Statements(async_db_engine) as statements:
+        assert client.get("/energy/composed", params={"energy_type": "generation", "highlight": "solar", "raw": True}).status_code == 200
+        assert client.get("/energy/export", params={"energy_type": "generation", "source": "grid"}).status_code == 200
+
+    # Names are resolved from the registry: no dimension lookups and no joins
+    assert statements
+    assert not any("JOIN" in s or "energy_sources" in s or "energy_types" in s for s in statements)
@@ -0,0 +1,96 @@
+# tests/test_downsample.py
+import numpy as np
+import pytest
+
+from app.utils.downsample import Downsampling, keep, lttb, minmax
+
+
+def _reference_lttb(data, threshold):
+    """The textbook per-point LTTB, to check the vectorized one against."""
+    size = len(data)
+    every = (size - 2) / (threshold - 2)
+    a, kept = 0, [0]
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, size)
+        avg_x = sum(range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(data[avg_start:avg_end]) / (avg_end - avg_start)
+        best, chosen = -1.0, None
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((a - avg_x) * (data[j] - data[a]) - (a - j) * (avg_y - data[a]))
+            if area > best:
+                best, chosen = area, j
+        kept.append(chosen)
+        a = chosen
+    return kept + [size - 1]
+
+
+def _spiky(size=20_000, seed=7):
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 1, (3, size)).cumsum(axis=1)
+    peaks = rng.choice(size, 3, replace=False)
+    y[np.arange(3), peaks] += 1_000
+    return y, peaks
+
+
+@pytest.mark.parametrize("size, n", [(1_000, 50), (10_007, 333), (500, 499)])
+def test_lttb_matches_the_reference(size, n):
+    y = np.random.default_rng(size).normal(size=size).cumsum()
+    mask = lttb(y, n)
+    assert mask.sum() == n
+    assert np.flatnonzero(mask[0]).tolist() == _reference_lttb(y.tolist(), n)
+
+
+@pytest.mark.parametrize("method", [lttb, minmax])
+def test_peaks_and_troughs_are_kept(method):
+    y, peaks = _spiky()
+    mask = method(y, 200)
+    assert (mask.sum(axis=1) <= 200).all()
+    assert mask[:, 0].all() and mask[:, -1].all()
+    assert mask[np.arange(3), peaks].all()
+    if method is minmax:
+        assert mask[np.arange(3), y.argmin(axis=1)].all()
+
+
+def test_short_series_are_untouched():
+    y = np.arange(10)
+    assert lttb(y, 10).all() and minmax(y, 50).all()
+    assert keep(y, 10).tolist() == list(range(10))
+
+
+@pytest.mark.parametrize("method", list(Downsampling))
+def test_keep_shares_the_budget_between_series(method):
+    y, peaks = _spiky()
+    y = np.vstack([y, np.zeros(y.shape[1])])  # an empty series gets no share
+    kept = keep(y, 300, method)
+    assert len(kept) <= 300
+    assert (np.diff(kept) > 0).all()
+    assert set(peaks) <= set(kept.tolist())
+
+    # Too many series for three points each: their sum is downsampled instead
+    assert len(keep(np.tile(y, (40, 1)), 50, method)) <= 50
+
+
+def test_endpoints_downsample_high_resolution_windows(client):
+    params = {"energy_type": "generation", "granularity": "day", "start": "2023-01-01T00:00:00", "end": "2025-01-01T00:00:00"}
+    full = client.get("/energy/trends", params=params).json()
+    assert len(full) == 731
+
+    for method in ("lttb", "minmax"):
+        rows = client.get("/energy/trends", params={**params, "max_points": 100, "downsampling": method}).json()
+        assert len(rows) <= 100
+        # Kept rows are real buckets, in order
+        by_month = {row["month"]: row for row in full}
+        assert [by_month[row["month"]] for row in rows] == rows
+        assert rows[0] == full[0] and rows[-1] == full[-1]
+
+    # minmax keeps every source's busiest day, however spiky the series
+    rows = client.get("/energy/trends", params={**params, "max_points": 100, "downsampling": "minmax"}).json()
+    for source in ("geothermal", "grid", "hydro", "solar", "tidal"):
+        assert max(r[source] for r in rows) == max(r[source] for r in full)
+
+    composed = client.get("/energy/composed", params={**params, "highlight": "solar", "max_points": 60, "downsampling": "minmax"}).json()
+    assert len(composed) <= 60
+    full_composed = client.get("/energy/composed", params={**params, "highlight": "solar"}).json()
+    assert max(r["total"] for r in composed) == max(r["total"] for r in full_composed)
+
+    assert client.get("/energy/trends", params={**params, "max_points": 2}).status_code == 422
@@ -0,0 +1,276 @@
+# tests/test_energy.py
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models import EnergySource, EnergyType, EnergyTrack, EnergyMonthlyRollup, Site
+from app.utils.energy_data import (
+    monthly_totals_by_source,
+    totals_by_source,
+    get_all_energy_tracks,
+)
+from app.utils.columnar import load_energy_cube
+from app.utils.periods import add_months
+from app.utils.rollup import apply_deltas, check_rollup_consistency, rebuild_rollup
+
+TYPES = ["generation", "consumption"]
+
+
+def _legacy_pivot(db, energy_type, start=None, end=None):
+    """Row-by-row pivot of raw tracks into {(year, month): {source: kwh}}."""
+    query = db.query(
+        EnergyTrack.start_time,
+        EnergyTrack.kwh,
+        EnergySource.name.label("source"),
+    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
+     .join(EnergyType, EnergyTrack.type_id == EnergyType.id) \
+     .filter(EnergyType.name == energy_type)
+    if start is not None:
+        query = query.filter(EnergyTrack.start_time >= start)
+    if end is not None:
+        query = query.filter(EnergyTrack.start_time < end)
+
+    pivot = defaultdict(lambda: defaultdict(float))
+    for start_time, kwh, source in query.all():
+        pivot[(start_time.year, start_time.month)][source] += float(kwh)
+    return pivot
+
+
+@pytest.mark.parametrize("use_rollup", [True, False])
+@pytest.mark.parametrize("energy_type", TYPES)
+def test_monthly_totals_match_legacy_pivot(seeded, energy_type, use_rollup):
+    expected = _legacy_pivot(seeded, energy_type)
+    actual = monthly_totals_by_source(seeded, energy_type, use_rollup=use_rollup)
+
+    assert set(actual) == set(expected)
+    for month, sources in expected.items():
+        assert set(actual[month]) == set(sources)
+        for source, kwh in sources.items():
+            assert actual[month][source] == pytest.approx(kwh, abs=0.005)
+
+
+@pytest.mark.parametrize("use_rollup", [True, False])
+@pytest.mark.parametrize("energy_type", TYPES)
+def test_totals_by_source_match_legacy_pivot(seeded, energy_type, use_rollup):
+    expected = defaultdict(float)
+    for sources in _legacy_pivot(seeded, energy_type).values():
+        for source, kwh in sources.items():
+            expected[source] += kwh
+
+    actual = totals_by_source(seeded, energy_type, use_rollup=use_rollup)
+    assert set(actual) == set(expected)
+    for source, kwh in expected.items():
+        assert actual[source] == pytest.approx(kwh, abs=0.005)
+
+
+@pytest.mark.parametrize("use_rollup", [True, False])
+def test_energy_cube_matches_legacy_pivot_to_the_cent(seeded, use_rollup):
+    cube = load_energy_cube(seeded, use_rollup=use_rollup)
+    assert cube.types == tuple(sorted(TYPES))
+
+    for energy_type in TYPES:
+        expected = _legacy_pivot(seeded, energy_type)
+        actual = {(p.year, p.month): sources for p, sources in cube.pivot(energy_type).items()}
+        assert set(actual) == set(expected)
+        for month, sources in expected.items():
+            assert set(actual[month]) == set(sources)
+            for source, kwh in sources.items():
+                assert actual[month][source] == round(kwh, 2)
+
+    assert cube.pivot("storage") == {}
+
+
+def test_unknown_energy_type_is_empty(seeded):
+    assert monthly_totals_by_source(seeded, "storage") == {}
+    assert totals_by_source(seeded, "storage") == {}
+
+
+def test_get_all_energy_tracks_groups_in_sql(seeded):
+    rows = get_all_energy_tracks(seeded)
+    keys = [(r["source"], r["type"], r["year"], r["month"]) for r in rows]
+    assert len(keys) == len(set(keys))
+
+    expected_total = sum(
+        kwh
+        for energy_type in TYPES
+        for sources in _legacy_pivot(seeded, energy_type).values()
+        for kwh in sources.values()
+    )
+    assert sum(r["kwh"] for r in rows) == pytest.approx(expected_total, abs=0.01)
+
+
+def test_concurrent_rollup_deltas_add_up(seeded, db_engine):
+    cell = seeded.query(EnergyMonthlyRollup).first()
+    key = (cell.site_id, cell.type_id, cell.source_id, cell.year, cell.month)
+    kwh, count = cell.kwh, cell.track_count
+
+    with Session(db_engine) as other:
+        apply_deltas(other, {key: [Decimal("5.00"), 1]})
+        other.commit()
+    # ``seeded`` still holds the row as it was before the other writer committed
+    apply_deltas(seeded, {key: [Decimal("2.50"), 1]})
+    seeded.commit()
+
+    row = seeded.get(EnergyMonthlyRollup, key)
+    assert (row.kwh, row.track_count) == (kwh + Decimal("7.50"), count + 2)
+
+
+def test_rollup_tracks_inserts_updates_and_deletes(seeded):
+    assert check_rollup_consistency(seeded) == []
+
+    track = seeded.query(EnergyTrack).first()
+    track.kwh = float(track.kwh) + 10.5
+    track.start_time = track.start_time + timedelta(days=40)
+    seeded.commit()
+    assert check_rollup_consistency(seeded) == []
+
+    # Moving a track to another site moves its kWh between the sites' cells
+    south = Site(name="south")
+    seeded.add(south)
+    seeded.flush()
+    track.site_id = south.id
+    seeded.commit()
+    assert check_rollup_consistency(seeded) == []
+    moved = seeded.get(EnergyMonthlyRollup, (south.id, track.type_id, track.source_id,
+                                             track.start_time.year, track.start_time.month))
+    assert (moved.kwh, moved.track_count) == (track.kwh, 1)
+
+    seeded.delete(track)
+    seeded.commit()
+    assert check_rollup_consistency(seeded) == []
+
+    cell = seeded.query(EnergyMonthlyRollup).first()
+    key = (cell.site_id, cell.type_id, cell.source_id, cell.year, cell.month)
+    month = datetime(cell.year, cell.month, 1)
+    for t in seeded.query(EnergyTrack).filter(
+        EnergyTrack.site_id == cell.site_id,
+        EnergyTrack.type_id == cell.type_id,
+        EnergyTrack.source_id == cell.source_id,
+        EnergyTrack.start_time >= month,
+        EnergyTrack.start_time < add_months(month, 1),
+    ).all():
+        seeded.delete(t)
+    seeded.commit()
+    assert seeded.get(EnergyMonthlyRollup, key) is None
+    assert check_rollup_consistency(seeded) == []
+
+
+def test_consistency_check_reports_drift_and_rebuild_fixes_it(seeded):
+    # Bulk deletes bypass the ORM listener and leave the rollup stale
+    seeded.query(EnergyTrack).filter(EnergyTrack.start_time < datetime(2023, 2, 1)).delete()
+    seeded.commit()
+
+    mismatches = check_rollup_consistency(seeded)
+    assert mismatches
+    assert {(m["year"], m["month"]) for m in mismatches} == {(2023, 1)}
+    assert all(m["raw_count"] == 0 for m in mismatches)
+
+    rebuild_rollup(seeded)
+    assert check_rollup_consistency(seeded) == []
+
+
+def test_dashboard_matches_individual_endpoints(client):
+    params = {"energy_type": "generation", "highlight": "solar"}
+    dashboard = client.get("/energy/dashboard", params=params)
+    assert dashboard.status_code == 200
+    body = dashboard.json()
+
+    assert body["trends"] == client.get("/energy/trends", params={"energy_type": "generation"}).json()
+    assert body["composition"] == client.get("/energy/composition", params={"energy_type": "generation"}).json()
+    assert body["summary"] == client.get("/energy/summary", params={"energy_type": "generation"}).json()
+    assert body["composed"] == client.get("/energy/composed", params=params).json()
+    assert body == client.get("/energy/dashboard", params={**params, "raw": True}).json()
+
+
+def test_views_share_one_aggregation_query(client, async_db_engine):
+    from sqlalchemy import event
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "GROUP BY" in statement:
+            statements.append(statement)
+
+    event.listen(async_db_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        for path, params in (
+            ("/energy/trends", {"energy_type": "consumption"}),
+            ("/energy/composition", {"energy_type": "consumption"}),
+            ("/energy/summary", {"energy_type": "consumption"}),
+            ("/energy/composed", {"energy_type": "consumption", "highlight": "grid"}),
+            ("/energy/dashboard", {"energy_type": "consumption", "highlight": "tidal"}),
+        ):
+            assert client.get(path, params=params).status_code == 200
+    finally:
+        event.remove(async_db_engine.sync_engine, "before_cursor_execute", count)
+
+    assert len(statements) == 1
+
+
+def _window_totals(db, energy_type, start, end):
+    totals = defaultdict(float)
+    for sources in _legacy_pivot(db, energy_type, start, end).values():
+        for source, kwh in sources.items():
+            totals[source] += kwh
+    return totals
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_month_window_is_one_year_not_every_january(client, seeded, raw):
+    params = {"energy_type": "generation", "start": "2023-01-01T00:00:00", "end": "2024-01-01T00:00:00", "raw": raw}
+    trends = client.get("/energy/trends", params=params).json()
+    assert [r["month"] for r in trends][:2] == ["Jan 2023", "Feb 2023"]
+    assert len(trends) == 12
+
+    expected = _legacy_pivot(seeded, "generation", datetime(2023, 1, 1), datetime(2024, 1, 1))
+    for m, row in enumerate(trends, start=1):
+        for source in ("solar", "tidal", "grid", "hydro", "geothermal"):
+            assert row[source] == round(expected.get((2023, m), {}).get(source, 0.0), 2)
+
+    summary = client.get("/energy/summary", params=params).json()
+    totals = _window_totals(seeded, "generation", datetime(2023, 1, 1), datetime(2024, 1, 1))
+    assert {r["source"]: r["kwh"] for r in summary} == {s: round(k, 2) for s, k in totals.items()}
+
+
+def test_default_window_spans_all_history(client):
+    trends = client.get("/energy/trends", params={"energy_type": "consumption"}).json()
+    assert len(trends) == 24
+    assert (trends[0]["month"], trends[-1]["month"]) == ("Jan 2023", "Dec 2024")
+
+    years = client.get("/energy/composed", params={
+        "energy_type": "consumption", "highlight": "grid", "granularity": "year",
+    }).json()
+    assert [r["month"] for r in years] == ["2023", "2024"]
+    assert sum(r["total"] for r in years) == pytest.approx(sum(r["solar"] + r["tidal"] + r["grid"] + r["hydro"] + r["geothermal"] for r in trends))
+
+
+def test_day_granularity_and_unaligned_windows_read_raw_tracks(client, seeded):
+    start, end = datetime(2023, 3, 10, 6), datetime(2023, 3, 20)
+    params = {"energy_type": "generation", "highlight": "solar", "start": start.isoformat(), "end": end.isoformat()}
+
+    days = client.get("/energy/composed", params={**params, "granularity": "day"}).json()
+    assert [r["month"] for r in days] == [f"2023-03-{d:02d}" for d in range(10, 20)]
+    assert sum(r["total"] for r in days) == pytest.approx(sum(_window_totals(seeded, "generation", start, end).values()), abs=0.01)
+
+    # A month bucket cut by the window only holds the tracks inside it
+    month = client.get("/energy/summary", params={**params, "granularity": "month"}).json()
+    assert {r["source"]: r["kwh"] for r in month} == {
+        s: round(k, 2) for s, k in _window_totals(seeded, "generation", start, end).items()
+    }
+
+
+def test_invalid_windows_are_rejected(client):
+    base = {"energy_type": "generation"}
+    res = client.get("/energy/trends", params={**base, "start": "2024-01-01T00:00:00", "end": "2023-01-01T00:00:00"})
+    assert res.status_code == 400
+
+    # Two years of hours is more than the cube allows
+    res = client.get("/energy/trends", params={**base, "granularity": "hour"})
+    assert res.status_code == 400
+    assert "granularity" in res.json()["detail"]
+
+    res = client.get("/energy/trends", params={**base, "granularity": "week"})
+    assert res.status_code == 422
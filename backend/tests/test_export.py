@@ -0,0 +1,163 @@
+# tests/test_export.py
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pyarrow as pa
+from sqlalchemy import insert, select
+
+from app.models import EnergySource, EnergyTrack, EnergyType
+from app.utils import export
+
+PAGE_SIZE = 4096
+
+
+def _expected(db, energy_type=None, source=None, start=None, end=None):
+    """Tracks joined with their names, keyed by id."""
+    stmt = select(
+        EnergyTrack.id,
+        EnergySource.name.label("source"),
+        EnergyType.name.label("type"),
+        EnergyTrack.start_time,
+        EnergyTrack.kwh,
+    ).join(EnergySource, EnergyTrack.source_id == EnergySource.id) \
+     .join(EnergyType, EnergyTrack.type_id == EnergyType.id)
+    if energy_type is not None:
+        stmt = stmt.where(EnergyType.name == energy_type)
+    if source is not None:
+        stmt = stmt.where(EnergySource.name == source)
+    if start is not None:
+        stmt = stmt.where(EnergyTrack.start_time >= start)
+    if end is not None:
+        stmt = stmt.where(EnergyTrack.start_time < end)
+    return {r.id: r for r in db.execute(stmt)}
+
+
+def _rss_mb() -> float:
+    # Current (not peak) resident set size; the second field of statm is in pages
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 2**20
+
+
+def test_csv_export_has_every_track(client, seeded):
+    res = client.get("/energy/export")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/csv")
+    assert 'filename="energy_tracks.csv"' in res.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(res.text)))
+    expected = _expected(seeded)
+    assert len(rows) == len(expected) == 500
+    for row in rows:
+        track = expected[int(row["id"])]
+        assert (row["source"], row["type"]) == (track.source, track.type)
+        assert Decimal(row["kwh"]) == track.kwh
+        assert datetime.fromisoformat(row["start_time"]) == track.start_time
+
+
+def test_ndjson_export_respects_filters(client, seeded):
+    start, end = datetime(2023, 6, 1), datetime(2024, 3, 1)
+    res = client.get("/energy/export", params={
+        "format": "ndjson", "energy_type": "generation", "source": "solar",
+        "start": start.isoformat(), "end": end.isoformat(),
+    })
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    expected = _expected(seeded, "generation", "solar", start, end)
+    assert rows and {r["id"] for r in rows} == set(expected)
+    for row in rows:
+        assert (row["type"], row["source"]) == ("generation", "solar")
+        assert start <= datetime.fromisoformat(row["start_time"]) < end
+
+
+def test_arrow_export_round_trips(client, seeded):
+    res = client.get("/energy/export", params={"format": "arrow", "energy_type": "consumption"})
+    assert res.status_code == 200
+
+    table = pa.ipc.open_stream(res.content).read_all()
+    expected = _expected(seeded, "consumption")
+    assert table.num_rows == len(expected)
+    assert table.schema.field("kwh").type == pa.decimal128(10, 2)
+    for row in table.to_pylist():
+        assert row["kwh"] == expected[row["id"]].kwh
+        assert row["start_time"] == expected[row["id"]].start_time
+
+
+def test_empty_and_invalid_exports(client):
+    res = client.get("/energy/export", params={"format": "arrow", "source": "nuclear"})
+    assert pa.ipc.open_stream(res.content).read_all().num_rows == 0
+    assert client.get("/energy/export", params={"source": "nuclear"}).text.strip() == ",".join(export.COLUMNS)
+
+    res = client.get("/energy/export", params={"start": "2024-01-01T00:00:00", "end": "2023-01-01T00:00:00"})
+    assert res.status_code == 400
+    assert client.get("/energy/export", params={"format": "xml"}).status_code == 422
+
+
+async def _stream_export(app, query: str, on_chunk) -> None:
+    """Run one GET through the ASGI app, passing each body chunk to ``on_chunk``.
+
+    TestClient collects the whole body before returning, so it can't show
+    whether the server streams.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/energy/export", "raw_path": b"/energy/export",
+        "query_string": query.encode(), "headers": [], "root_path": "",
+        "server": ("testserver", 80), "client": ("testclient", 50000),
+    }
+    requested = asyncio.Event()
+
+    async def receive():
+        if requested.is_set():
+            await asyncio.Event().wait()  # no disconnect until the response ends
+        requested.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+        elif message["type"] == "http.response.body":
+            on_chunk(message.get("body", b""))
+
+    await app(scope, receive, send)
+
+
+def test_large_export_memory_stays_bounded(client, seeded, async_db_engine):
+    site_id = seeded.scalar(select(EnergyTrack.site_id).limit(1))
+    source_id = seeded.scalar(select(EnergySource.id).limit(1))
+    type_id = seeded.scalar(select(EnergyType.id).limit(1))
+    start = datetime(2022, 1, 1)
+    n_rows = 200_000
+    for offset in range(0, n_rows, 50_000):
+        seeded.execute(insert(EnergyTrack), [
+            {
+                "site_id": site_id, "source_id": source_id, "type_id": type_id, "meter_id": f"m-{i % 100}",
+                "start_time": start + timedelta(minutes=i), "kwh": Decimal("1.25"),
+            }
+            for i in range(offset, offset + 50_000)
+        ])
+    seeded.commit()
+
+    totals = {"bytes": 0, "lines": 0, "peak": _rss_mb()}
+    baseline = totals["peak"]
+
+    def on_chunk(chunk: bytes) -> None:
+        totals["bytes"] += len(chunk)
+        totals["lines"] += chunk.count(b"\n")
+        totals["peak"] = max(totals["peak"], _rss_mb())
+
+    async def run():
+        await _stream_export(client.app, "format=ndjson", on_chunk)
+        await async_db_engine.dispose()
+
+    asyncio.run(run())
+
+    assert totals["lines"] == n_rows + 500
+    # The body is larger than what the server may hold at once
+    assert totals["bytes"] > 25 * 2**20
+    assert totals["peak"] - baseline < 20
@@ -0,0 +1,123 @@
+# tests/test_ingest.py
+import csv
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models import EnergySource, EnergyType, EnergyTrack
+from app.utils.energy_data import monthly_totals_by_source
+from app.utils.ingest import IngestError, ingest_file, iter_csv, parse_month
+from app.utils.rollup import check_rollup_consistency
+
+READINGS = [
+    {"source": "solar", "type": "generation", "month": 1, "year": 2024, "kwh": "100.25"},
+    {"source": "solar", "type": "generation", "start": "2024-01-15T12:00:00+02:00",
+     "end": "2024-01-15T13:00:00+02:00", "meter_id": "m-1", "kwh": "50.50"},
+    {"source": "wind", "type": "generation", "month": "Feb", "kwh": "10"},
+    {"source": "grid", "type": "consumption", "month": "December", "year": "2023", "kwh": 7.125},
+]
+FIELDS = ["source", "type", "month", "year", "start", "end", "meter_id", "kwh"]
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_csv_ingest_upserts_dimensions_and_rollup(tmp_path, db_session):
+    db_session.add(EnergySource(name="solar"))
+    db_session.commit()
+
+    path = tmp_path / "readings.csv"
+    _write_csv(path, READINGS)
+    stats = ingest_file(db_session, str(path), chunk_size=3, default_year=2024)
+
+    assert (stats.rows, stats.chunks) == (4, 2)
+    assert stats.rows_per_sec > 0 and stats.peak_rss_mb > 0
+    assert sorted(s.name for s in db_session.query(EnergySource)) == ["grid", "solar", "wind"]
+    assert db_session.query(EnergyTrack).count() == 4
+    assert check_rollup_consistency(db_session) == []
+
+    pivot = monthly_totals_by_source(db_session, "generation")
+    assert pivot[(2024, 1)]["solar"] == 150.75
+    assert pivot[(2024, 2)]["wind"] == 10.0
+    assert monthly_totals_by_source(db_session, "consumption")[(2023, 12)]["grid"] == 7.13
+
+    metered = db_session.query(EnergyTrack).filter_by(meter_id="m-1").one()
+    assert (metered.start_time, metered.end_time) == (datetime(2024, 1, 15, 10), datetime(2024, 1, 15, 11))
+    month_only = db_session.query(EnergyTrack).filter(EnergyTrack.meter_id.is_(None)).order_by(EnergyTrack.id).first()
+    assert (month_only.start_time, month_only.end_time) == (datetime(2024, 1, 1), datetime(2024, 2, 1))
+
+    # A second load appends tracks but reuses every dimension row
+    ingest_file(db_session, str(path), default_year=2024)
+    assert db_session.query(EnergySource).count() == 3
+    assert db_session.query(EnergyType).count() == 2
+    assert db_session.query(EnergyTrack).count() == 8
+    assert check_rollup_consistency(db_session) == []
+
+
+def test_ndjson_and_parquet_ingest(tmp_path, db_session):
+    path = tmp_path / "readings.ndjson"
+    path.write_text("\n".join(json.dumps(r) for r in READINGS) + "\n")
+    ingest_file(db_session, str(path))
+
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pa.table({
+        field: [None if r.get(field) is None else str(r[field]) for r in READINGS]
+        for field in FIELDS
+    })
+    pq.write_table(table, tmp_path / "readings.parquet")
+    ingest_file(db_session, str(tmp_path / "readings.parquet"), chunk_size=2)
+
+    assert db_session.query(EnergyTrack).count() == 8
+    assert check_rollup_consistency(db_session) == []
+
+
+def test_bad_row_rolls_back_its_chunk(tmp_path, db_session):
+    path = tmp_path / "bad.csv"
+    _write_csv(path, READINGS[:2] + [{"source": "solar", "type": "generation", "month": 13, "kwh": 1}])
+
+    with pytest.raises(IngestError):
+        ingest_file(db_session, str(path), chunk_size=2)
+
+    # The first chunk was committed, the failing one was not
+    assert db_session.query(EnergyTrack).count() == 2
+    assert check_rollup_consistency(db_session) == []
+
+
+def test_reader_streams_in_chunks(tmp_path):
+    path = tmp_path / "many.csv"
+    _write_csv(path, [READINGS[0]] * 10)
+    chunks = iter_csv(str(path), chunk_size=4)
+    assert [len(c) for c in chunks] == [4, 4, 2]
+
+
+def test_records_need_a_start_or_a_month(tmp_path, db_session):
+    path = tmp_path / "undated.ndjson"
+    path.write_text(json.dumps({"source": "solar", "type": "generation", "kwh": 1}) + "\n")
+    with pytest.raises(IngestError, match="neither a start nor a month"):
+        ingest_file(db_session, str(path))
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"source": "solar", "type": "generation", "month": 1}, "no kwh"),
+    ({"kwh": 1, "month": 1}, "no source, type"),
+    ({"source": "solar", "type": "generation", "month": 1, "year": "twenty", "kwh": 1}, "Invalid year"),
+])
+def test_incomplete_or_malformed_records_are_ingest_errors(tmp_path, db_session, record, message):
+    path = tmp_path / "bad.ndjson"
+    path.write_text(json.dumps(record) + "\n")
+    with pytest.raises(IngestError, match=message):
+        ingest_file(db_session, str(path))
+
+
+def test_parse_month():
+    assert parse_month("3") == 3
+    assert parse_month("sep") == 9
+    assert parse_month(" October ") == 10
+    with pytest.raises(IngestError):
+        parse_month("0")
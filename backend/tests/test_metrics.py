@@ -0,0 +1,105 @@
+# tests/test_metrics.py
+import asyncio
+import logging
+import threading
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, select, text
+
+from app import metrics
+from app.core import hashing
+from app.database import TimedQueuePool
+from app.models import EnergyTrack
+
+
+def _sample(name, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_are_timed_per_route_with_their_queries(client):
+    route = {"method": "GET", "route": "/energy/summary"}
+    before = _sample("http_request_duration_seconds_count", **route)
+    queries_before = _sample("db_queries_per_request_sum", route="/energy/summary")
+
+    res = client.get("/energy/summary", params={"energy_type": "generation"})
+    assert res.status_code == 200
+    timing = res.headers["server-timing"]
+    assert timing.startswith("db;dur=") and 'queries"' in timing
+
+    client.get("/energy/summary", params={"energy_type": "consumption"})
+    assert _sample("http_request_duration_seconds_count", **route) == before + 2
+    assert _sample("http_requests_total", status="200", **route) >= 2
+    assert _sample("db_queries_per_request_sum", route="/energy/summary") > queries_before
+    assert _sample("http_requests_in_progress", **route) == 0
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/energy/summary"}' in body
+    assert 'cache_hit_ratio{cache="energy"}' in body
+    assert 'cache_hits_total{cache="auth_token"}' in body
+    # Ids in paths don't make new labels
+    client.get("/energy/does-not-exist")
+    assert _sample("http_requests_total", method="GET", route="unmatched", status="404") >= 1
+
+
+def test_slow_queries_are_logged_with_parameters_and_plan(client, seeded, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.0)
+    before = _sample("db_slow_queries_total", route=metrics.NO_ROUTE)
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        seeded.execute(select(EnergyTrack.id).where(
+            EnergyTrack.site_id == 1, EnergyTrack.type_id == 2, EnergyTrack.source_id == 3,
+        )).all()
+
+    record = next(r for r in caplog.records if "energy_tracks" in r.getMessage())
+    message = record.getMessage()
+    assert "Parameters: (1, 2, 3)" in message
+    assert "Plan:" in message and "ix_energy_tracks_site_type_source_start" in message
+    assert _sample("db_slow_queries_total", route=metrics.NO_ROUTE) > before
+
+    # The async driver explains through its adapted cursor
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        assert client.get("/energy/export", params={"source": "solar"}).status_code == 200
+    assert any("route /energy/export" in r.getMessage() and "Plan:" in r.getMessage() for r in caplog.records)
+
+
+def test_a_failing_explain_only_loses_the_plan(seeded, monkeypatch, caplog):
+    metrics.register()
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.0)
+    monkeypatch.setitem(metrics._EXPLAIN, "sqlite", "EXPLAIN NOT VALID SQL ")
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        rows = seeded.execute(select(EnergyTrack.id).where(EnergyTrack.site_id == 1)).all()
+    assert len(rows) == 500
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith("Plan unavailable: ") for m in messages)
+    assert any("energy_tracks" in m and "Plan:" not in m for m in messages)
+
+
+def test_pool_checkout_wait_is_measured(db_path):
+    metrics.register()
+    engine = create_engine(f"sqlite:///{db_path}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    before = _sample("db_pool_checkout_wait_seconds_sum")
+    held = engine.connect()
+    threading.Timer(0.2, held.close).start()
+    try:
+        with engine.connect() as conn:  # waits for the held connection
+            conn.execute(text("SELECT 1"))
+    finally:
+        engine.dispose()
+    assert _sample("db_pool_checkout_wait_seconds_sum") - before >= 0.15
+
+
+def test_password_hashing_is_timed(monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_POOL_WORKERS", 0)
+    before = _sample("password_hashing_seconds_count", operation="hash_password")
+    asyncio.run(hashing.hash_password_async("secret"))
+    assert _sample("password_hashing_seconds_count", operation="hash_password") == before + 1
+
+
+@pytest.mark.parametrize("header, status", [(None, 401), ("Bearer wrong", 401), ("Bearer s3cret", 200)])
+def test_metrics_token(client, monkeypatch, header, status):
+    from app.routes import metrics as metrics_route
+
+    monkeypatch.setattr(metrics_route, "METRICS_TOKEN", "s3cret")
+    res = client.get("/metrics", headers={"Authorization": header} if header else {})
+    assert res.status_code == status
@@ -1,10 +1,12 @@
 # tests/test_models.py
+from datetime import datetime
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.database import Base
-from app.models import User, EnergySource, EnergyType, EnergyTrack
+from app.models import User, EnergySource, EnergyType, EnergyTrack, Site, UserSite
 
 # In-memory SQLite DB for testing
 @pytest.fixture(scope="function")
@@ -45,14 +47,37 @@ def test_create_energy_type(db_session):
 def test_create_energy_track(db_session):
     source = EnergySource(name="Wind")
     etype = EnergyType(name="consumption")
-    db_session.add_all([source, etype])
+    site = Site(name="harbour")
+    db_session.add_all([source, etype, site])
     db_session.commit()
 
-    track = EnergyTrack(source_id=source.id, type_id=etype.id, month=4, kwh=1500.75)
+    track = EnergyTrack(
+        site_id=site.id,
+        source_id=source.id,
+        type_id=etype.id,
+        meter_id="meter-7",
+        start_time=datetime(2024, 4, 1, 12),
+        end_time=datetime(2024, 4, 1, 13),
+        kwh=1500.75,
+    )
     db_session.add(track)
     db_session.commit()
 
     result = db_session.query(EnergyTrack).first()
     assert result is not None
-    assert result.month == 4
+    assert result.start_time == datetime(2024, 4, 1, 12)
+    assert result.end_time == datetime(2024, 4, 1, 13)
+    assert result.meter_id == "meter-7"
     assert float(result.kwh) == 1500.75
+
+
+def test_user_site_grants(db_session):
+    user = User(email="ops@example.com", username="ops", hashed_password="hashed")
+    sites = [Site(name="harbour"), Site(name="airport")]
+    db_session.add_all([user, *sites])
+    db_session.flush()
+    db_session.add(UserSite(user_id=user.id, site_id=sites[1].id))
+    db_session.commit()
+
+    granted = db_session.query(Site.name).join(UserSite, UserSite.site_id == Site.id).filter(UserSite.user_id == user.id)
+    assert [name for name, in granted] == ["airport"]
@@ -0,0 +1,232 @@
+# tests/test_percentiles.py
+"""Sketch accuracy is checked against exact ``percentile_cont`` values:
+NumPy's default (linear) percentiles, which use the same definition, and, when
+``TEST_POSTGRES_URL`` points at a scratch database, Postgres itself.
+"""
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import EnergyReadingSketch, EnergySource, EnergyTrack, EnergyType, Site
+from app.utils.dimensions import registry
+from app.utils.ingest import ingest_file
+from app.utils.sketches import SKETCH_ACCURACY, QuantileSketch, backfill_sketches, find_percentiles, summarize, update_sketches
+
+QUANTILES = (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0)
+
+
+def _assert_within_bound(estimate, values, q, rounding=1e-9):
+    """The documented bound: α relative to the reading of rank ⌊q·(n - 1)⌋, plus the gap to the next for percentile_cont."""
+    values = np.sort(values)
+    rank = q * (len(values) - 1)
+    low, high = values[int(np.floor(rank))], values[int(np.ceil(rank))]
+    assert abs(estimate - low) <= SKETCH_ACCURACY * abs(low) + rounding
+    assert abs(estimate - np.percentile(values, q * 100)) <= SKETCH_ACCURACY * abs(low) + (high - low) + rounding
+
+
+def _sketches(db):
+    return {
+        (r.site_id, r.type_id, r.source_id, r.year, r.month): (r.count, r.sketch, r.peak_kwh, r.peak_at)
+        for r in db.scalars(select(EnergyReadingSketch))
+    }
+
+
+@pytest.mark.parametrize("distribution", ["gamma", "lognormal", "with_corrections"])
+def test_merged_sketches_stay_within_the_error_bound(distribution):
+    rng = np.random.default_rng(5)
+    values = {
+        "gamma": lambda: rng.gamma(2.0, 150.0, 20000),
+        "lognormal": lambda: rng.lognormal(3.0, 2.0, 20000),
+        # Corrections are negative, and some meters report nothing
+        "with_corrections": lambda: np.concatenate([rng.normal(200, 80, 19000), np.zeros(500), -rng.gamma(2, 20, 500)]),
+    }[distribution]().round(2)
+    rng.shuffle(values)
+
+    # Sketched in 24 "months", merged afterwards
+    parts = [QuantileSketch.of(batch) for batch in np.array_split(values, 24)]
+    merged = parts[0].merge(*parts[1:])
+    assert merged.count == len(values)
+    assert QuantileSketch.from_bytes(merged.to_bytes()).quantiles(QUANTILES) == merged.quantiles(QUANTILES)
+    for q, estimate in zip(QUANTILES, merged.quantiles(QUANTILES)):
+        _assert_within_bound(estimate, values, q)
+
+    # Removing readings is exact: the result is the sketch of the rest
+    rest = merged.remove(values[:3000])
+    assert rest.to_bytes() == QuantileSketch.of(values[3000:]).to_bytes()
+
+
+def test_orm_writes_keep_the_sketches_in_sync(seeded):
+    written = _sketches(seeded)
+    assert sum(count for count, *_ in written.values()) == 500
+    backfill_sketches(seeded, batch_size=64)
+    assert _sketches(seeded) == written
+
+    tracks = seeded.scalars(select(EnergyTrack).order_by(EnergyTrack.id).limit(3)).all()
+    seeded.delete(tracks[0])
+    tracks[1].kwh = Decimal("12.34")
+    tracks[2].start_time += timedelta(days=40)
+    seeded.commit()
+    # Only deleting a cell's peak leaves it inexact, and the peak here is still there
+    written = _sketches(seeded)
+    backfill_sketches(seeded)
+    rebuilt = _sketches(seeded)
+    assert {k: v[:2] for k, v in written.items()} == {k: v[:2] for k, v in rebuilt.items()}
+
+
+def test_deleting_the_peak_falls_back_to_the_sketch(seeded):
+    top = seeded.scalars(select(EnergyTrack).order_by(EnergyTrack.kwh.desc()).limit(1)).one()
+    key = (top.site_id, top.type_id, top.source_id, top.start_time.year, top.start_time.month)
+    seeded.delete(top)
+    seeded.commit()
+
+    row = seeded.get(EnergyReadingSketch, key)
+    backfill_sketches(seeded)
+    exact = seeded.get(EnergyReadingSketch, key)
+    assert row.peak_at is None and exact.peak_at is not None
+    assert float(row.peak_kwh) == pytest.approx(float(exact.peak_kwh), rel=SKETCH_ACCURACY)
+
+
+def test_concurrent_writers_merge_into_the_latest_sketch(seeded, db_engine):
+    row = seeded.scalars(select(EnergyReadingSketch).limit(1)).one()
+    key = (row.site_id, row.type_id, row.source_id, row.year, row.month)
+    count, start = row.count, datetime(row.year, row.month, 2)
+
+    with Session(db_engine) as other:
+        update_sketches(other, summarize([key], [start], [10.0]))
+        other.commit()
+    # ``seeded`` still holds the row as it was before the other writer committed
+    update_sketches(seeded, summarize([key], [start], [20.0]))
+    seeded.commit()
+    assert _sketches(seeded)[key][0] == count + 2
+
+
+def test_ingest_updates_the_sketches(tmp_path, db_session):
+    rng = random.Random(9)
+    path = tmp_path / "readings.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["site", "source", "type", "start", "kwh"])
+        writer.writeheader()
+        for i in range(300):
+            start = datetime(2024, 1, 1) + timedelta(hours=7 * i)
+            writer.writerow({"site": rng.choice(["a", "b"]), "source": rng.choice(["solar", "wind"]),
+                             "type": "generation", "start": start.isoformat(), "kwh": round(rng.uniform(1, 99), 2)})
+    ingest_file(db_session, str(path), chunk_size=64)
+
+    ingested = _sketches(db_session)
+    assert sum(count for count, *_ in ingested.values()) == 300
+    backfill_sketches(db_session)
+    assert _sketches(db_session) == ingested
+
+
+def _readings(db, source, start=None, end=None):
+    stmt = (
+        select(EnergyTrack.kwh)
+        .join(EnergySource, EnergySource.id == EnergyTrack.source_id)
+        .join(EnergyType, EnergyType.id == EnergyTrack.type_id)
+        .where(EnergySource.name == source, EnergyType.name == "generation")
+    )
+    if start is not None:
+        stmt = stmt.where(EnergyTrack.start_time >= start, EnergyTrack.start_time < end)
+    return np.array([float(kwh) for kwh in db.scalars(stmt)])
+
+
+def test_percentiles_endpoint(client, seeded):
+    rows = client.get("/energy/percentiles", params={"energy_type": "generation"}).json()
+    assert [r["source"] for r in rows] == sorted(r["source"] for r in rows)
+    for row in rows:
+        values = _readings(seeded, row["source"])
+        assert row["period"] is None and row["count"] == len(values)
+        assert row["peak_kwh"] == pytest.approx(values.max())
+        for field, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            _assert_within_bound(row[field], values, q, rounding=0.005)
+
+    # One row per source and year, and custom quantiles
+    yearly = client.get("/energy/percentiles", params={
+        "energy_type": "generation", "source": "solar", "granularity": "year", "q": [0.999, 0.1],
+    }).json()
+    assert [r["period"] for r in yearly] == ["2023", "2024"]
+    for row in yearly:
+        values = _readings(seeded, "solar", datetime(int(row["period"]), 1, 1), datetime(int(row["period"]) + 1, 1, 1))
+        assert row["count"] == len(values)
+        _assert_within_bound(row["p99.9"], values, 0.999, rounding=0.005)
+        _assert_within_bound(row["p10"], values, 0.1, rounding=0.005)
+        assert datetime.fromisoformat(row["peak_at"]).year == int(row["period"])
+
+    # The top estimate can overshoot the exact peak by SKETCH_ACCURACY, but is never reported above it
+    for row in client.get("/energy/percentiles", params={"energy_type": "generation", "q": [0, 1]}).json():
+        assert row["p0"] <= row["p100"] <= row["peak_kwh"]
+        assert row["p100"] == pytest.approx(row["peak_kwh"], rel=SKETCH_ACCURACY)
+
+    monthly = client.get("/energy/percentiles", params={
+        "energy_type": "generation", "granularity": "month",
+        "start": "2024-06-01T00:00:00", "end": "2024-08-01T00:00:00",
+    }).json()
+    assert {r["period"] for r in monthly} == {"Jun 2024", "Jul 2024"}
+
+    bad = [
+        {"granularity": "day"},
+        {"start": "2024-06-15T00:00:00"},
+        {"q": 1.5},
+    ]
+    for params in bad:
+        assert client.get("/energy/percentiles", params={"energy_type": "generation", **params}).status_code == 400
+    assert client.get("/energy/percentiles", params={"energy_type": "generation", "source": "wind"}).json() == []
+    assert client.get("/energy/percentiles", params={"energy_type": "generation", "site": "south"}).status_code == 404
+
+
+@pytest.fixture
+def postgres_session():
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    registry.clear()
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        registry.clear()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def test_postgres_percentile_cont(postgres_session):
+    db = postgres_session
+    rng = np.random.default_rng(13)
+    site, generation = Site(name="north"), EnergyType(name="generation")
+    sources = [EnergySource(name=name) for name in ("solar", "wind")]
+    db.add_all([site, generation, *sources])
+    db.flush()
+    start = datetime(2024, 1, 1)
+    db.execute(EnergyTrack.__table__.insert(), [
+        {"site_id": site.id, "type_id": generation.id, "source_id": source.id,
+         "start_time": start + timedelta(minutes=15 * i), "kwh": round(float(kwh), 2)}
+        for source, scale in zip(sources, (40.0, 120.0))
+        for i, kwh in enumerate(rng.gamma(2.0, scale, 8000))
+    ])
+    db.commit()
+    backfill_sketches(db)
+
+    exact = {
+        name: (p50, p95, p99)
+        for name, p50, p95, p99 in db.execute(text(
+            "SELECT s.name, percentile_cont(0.5) WITHIN GROUP (ORDER BY t.kwh),"
+            " percentile_cont(0.95) WITHIN GROUP (ORDER BY t.kwh), percentile_cont(0.99) WITHIN GROUP (ORDER BY t.kwh)"
+            " FROM energy_tracks t JOIN energy_sources s ON s.id = t.source_id GROUP BY s.name"
+        ))
+    }
+    for row in find_percentiles(db, energy_type="generation"):
+        for estimate, value in zip((row["p50"], row["p95"], row["p99"]), exact[row["source"]]):
+            # 8,000 readings per source leave no noticeable gap between neighbours
+            assert estimate == pytest.approx(float(value), rel=SKETCH_ACCURACY + 0.005)
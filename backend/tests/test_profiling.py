@@ -0,0 +1,154 @@
+# tests/test_profiling.py
+import asyncio
+import json
+import logging
+import time
+
+import pytest
+
+from app import profiling
+from app.profiling import Phases, phase
+
+PARAMS = {"energy_type": "generation", "raw": True}
+
+
+@pytest.fixture
+def profile_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    return "s3cret"
+
+
+def _timings(header):
+    return {item.split(";")[0].strip(): float(item.split("dur=")[1]) for item in header.split(",")}
+
+
+def test_phases_count_their_own_time_only():
+    phases = Phases()
+    token = profiling._phases.set(phases)
+    started = time.perf_counter()
+    try:
+        with phase("rows"):
+            time.sleep(0.02)
+            with phase("cube"):
+                time.sleep(0.06)
+                profiling.record("db", 0.04)
+    finally:
+        profiling._phases.reset(token)
+    elapsed = time.perf_counter() - started
+
+    # Sleeps overrun, so only bound each phase by what it would be if it also counted what it wraps
+    assert phases.seconds["db"] == 0.04
+    assert 0.02 <= phases.seconds["cube"] < 0.06
+    assert 0.02 <= phases.seconds["rows"] < 0.02 + phases.seconds["cube"] + phases.seconds["db"]
+    assert sum(phases.seconds.values()) <= elapsed
+    breakdown = phases.breakdown(0.1)
+    assert breakdown["other"] == pytest.approx(100 - sum(phases.seconds.values()) * 1000)
+
+    # Outside a profiled request, phases are no-ops
+    with phase("rows"):
+        profiling.record("db", 1.0)
+    assert profiling._phases.get() is None
+
+
+def test_off_unless_configured(client):
+    res = client.get("/energy/summary", params=PARAMS, headers={"X-Profile": "anything"})
+    assert res.status_code == 200
+    assert "x-profile-status" not in res.headers
+    assert isinstance(res.json(), list)
+
+
+def test_requested_profile_replaces_the_response(client, profile_token):
+    res = client.get("/energy/trends", params=PARAMS, headers={"X-Profile": profile_token})
+    assert res.status_code == 200
+    assert res.headers["x-profile-status"] == "200"
+    profile = res.json()
+    assert profile["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+    assert profile["shared"]["frames"]
+
+    # The first Server-Timing is the profile's; the metrics middleware adds its own
+    timings = _timings(res.headers.get_list("server-timing")[0])
+    assert {"db", "cube", "rows", "encode", "other", "total"} <= set(timings)
+    assert timings["total"] >= timings["db"] + timings["cube"] + timings["encode"]
+
+    # Wrong token: just the response
+    res = client.get("/energy/trends", params=PARAMS, headers={"X-Profile": "wrong"})
+    assert "x-profile-status" not in res.headers and isinstance(res.json(), list)
+
+
+def test_collapsed_stacks(client, profile_token):
+    res = client.get(
+        "/energy/summary", params=PARAMS, headers={"X-Profile": profile_token, "X-Profile-Format": "collapsed"},
+    )
+    assert res.headers["content-type"].startswith("text/plain")
+    lines = res.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, _, micros = line.rpartition(" ")
+        assert stack and int(micros) > 0
+
+
+def test_sampled_profiles_are_logged_and_saved(client, monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    with caplog.at_level(logging.INFO, logger="app.profile"):
+        res = client.get("/energy/summary", params=PARAMS)
+    assert isinstance(res.json(), list)
+
+    message = next(r.getMessage() for r in caplog.records if r.name == "app.profile")
+    assert message.startswith("Profiled GET /energy/summary (200): ")
+    assert "db " in message and "encode " in message
+    saved = list(tmp_path.glob("*-energy-summary-*.speedscope.json"))
+    assert len(saved) == 1
+    assert json.loads(saved[0].read_text())["exporter"] == "pyinstrument"
+
+
+def _scope(path, query=b""):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query, "headers": [],
+        "root_path": "", "server": ("testserver", 80), "client": ("testclient", 50000),
+    }
+
+
+def test_sampled_event_streams_free_the_profiler(client, async_db_engine, monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    async def run():
+        requested, disconnected = asyncio.Event(), asyncio.Event()
+        chunks = asyncio.Queue()
+
+        async def receive():
+            if requested.is_set():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            requested.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message.get("body"):
+                chunks.put_nowait(message["body"])
+
+        stream = asyncio.create_task(client.app(_scope("/energy/stream"), receive, send))
+        assert (await asyncio.wait_for(chunks.get(), 5)).startswith(b"retry:")
+
+        # While the stream is open, other sampled requests are still profiled
+        async def receive_once():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        statuses = []
+
+        async def record(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await client.app(_scope("/energy/summary", b"energy_type=generation"), receive_once, record)
+        assert statuses == [200]
+
+        disconnected.set()
+        await asyncio.wait_for(stream, 5)
+        await async_db_engine.dispose()
+
+    with caplog.at_level(logging.INFO, logger="app.profile"):
+        asyncio.run(run())
+    profiled = [r.getMessage() for r in caplog.records if r.name == "app.profile"]
+    assert len(profiled) == 1 and profiled[0].startswith("Profiled GET /energy/summary (200): ")
@@ -0,0 +1,153 @@
+# tests/test_query_plans.py
+"""Check that the hot /energy aggregation queries, which read one site, are
+served by ``ix_energy_tracks_site_type_source_start``.
+
+The SQLite checks always run. The Postgres checks, which assert an
+index-only scan, run when ``TEST_POSTGRES_URL`` points at a scratch
+database (e.g. a local ``postgres`` container); its tables are dropped
+afterwards.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import EnergySource, EnergyType, EnergyTrack, Site
+from app.utils.columnar import load_energy_cube
+from app.utils.energy_data import monthly_totals_by_source, totals_by_source
+from app.utils.periods import Granularity, Window
+
+
+SITE_IDS = (2,)
+
+
+def monthly_totals(db, energy_type, use_rollup):
+    return monthly_totals_by_source(db, energy_type, use_rollup, site_ids=SITE_IDS)
+
+
+def totals(db, energy_type, use_rollup):
+    return totals_by_source(db, energy_type, use_rollup, site_ids=SITE_IDS)
+
+
+def energy_cube(db, energy_type, use_rollup):
+    return load_energy_cube(db, use_rollup=use_rollup, site_ids=SITE_IDS)
+
+
+def windowed_energy_cube(db, energy_type, use_rollup):
+    window = Window(datetime(2024, 3, 1), datetime(2024, 3, 8), Granularity.day)
+    return load_energy_cube(db, window, use_rollup=use_rollup, site_ids=SITE_IDS)
+
+
+INDEX_NAME = "ix_energy_tracks_site_type_source_start"
+TIME_INDEX_NAME = "ix_energy_tracks_start_time"
+HOT_QUERIES = [monthly_totals, totals, energy_cube]
+
+
+def _seed(engine, rows=2000):
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(EnergyType.__table__.insert(), [{"id": 1, "name": "generation"}, {"id": 2, "name": "consumption"}])
+        conn.execute(EnergySource.__table__.insert(), [{"id": i, "name": f"source-{i}"} for i in range(1, 6)])
+        conn.execute(Site.__table__.insert(), [{"id": i, "name": f"site-{i}"} for i in range(1, 5)])
+        conn.execute(EnergyTrack.__table__.insert(), [
+            {
+                "site_id": rng.randint(1, 4),
+                "type_id": rng.randint(1, 2),
+                "source_id": rng.randint(1, 5),
+                "start_time": datetime(2024, 1, 1) + timedelta(hours=rng.randrange(366 * 24)),
+                "kwh": round(rng.uniform(100, 1000), 2),
+            }
+            for _ in range(rows)
+        ])
+
+
+def _capture_statement(engine, fn):
+    """Run ``fn`` on the raw-track path and return the SQL it executed on ``energy_tracks``."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if "energy_tracks" in statement:
+            captured.append((statement, parameters))
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn(db, "generation", use_rollup=False)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        db.close()
+
+    assert len(captured) == 1
+    return captured[0]
+
+
+@pytest.fixture(scope="module")
+def sqlite_engine():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    _seed(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("fn", HOT_QUERIES)
+def test_sqlite_hot_queries_use_composite_index(sqlite_engine, fn):
+    statement, parameters = _capture_statement(sqlite_engine, fn)
+    # Names come from the dimension registry
+    assert "JOIN" not in statement
+    with sqlite_engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+
+    details = [row[-1] for row in plan]
+    track_steps = [d for d in details if "energy_tracks" in d]
+    assert track_steps, details
+    assert all(INDEX_NAME in d for d in track_steps), details
+
+
+def test_sqlite_windowed_query_searches_an_index(sqlite_engine):
+    statement, parameters = _capture_statement(sqlite_engine, windowed_energy_cube)
+    with sqlite_engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+
+    details = [row[-1] for row in plan]
+    track_steps = [d for d in details if "energy_tracks" in d]
+    assert track_steps, details
+    assert all(INDEX_NAME in d or TIME_INDEX_NAME in d for d in track_steps), details
+    assert not any(d.startswith("SCAN energy_tracks") and "INDEX" not in d for d in track_steps), details
+
+
+@pytest.fixture(scope="module")
+def postgres_engine():
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    _seed(engine, rows=20000)
+    # Index-only scans need an up-to-date visibility map
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE energy_tracks"))
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.mark.parametrize("fn", HOT_QUERIES)
+def test_postgres_hot_queries_use_index_only_scan(postgres_engine, fn):
+    statement, parameters = _capture_statement(postgres_engine, fn)
+    with postgres_engine.connect() as conn:
+        # Tiny test tables would otherwise favour a sequential scan
+        conn.execute(text("SET enable_seqscan = off"))
+        plan = "\n".join(
+            row[0] for row in conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+        )
+
+    assert f"Index Only Scan using {INDEX_NAME} on energy_tracks" in plan, plan
@@ -0,0 +1,68 @@
+# tests/test_serialization.py
+from typing import List
+
+import msgpack
+import pytest
+from pydantic import TypeAdapter
+
+from app.schemas import ComposedPoint, DashboardOut, SummaryPoint, TrendsPoint
+from app.utils.serialization import JSON, MSGPACK, negotiate
+
+VIEWS = [
+    ("/energy/trends", {"energy_type": "generation"}, List[TrendsPoint]),
+    ("/energy/composition", {"energy_type": "generation"}, List[TrendsPoint]),
+    ("/energy/summary", {"energy_type": "generation"}, List[SummaryPoint]),
+    ("/energy/composed", {"energy_type": "generation", "highlight": "solar"}, List[ComposedPoint]),
+    ("/energy/dashboard", {"energy_type": "generation", "highlight": "solar"}, DashboardOut),
+    ("/energy/trends", {"energy_type": "consumption", "granularity": "day", "start": "2024-02-01T00:00:00",
+                        "end": "2024-03-01T00:00:00"}, List[TrendsPoint]),
+]
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON),
+    ("*/*", JSON),
+    ("application/json", JSON),
+    ("application/msgpack", MSGPACK),
+    ("application/x-msgpack", MSGPACK),
+    ("application/json;q=0.5, application/msgpack", MSGPACK),
+    ("application/msgpack;q=0.5, */*", JSON),
+    ("text/html, */*;q=0.8", JSON),
+    ("text/csv", JSON),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+@pytest.mark.parametrize("path, params, model", VIEWS)
+def test_fast_path_matches_the_response_model(client, path, params, model):
+    res = client.get(path, params=params)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == JSON
+    body = res.json()
+    # The routes skip FastAPI's validation, so the rows must already conform
+    assert TypeAdapter(model).dump_python(TypeAdapter(model).validate_python(body), mode="json") == body
+
+    packed = client.get(path, params=params, headers={"Accept": MSGPACK})
+    assert packed.headers["content-type"] == MSGPACK
+    assert msgpack.unpackb(packed.content) == body
+
+
+def test_encodings_have_their_own_etags(client):
+    params = {"energy_type": "generation"}
+    as_json = client.get("/energy/summary", params=params)
+    as_msgpack = client.get("/energy/summary", params=params, headers={"Accept": MSGPACK})
+    assert as_json.headers["vary"] == as_msgpack.headers["vary"] == "Accept"
+    assert as_json.headers["etag"] != as_msgpack.headers["etag"]
+
+    res = client.get("/energy/summary", params=params, headers={"Accept": MSGPACK, "If-None-Match": as_json.headers["etag"]})
+    assert res.status_code == 200
+
+
+def test_openapi_keeps_the_response_models(client):
+    paths = client.get("/openapi.json").json()["paths"]
+    content = paths["/energy/trends"]["get"]["responses"]["200"]["content"]
+    assert content[JSON]["schema"]["items"]["$ref"] == "#/components/schemas/TrendsPoint"
+    assert MSGPACK in content
+    assert paths["/energy/dashboard"]["get"]["responses"]["200"]["content"][JSON]["schema"]["$ref"] \
+        == "#/components/schemas/DashboardOut"
@@ -0,0 +1,147 @@
+# tests/test_sites.py
+import asyncio
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import cache, stream
+from app.models import EnergySource, EnergyTrack, EnergyType, Site, UserSite
+from app.stream import StreamHub
+from app.utils.columnar import load_energy_cube
+from app.utils.ingest import ingest_file
+from app.utils.rollup import check_rollup_consistency
+
+SUMMARY = {"energy_type": "generation"}
+
+
+def _add_site(db, name, kwh=Decimal("1000.00"), months=(1, 2, 3)):
+    """A site with one generation track per month of 2024, all from solar."""
+    site = Site(name=name)
+    db.add(site)
+    db.flush()
+    solar = db.scalar(select(EnergySource.id).where(EnergySource.name == "solar"))
+    generation = db.scalar(select(EnergyType.id).where(EnergyType.name == "generation"))
+    db.add_all(
+        EnergyTrack(site_id=site.id, source_id=solar, type_id=generation, start_time=datetime(2024, month, 5), kwh=kwh)
+        for month in months
+    )
+    db.commit()
+    return site
+
+
+def _grant(db, site, user_id=1):
+    db.add(UserSite(user_id=user_id, site_id=site.id))
+    db.commit()
+
+
+def _summary(res) -> dict:
+    assert res.status_code == 200, res.text
+    return {row["source"]: row["kwh"] for row in res.json()}
+
+
+def test_users_only_see_the_sites_they_are_granted(client, seeded):
+    north = _summary(client.get("/energy/summary", params=SUMMARY))
+    south = _add_site(seeded, "south")
+
+    assert _summary(client.get("/energy/summary", params=SUMMARY)) == north
+    assert client.get("/energy/summary", params={**SUMMARY, "site": "south"}).status_code == 404
+    assert client.get("/energy/summary", params={**SUMMARY, "site": "nowhere"}).status_code == 404
+    exported = client.get("/energy/export", params={"format": "ndjson"}).text.splitlines()
+    assert {json.loads(line)["site"] for line in exported} == {"north"}
+
+    # Granting is picked up at once: the grant's commit clears the cached site list
+    _grant(seeded, south)
+    assert _summary(client.get("/energy/summary", params={**SUMMARY, "site": "south"})) == {"solar": 3000.0}
+    assert _summary(client.get("/energy/summary", params={**SUMMARY, "site": "north"})) == north
+    combined = _summary(client.get("/energy/summary", params=SUMMARY))
+    assert combined["solar"] == round(north["solar"] + 3000.0, 2)
+
+
+def test_writes_to_one_site_leave_other_sites_cached(client, seeded, async_db_engine):
+    south = _add_site(seeded, "south")
+    _grant(seeded, south)
+    north_first = client.get("/energy/summary", params={**SUMMARY, "site": "north"})
+    south_first = client.get("/energy/summary", params={**SUMMARY, "site": "south"})
+
+    # Only south's tracks change; north's version and responses stay cached
+    seeded.add(EnergyTrack(site_id=south.id, source_id=1, type_id=1, start_time=datetime(2024, 4, 5),
+                           kwh=Decimal("5.00")))
+    seeded.commit()
+
+    statements = []
+    engine = async_db_engine.sync_engine
+    record = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        hits = cache.energy_cache.hits
+        res = client.get("/energy/summary", params={**SUMMARY, "site": "north"},
+                         headers={"If-None-Match": north_first.headers["etag"]})
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # Only the global versions were re-read
+    assert res.status_code == 304
+    assert len(statements) == 1 and "data_versions" in statements[0]
+    assert cache.energy_cache.hits > hits
+
+    res = client.get("/energy/summary", params={**SUMMARY, "site": "south"},
+                     headers={"If-None-Match": south_first.headers["etag"]})
+    assert res.status_code == 200
+    assert res.headers["etag"] != south_first.headers["etag"]
+
+
+def test_cube_and_rollup_are_per_site(seeded):
+    south = _add_site(seeded, "south", kwh=Decimal("0.25"), months=(1,))
+    north = seeded.scalar(select(Site.id).where(Site.name == "north"))
+    assert check_rollup_consistency(seeded) == []
+
+    for use_rollup in (True, False):
+        cube = load_energy_cube(seeded, use_rollup=use_rollup, site_ids=(south.id,))
+        assert int(cube.cents.sum()) == 25 and int(cube.counts.sum()) == 1
+        everything = load_energy_cube(seeded, use_rollup=use_rollup)
+        northern = load_energy_cube(seeded, use_rollup=use_rollup, site_ids=(north,))
+        assert int(everything.cents.sum()) == int(northern.cents.sum()) + 25
+
+
+def test_stream_only_sends_granted_sites(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=0.05)
+    south = _add_site(seeded, "south")
+    north = seeded.scalar(select(Site.id).where(Site.name == "north"))
+
+    async def scenario():
+        subscriber = hub.subscribe(async_sessionmaker(bind=async_db_engine), site_ids=[north])
+        await anext(subscriber)
+        for site_id in (south.id, north):
+            seeded.add(EnergyTrack(site_id=site_id, source_id=1, type_id=1, start_time=datetime(2024, 6, 1),
+                                   kwh=Decimal("2.00")))
+            seeded.commit()
+        frame = await asyncio.wait_for(anext(subscriber), 5)
+        data = json.loads(frame.decode().split("data: ", 1)[1])
+        assert {cell["site"] for cell in data["cells"]} == {"north"}
+        await subscriber.aclose()
+        await async_db_engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_ingest_assigns_sites_and_bumps_their_versions(tmp_path, db_session):
+    path = tmp_path / "readings.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["site", "source", "type", "start", "kwh"])
+        writer.writeheader()
+        writer.writerows([
+            {"site": "harbour", "source": "solar", "type": "generation", "start": "2024-01-01T10:00", "kwh": "1.5"},
+            {"site": "", "source": "solar", "type": "generation", "start": "2024-01-01T11:00", "kwh": "2.5"},
+        ])
+    ingest_file(db_session, str(path), default_site="airport")
+
+    per_site = dict(db_session.execute(
+        select(Site.name, func.sum(EnergyTrack.kwh)).join(Site, Site.id == EnergyTrack.site_id).group_by(Site.name)
+    ).all())
+    assert per_site == {"harbour": Decimal("1.50"), "airport": Decimal("2.50")}
+    assert check_rollup_consistency(db_session) == []
+    for site_id in db_session.scalars(select(Site.id)):
+        assert cache.data_version(db_session, cache.site_version_name(site_id)).version == 1
@@ -0,0 +1,239 @@
+# tests/test_stream.py
+import asyncio
+import json
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import stream
+from app.models import EnergyMonthlyRollup, EnergySource, EnergyTrack, EnergyType, Site, UserSite
+from app.stream import RESET, StreamHub
+from app.utils.rollup import rebuild_rollup
+
+TICK = 0.05
+
+
+def _ids(db):
+    sources = dict(db.execute(select(EnergySource.name, EnergySource.id)).all())
+    types = dict(db.execute(select(EnergyType.name, EnergyType.id)).all())
+    return sources, types
+
+
+def _site(db, name="north"):
+    return db.scalar(select(Site.id).where(Site.name == name))
+
+
+def _write(db, source_id, type_id, kwh, start=datetime(2024, 5, 3), site="north"):
+    db.add(EnergyTrack(site_id=_site(db, site), source_id=source_id, type_id=type_id, start_time=start, kwh=kwh))
+    db.commit()
+
+
+def _parse(frame: bytes) -> dict:
+    fields = dict(line.split(": ", 1) for line in frame.decode().splitlines() if line)
+    return {**fields, "data": json.loads(fields["data"])}
+
+
+def _rollup_kwh(db, type_id, source_id, year, month) -> float:
+    db.expire_all()
+    return float(db.get(EnergyMonthlyRollup, (_site(db), type_id, source_id, year, month)).kwh)
+
+
+def _run(async_db_engine, scenario):
+    async def run():
+        try:
+            await scenario(async_sessionmaker(bind=async_db_engine, expire_on_commit=False))
+        finally:
+            await async_db_engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_a_burst_of_writes_is_one_delta_with_current_values(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=TICK)
+    sources, types = _ids(seeded)
+
+    async def scenario(sessionmaker):
+        generation = hub.subscribe(sessionmaker, "generation")
+        everything = hub.subscribe(sessionmaker)
+        assert (await anext(generation)).startswith(b"retry:")
+        await anext(everything)
+
+        # Three transactions within one tick
+        _write(seeded, sources["solar"], types["generation"], Decimal("10.50"))
+        _write(seeded, sources["solar"], types["generation"], Decimal("20.25"))
+        _write(seeded, sources["grid"], types["consumption"], Decimal("5.00"), datetime(2023, 2, 1))
+
+        delta = _parse(await asyncio.wait_for(anext(generation), 5))
+        assert delta["event"] == "delta" and int(delta["id"]) == delta["data"]["version"]
+        assert delta["data"]["cells"] == [{
+            "site": "north", "type": "generation", "source": "solar", "month": "May 2024",
+            "kwh": _rollup_kwh(seeded, types["generation"], sources["solar"], 2024, 5),
+        }]
+
+        unfiltered = _parse(await asyncio.wait_for(anext(everything), 5))
+        assert {(c["type"], c["month"]) for c in unfiltered["data"]["cells"]} \
+            == {("generation", "May 2024"), ("consumption", "Feb 2023")}
+        assert hub.deltas_sent == 1
+
+        await generation.aclose()
+        await everything.aclose()
+        assert len(hub) == 0
+
+    _run(async_db_engine, scenario)
+
+
+def test_thousands_of_idle_subscribers_share_one_encoded_delta(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=TICK)
+    sources, types = _ids(seeded)
+
+    async def scenario(sessionmaker):
+        async with sessionmaker() as db:
+            await db.execute(select(1))  # open the pooled connection up front
+        threads = threading.active_count()
+
+        subscribers = [hub.subscribe(sessionmaker) for _ in range(5000)]
+        for subscriber in subscribers:
+            await anext(subscriber)
+        assert len(hub) == 5000
+
+        _write(seeded, sources["tidal"], types["generation"], Decimal("1.00"))
+        frames = await asyncio.wait_for(asyncio.gather(*(anext(s) for s in subscribers)), 10)
+        assert len({id(frame) for frame in frames}) == 1
+        assert threading.active_count() == threads
+
+        for subscriber in subscribers:
+            await subscriber.aclose()
+        assert len(hub) == 0
+
+    _run(async_db_engine, scenario)
+
+
+def test_lagging_subscribers_and_rebuilds_get_a_reset(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=TICK, buffer=1)
+    sources, types = _ids(seeded)
+
+    async def scenario(sessionmaker):
+        lagging = hub.subscribe(sessionmaker)
+        await anext(lagging)
+        for month in (1, 2):
+            _write(seeded, sources["hydro"], types["generation"], Decimal("3.00"), datetime(2024, month, 1))
+            await asyncio.sleep(TICK * 4)
+        assert hub.deltas_sent == 2
+        assert await anext(lagging) == RESET
+
+        rebuild_rollup(seeded)
+        assert await asyncio.wait_for(anext(lagging), 5) == RESET
+        await lagging.aclose()
+
+    _run(async_db_engine, scenario)
+
+
+def test_revoked_sites_stop_streaming(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=TICK)
+    sources, types = _ids(seeded)
+
+    async def scenario(sessionmaker):
+        # User 1 is granted the seeded site
+        subscriber = hub.subscribe(sessionmaker, site_ids=[_site(seeded)], user_id=1)
+        await anext(subscriber)
+        _write(seeded, sources["solar"], types["generation"], Decimal("1.00"))
+        assert _parse(await asyncio.wait_for(anext(subscriber), 5))["event"] == "delta"
+
+        seeded.delete(seeded.get(UserSite, (1, _site(seeded))))
+        seeded.commit()
+        _write(seeded, sources["solar"], types["generation"], Decimal("2.00"))
+        assert await asyncio.wait_for(anext(subscriber), 5) == RESET
+        _write(seeded, sources["solar"], types["generation"], Decimal("3.00"))
+        await asyncio.sleep(TICK * 4)
+        assert hub.deltas_sent == 1
+        await subscriber.aclose()
+
+    _run(async_db_engine, scenario)
+
+
+def test_a_failed_read_resets_every_subscriber(seeded, async_db_engine, monkeypatch):
+    hub = StreamHub(stream.broker, tick=TICK)
+    sources, types = _ids(seeded)
+
+    def lost_connection(session, keys):
+        raise OSError("connection lost")
+
+    async def scenario(sessionmaker):
+        subscriber = hub.subscribe(sessionmaker)
+        await anext(subscriber)
+        monkeypatch.setattr(stream, "read_cells", lost_connection)
+        _write(seeded, sources["solar"], types["generation"], Decimal("1.00"))
+        assert await asyncio.wait_for(anext(subscriber), 5) == RESET
+
+        # The next tick reads again
+        monkeypatch.undo()
+        _write(seeded, sources["solar"], types["generation"], Decimal("2.00"))
+        assert _parse(await asyncio.wait_for(anext(subscriber), 5))["event"] == "delta"
+        await subscriber.aclose()
+
+    _run(async_db_engine, scenario)
+
+
+def test_rolled_back_writes_are_not_published(seeded, async_db_engine):
+    hub = StreamHub(stream.broker, tick=TICK)
+    sources, types = _ids(seeded)
+
+    async def scenario(sessionmaker):
+        subscriber = hub.subscribe(sessionmaker)
+        await anext(subscriber)
+        seeded.add(EnergyTrack(site_id=_site(seeded), source_id=sources["solar"], type_id=types["generation"],
+                               start_time=datetime(2024, 5, 3), kwh=Decimal("1.00")))
+        seeded.flush()
+        seeded.rollback()
+        await asyncio.sleep(TICK * 4)
+        assert hub.deltas_sent == 0
+        await subscriber.aclose()
+
+    _run(async_db_engine, scenario)
+
+
+def test_stream_endpoint_pushes_deltas(client, seeded, async_db_engine, monkeypatch):
+    monkeypatch.setattr(stream.hub, "tick", TICK)
+    sources, types = _ids(seeded)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/energy/stream", "raw_path": b"/energy/stream",
+        "query_string": b"energy_type=generation", "headers": [], "root_path": "",
+        "server": ("testserver", 80), "client": ("testclient", 50000),
+    }
+
+    async def run():
+        requested, disconnected = asyncio.Event(), asyncio.Event()
+        started, chunks = {}, asyncio.Queue()
+
+        async def receive():
+            if requested.is_set():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            requested.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.update(status=message["status"], headers=dict(message["headers"]))
+            elif message.get("body"):
+                chunks.put_nowait(message["body"])
+
+        app = asyncio.create_task(client.app(scope, receive, send))
+        assert (await asyncio.wait_for(chunks.get(), 5)).startswith(b"retry:")
+        assert started["status"] == 200
+        assert started["headers"][b"content-type"].startswith(b"text/event-stream")
+
+        _write(seeded, sources["geothermal"], types["generation"], Decimal("7.75"))
+        delta = _parse(await asyncio.wait_for(chunks.get(), 5))
+        assert [c["source"] for c in delta["data"]["cells"]] == ["geothermal"]
+
+        disconnected.set()
+        await asyncio.wait_for(app, 5)
+        assert len(stream.hub) == 0
+        await async_db_engine.dispose()
+
+    asyncio.run(run())
@@ -1,5 +1,5 @@
 // src/pages/Dashboard.tsx
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useMemo } from "react";
 import axios from "../api/axios";
 import Header from "../components/layout/Header";
 import { TrendsChart, TrendsData } from "../components/charts/TrendsChart";
@@ -15,44 +15,42 @@ const VIEW_OPTIONS = [
   { key: "composed", label: "Comparison" },
 ] as const;
 const TYPE_OPTIONS = ["Consumption", "Generation"] as const;
-const HIGHLIGHT_SOURCES = ["Solar", "Tidal", "Grid", "Hydro", "Geothermal"] as const;
 
 type ViewKey = typeof VIEW_OPTIONS[number]["key"];
 type EnergyType = typeof TYPE_OPTIONS[number];
-type Source = typeof HIGHLIGHT_SOURCES[number];
+
+interface DashboardData {
+  trends: TrendsData[];
+  composition: TrendsData[];
+  summary: SummaryData[];
+  composed: ComposedData[];
+}
 
 const Dashboard: React.FC = () => {
   const [view, setView] = useState<ViewKey>("trends");
   const [energyType, setEnergyType] = useState<EnergyType>("Consumption");
-  const [highlight, setHighlight] = useState<Source>("Solar");
+  // A source name as the API returns it, e.g. "solar"
+  const [highlight, setHighlight] = useState("solar");
   const [loading, setLoading] = useState(false);
 
   const [trendsData, setTrendsData] = useState<TrendsData[]>([]);
+  const [compositionData, setCompositionData] = useState<TrendsData[]>([]);
   const [summaryData, setSummaryData] = useState<SummaryData[]>([]);
   const [composedData, setComposedData] = useState<ComposedData[]>([]);
 
-  // Fetch data on filter changes
+  // Fetch every view in one round trip; switching views needs no new request
   useEffect(() => {
     async function fetchData() {
       setLoading(true);
       try {
         const typeParam = energyType.toLowerCase();
-        if (view === "trends" || view === "composition") {
-          const res = await axios.get<TrendsData[]>(
-            `/energy/${view}?energy_type=${typeParam}`
-          );
-          setTrendsData(res.data);
-        } else if (view === "summary") {
-          const res = await axios.get<SummaryData[]>(
-            `/energy/summary?energy_type=${typeParam}`
-          );
-          setSummaryData(res.data);
-        } else {
-          const res = await axios.get<ComposedData[]>(
-            `/energy/composed?energy_type=${typeParam}&highlight=${highlight.toLowerCase()}`
-          );
-          setComposedData(res.data);
-        }
+        const res = await axios.get<DashboardData>(
+          `/energy/dashboard?energy_type=${typeParam}&highlight=${encodeURIComponent(highlight)}`
+        );
+        setTrendsData(res.data.trends);
+        setCompositionData(res.data.composition);
+        setSummaryData(res.data.summary);
+        setComposedData(res.data.composed);
       } catch (err) {
         console.error("Error fetching data", err);
       } finally {
@@ -60,7 +58,20 @@ const Dashboard: React.FC = () => {
       }
     }
     fetchData();
-  }, [view, energyType, highlight]);
+  }, [energyType, highlight]);
+
+  // Highlight options are the sources the data actually has
+  const sources = useMemo(() => {
+    const names = new Set(summaryData.map((d) => d.source));
+    trendsData.forEach((row) => Object.keys(row).forEach((key) => key !== "month" && names.add(key)));
+    return Array.from(names).sort();
+  }, [summaryData, trendsData]);
+
+  useEffect(() => {
+    if (sources.length > 0 && !sources.includes(highlight)) {
+      setHighlight(sources[0]);
+    }
+  }, [sources, highlight]);
 
   return (
     <div className="min-h-screen bg-gray-50">
@@ -115,7 +126,7 @@ const Dashboard: React.FC = () => {
             <div>
               <h3 className="mb-2 text-sm font-medium text-gray-700">Highlight Source</h3>
               <div className="flex flex-wrap gap-2">
-                {HIGHLIGHT_SOURCES.map((src) => (
+                {sources.map((src) => (
                   <button
                     key={src}
                     onClick={() => setHighlight(src)}
@@ -124,7 +135,7 @@ const Dashboard: React.FC = () => {
                         ? 'bg-teal-500 text-white'
                         : 'bg-gray-200 text-gray-700 hover:bg-gray-300'}`}
                   >
-                    {src}
+                    {src.charAt(0).toUpperCase() + src.slice(1)}
                   </button>
                 ))}
               </div>
@@ -141,7 +152,7 @@ const Dashboard: React.FC = () => {
           ) : (
             <div className="space-y-8">
               {view === 'trends' && <TrendsChart data={trendsData} />}
-              {view === 'composition' && <StackedBarChart data={trendsData} />}
+              {view === 'composition' && <StackedBarChart data={compositionData} />}
               {view === 'summary' && <PieChart data={summaryData} />}
               {view === 'composed' && (
                 <ComposedChart data={composedData} highlightLabel={highlight} />